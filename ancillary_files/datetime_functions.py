@@ -51,26 +51,3 @@ def get_settlement_periods_for_each_day_in_date_range(
         settlement_periods_per_day[current_date] = settlement_periods_in_day
     
     return settlement_periods_per_day
-
-def get_settlement_date_period_to_utc_start_time_mapping(
-    years: list[int]
-) -> dict[tuple[str, int], datetime]:
-    mapping = {}
-    
-    for year in years:
-        start_date = f"{year}-01-01"
-        end_date = f"{year}-12-31"
-        year_dates = generate_settlement_dates(start_date, end_date)
-        settlement_periods_per_day = get_settlement_periods_for_each_day_in_date_range(year_dates)
-        
-        for settlement_date, num_periods in settlement_periods_per_day.items():
-            settlement_date_str = settlement_date.strftime('%Y-%m-%d')
-            
-            london_midnight = gb_timezone.localize(settlement_date.replace(hour=0, minute=0, second=0, microsecond=0))
-            
-            for period in range(1, num_periods + 1):
-                london_start_time = london_midnight + timedelta(minutes=30 * (period - 1)) 
-                utc_start_time = london_start_time.astimezone(pytz.UTC)
-                mapping[(settlement_date_str, period)] = utc_start_time
-    
-    return mapping
\ No newline at end of file
@@ -5,6 +5,9 @@ import datetime
 
 import pandas as pd
 
+# Imported as a module because data_processing.missing_data itself imports from this package
+import data_processing.missing_data as missing_data_module
+
 def get_excel_filepaths(
     folder: str
 ) -> list[str]:
@@ -96,15 +99,13 @@ def drop_missing_data_rows(
     ordered_df: pd.DataFrame,
     missing_data: set[tuple[str, int]]
 ) -> pd.DataFrame:
-    ordered_df_copy = ordered_df.copy()
-    ordered_df_copy['settlement_date_str'] = ordered_df_copy['settlement_date'].dt.strftime('%Y-%m-%d')
-
-    mask = ~ordered_df_copy.apply(
-        lambda row: (row['settlement_date_str'], row['settlement_period']) in missing_data, 
-        axis=1
-    )
+    if not isinstance(missing_data, missing_data_module.MissingData):
+        missing_data_points = missing_data
+        missing_data = missing_data_module.MissingData()
+        missing_data.update(missing_data_points)
+    mask = ~missing_data.get_missing_mask(ordered_df)
 
-    filtered_df = ordered_df_copy[mask].drop('settlement_date_str', axis=1)
+    filtered_df = ordered_df[mask].copy()
     return filtered_df
 
 def create_dict_from_excel(
@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+
+import ancillary_files.datetime_functions as datetime_functions
+
+# Settlement periods are consecutive UTC half hours, so counting half hours since the Unix epoch gives every
+# GB settlement period a dense int64 index that carries across 46 and 50 period clock-change days
+NANOSECONDS_PER_PERIOD = 30 * 60 * 10**9
+GB_TIMEZONE = datetime_functions.gb_timezone.zone
+
+def get_period_indices(
+    settlement_dates,
+    settlement_periods
+) -> np.ndarray:
+    settlement_periods = np.asarray(settlement_periods, dtype=np.int64)
+    date_codes, unique_dates = pd.factorize(pd.to_datetime(pd.Series(settlement_dates)).dt.normalize(), sort=False)
+    if (date_codes < 0).any():
+        raise ValueError("Settlement dates must not be missing when building period indices")
+    first_period_indices = get_first_period_indices(unique_dates)
+
+    return first_period_indices[date_codes] + settlement_periods - 1
+
+def get_first_period_indices(
+    settlement_dates
+) -> np.ndarray:
+    # UK clocks change at 01:00 UTC, so local midnight is never skipped or repeated
+    london_midnights = pd.DatetimeIndex(settlement_dates).tz_localize(None).normalize().tz_localize(GB_TIMEZONE)
+
+    return london_midnights.tz_convert('UTC').asi8 // NANOSECONDS_PER_PERIOD
+
+def get_settlement_dates_and_periods(
+    period_indices
+) -> tuple[np.ndarray, np.ndarray]:
+    period_indices = np.asarray(period_indices, dtype=np.int64)
+    london_start_times = get_utc_start_times(period_indices).tz_convert(GB_TIMEZONE)
+    settlement_dates = london_start_times.tz_localize(None).normalize()
+    settlement_periods = period_indices - get_first_period_indices(settlement_dates) + 1
+
+    return settlement_dates.strftime('%Y-%m-%d').to_numpy(dtype=object), settlement_periods
+
+def get_utc_start_times(
+    period_indices
+) -> pd.DatetimeIndex:
+    return pd.DatetimeIndex(np.asarray(period_indices, dtype=np.int64) * NANOSECONDS_PER_PERIOD, tz='UTC')
+
+def get_period_indices_from_utc_start_times(
+    utc_start_times
+) -> np.ndarray:
+    utc_start_times = pd.DatetimeIndex(utc_start_times)
+    if utc_start_times.tz is None:
+        utc_start_times = utc_start_times.tz_localize('UTC')
+
+    return utc_start_times.tz_convert('UTC').asi8 // NANOSECONDS_PER_PERIOD
+
+def add_period_index(
+    df: pd.DataFrame,
+    column_name: str = 'period_index'
+) -> pd.DataFrame:
+    df = df.copy()
+    df[column_name] = get_period_indices(df['settlement_date'], df['settlement_period']) if not df.empty else np.array([], dtype=np.int64)
+
+    return df
+
+class SettlementCalendar:
+    """Every settlement period between two dates, in order, with its dense period index."""
+
+    def __init__(
+        self,
+        settlement_dates_with_periods_per_day: dict[str, int]
+    ):
+        self.settlement_dates_with_periods_per_day = settlement_dates_with_periods_per_day
+        periods_per_day = np.fromiter(settlement_dates_with_periods_per_day.values(), dtype=np.int64, count=len(settlement_dates_with_periods_per_day))
+        first_period_indices = get_first_period_indices(list(settlement_dates_with_periods_per_day.keys()))
+        day_starts = np.repeat(np.cumsum(periods_per_day) - periods_per_day, periods_per_day)
+        self.settlement_dates = np.repeat(np.array(list(settlement_dates_with_periods_per_day.keys()), dtype=object), periods_per_day)
+        self.settlement_periods = np.arange(periods_per_day.sum(), dtype=np.int64) - day_starts + 1
+        self.period_indices = np.repeat(first_period_indices, periods_per_day) + self.settlement_periods - 1
+
+    @classmethod
+    def from_date_range(
+        cls,
+        start_date: str,
+        end_date: str
+    ) -> 'SettlementCalendar':
+        return cls(datetime_functions.get_settlement_dates_and_settlement_periods_per_day(start_date, end_date))
+
+    @property
+    def utc_start_times(self) -> pd.DatetimeIndex:
+        return get_utc_start_times(self.period_indices)
+
+    def get_positions(
+        self,
+        period_indices
+    ) -> np.ndarray:
+        # Position of each period in the calendar, or -1 for periods outside it
+        period_indices = np.asarray(period_indices, dtype=np.int64)
+        positions = np.searchsorted(self.period_indices, period_indices)
+        in_calendar = positions < len(self.period_indices)
+        in_calendar[in_calendar] = self.period_indices[positions[in_calendar]] == period_indices[in_calendar]
+
+        return np.where(in_calendar, positions, -1)
+
+    def __len__(self) -> int:
+        return len(self.period_indices)
+
+_settlement_calendars_by_year = {}
+
+def get_settlement_calendar_for_year(
+    year: int
+) -> SettlementCalendar:
+    # Memoised, as a year's calendar never changes and callers ask for the same years once per month
+    year = int(year)
+    if year not in _settlement_calendars_by_year:
+        _settlement_calendars_by_year[year] = SettlementCalendar.from_date_range(f"{year}-01-01", f"{year}-12-31")
+    return _settlement_calendars_by_year[year]
+
+def get_utc_start_times_by_date_and_period(
+    years: list[int]
+) -> pd.Series:
+    settlement_calendars = [get_settlement_calendar_for_year(year) for year in sorted(set(int(year) for year in years))]
+    if not settlement_calendars:
+        return pd.Series(
+            pd.DatetimeIndex([], tz='UTC'), name='start_time',
+            index=pd.MultiIndex.from_arrays([[], []], names=['settlement_date', 'settlement_period']))
+    settlement_dates = np.concatenate([settlement_calendar.settlement_dates for settlement_calendar in settlement_calendars])
+    settlement_periods = np.concatenate([settlement_calendar.settlement_periods for settlement_calendar in settlement_calendars])
+    period_indices = np.concatenate([settlement_calendar.period_indices for settlement_calendar in settlement_calendars])
+
+    return pd.Series(
+        get_utc_start_times(period_indices), name='start_time',
+        index=pd.MultiIndex.from_arrays([settlement_dates, settlement_periods], names=['settlement_date', 'settlement_period']))
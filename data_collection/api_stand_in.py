@@ -0,0 +1,216 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import random
+import time
+
+import aiohttp
+from aiohttp import web
+from elexonpy.configuration import Configuration
+
+import isem_analysis.api_interaction as semo_api_interaction
+from data_collection.elexon_http_client import ELEXON_API_HOST
+
+SEMO_API_HOST = 'https://reports.sem-o.com'
+UPSTREAM_HOSTS = {
+    'elexon': ELEXON_API_HOST,
+    'semo': SEMO_API_HOST
+}
+# elexonpy asks for format=json while the aiohttp client relies on the default, the responses are the same
+IGNORED_QUERY_PARAMETERS = {'format'}
+
+
+class FixtureArchive:
+    """Recorded API responses on disk, one metadata file and one gzipped body per request."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def get_key(
+        self,
+        upstream: str,
+        path: str,
+        query_params
+    ) -> str:
+        query = sorted(
+            (name, value) for name, value in query_params.items() if name not in IGNORED_QUERY_PARAMETERS
+        )
+        request_description = json.dumps([upstream, path, query])
+        return hashlib.sha1(request_description.encode()).hexdigest()
+
+    def read(
+        self,
+        key: str
+    ) -> tuple[dict, bytes] | None:
+        metadata_filepath = os.path.join(self.directory, f'{key}.json')
+        if not os.path.exists(metadata_filepath):
+            return None
+        with open(metadata_filepath) as metadata_file:
+            metadata = json.load(metadata_file)
+        with gzip.open(os.path.join(self.directory, f'{key}.body.gz'), 'rb') as body_file:
+            body = body_file.read()
+        return metadata, body
+
+    def write(
+        self,
+        key: str,
+        metadata: dict,
+        body: bytes
+    ) -> None:
+        # Body first so a metadata file never points at a missing body
+        body_filepath = os.path.join(self.directory, f'{key}.body.gz')
+        with gzip.open(f'{body_filepath}.tmp', 'wb') as body_file:
+            body_file.write(body)
+        os.replace(f'{body_filepath}.tmp', body_filepath)
+        metadata_filepath = os.path.join(self.directory, f'{key}.json')
+        with open(f'{metadata_filepath}.tmp', 'w') as metadata_file:
+            json.dump(metadata, metadata_file)
+        os.replace(f'{metadata_filepath}.tmp', metadata_filepath)
+
+    def __len__(self) -> int:
+        return sum(1 for filename in os.listdir(self.directory) if filename.endswith('.json'))
+
+
+class ApiStandIn:
+    """
+    Local HTTP server standing in for the Elexon and SEMO APIs.
+
+    In 'record' mode requests are forwarded upstream and successful responses are archived.
+    In 'replay' mode archived responses are served with optional latency and injected errors,
+    and requests that were never recorded get a 404.
+    """
+
+    def __init__(
+        self,
+        archive_directory: str,
+        mode: str = 'replay',
+        host: str = '127.0.0.1',
+        port: int = 8080,
+        latency: float = 0.0,
+        latency_jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_statuses: tuple[int, ...] = (503,),
+        seed: int | None = None
+    ):
+        if mode not in ('record', 'replay'):
+            raise ValueError(f"Unknown stand-in mode '{mode}', should be 'record' or 'replay'")
+        self.archive = FixtureArchive(archive_directory)
+        self.mode = mode
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.error_statuses = error_statuses
+        self.random = random.Random(seed)
+        self.served_responses = 0
+        self.recorded_responses = 0
+        self.injected_errors = 0
+        self.missing_responses = 0
+        self._runner = None
+        self._upstream_session = None
+
+    @property
+    def base_url(self) -> str:
+        return f'http://{self.host}:{self.port}'
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        upstream = request.match_info['upstream']
+        path = '/' + request.match_info['path']
+        if upstream not in UPSTREAM_HOSTS:
+            raise web.HTTPNotFound(text=f"Unknown upstream '{upstream}'")
+        key = self.archive.get_key(upstream, path, request.query)
+        if self.mode == 'record':
+            return await self._forward_and_record(upstream, path, request, key)
+
+        delay = self.latency + self.random.uniform(0, self.latency_jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self.error_rate > 0 and self.random.random() < self.error_rate:
+            self.injected_errors += 1
+            return web.Response(status=self.random.choice(self.error_statuses), text='Injected error')
+        recorded_response = await asyncio.to_thread(self.archive.read, key)
+        if recorded_response is None:
+            self.missing_responses += 1
+            print(f"No recorded response for {upstream}{path}?{request.query_string}")
+            raise web.HTTPNotFound(text='No recorded response')
+        metadata, body = recorded_response
+        self.served_responses += 1
+        response = web.Response(status=metadata['status'], body=body, content_type=metadata['content_type'])
+        response.enable_compression()
+        return response
+
+    async def _forward_and_record(
+        self,
+        upstream: str,
+        path: str,
+        request: web.Request,
+        key: str
+    ) -> web.Response:
+        async with self._upstream_session.get(f'{UPSTREAM_HOSTS[upstream]}{path}', params=list(request.query.items())) as upstream_response:
+            body = await upstream_response.read()
+            content_type = upstream_response.content_type
+            status = upstream_response.status
+        if status == 200:
+            metadata = {
+                'upstream': upstream,
+                'path': path,
+                'query': dict(request.query),
+                'status': status,
+                'content_type': content_type,
+                'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+            }
+            await asyncio.to_thread(self.archive.write, key, metadata, body)
+            self.recorded_responses += 1
+        return web.Response(status=status, body=body, content_type=content_type)
+
+    async def start(self) -> None:
+        if self.mode == 'record':
+            self._upstream_session = aiohttp.ClientSession()
+        application = web.Application()
+        application.router.add_get('/{upstream}/{path:.*}', self._handle)
+        self._runner = web.AppRunner(application, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        print(f"API stand-in ({self.mode}) listening on {self.base_url} with archive {self.archive.directory}")
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        if self._upstream_session is not None:
+            await self._upstream_session.close()
+            self._upstream_session = None
+
+    async def __aenter__(self):
+        await self.start()
+        redirect_api_clients(self.base_url)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+        redirect_api_clients(None)
+
+    def get_statistics(self) -> dict[str, int]:
+        return {
+            'served_responses': self.served_responses,
+            'recorded_responses': self.recorded_responses,
+            'injected_errors': self.injected_errors,
+            'missing_responses': self.missing_responses
+        }
+
+
+def redirect_api_clients(
+    base_url: str | None
+) -> None:
+    """Point Elexon and SEMO clients created from now on at base_url, or back at the live APIs if None."""
+    configuration = Configuration()
+    configuration.host = ELEXON_API_HOST if base_url is None else f'{base_url}/elexon'
+    Configuration.set_default(configuration)
+    semo_host = SEMO_API_HOST if base_url is None else f'{base_url}/semo'
+    semo_api_interaction.REPORT_LIST_URL = f'{semo_host}/api/v1/documents/static-reports'
+    semo_api_interaction.STATIC_DOCUMENT_BASE = f'{semo_host}/documents'
+    semo_api_interaction.DYNAMIC_DOCUMENT_BASE = f'{semo_host}/api/v1/documents'
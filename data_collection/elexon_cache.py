@@ -0,0 +1,120 @@
+import datetime
+import os
+import uuid
+
+import pandas as pd
+
+CACHE_DIRECTORY_ENVIRONMENT_VARIABLE = 'ELEXON_CACHE_DIRECTORY'
+DEFAULT_CACHE_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'niv-chasing-analysis', 'elexon')
+WHOLE_DAY_PARTITION = 'all'
+SETTLEMENT_LAG_ENVIRONMENT_VARIABLE = 'ELEXON_CACHE_SETTLEMENT_LAG_DAYS'
+# Elexon keeps publishing and revising a settlement date's data until after the SF run, about 16 working days
+# later, so responses for dates newer than this are always fetched and never cached
+DEFAULT_SETTLEMENT_LAG_DAYS = 28
+
+_cache_directory = os.environ.get(CACHE_DIRECTORY_ENVIRONMENT_VARIABLE, DEFAULT_CACHE_DIRECTORY)
+_settlement_lag_days = int(os.environ.get(SETTLEMENT_LAG_ENVIRONMENT_VARIABLE, DEFAULT_SETTLEMENT_LAG_DAYS))
+
+
+def set_cache_directory(
+    cache_directory: str | None
+) -> None:
+    """Point the cache at a new root directory, or pass None to disable caching."""
+    global _cache_directory
+    _cache_directory = cache_directory
+
+
+def get_cache_directory() -> str | None:
+    return _cache_directory
+
+
+def set_settlement_lag_days(
+    settlement_lag_days: int
+) -> None:
+    global _settlement_lag_days
+    _settlement_lag_days = settlement_lag_days
+
+
+def is_settled(
+    settlement_date: str
+) -> bool:
+    """Whether settlement_date is old enough that its responses are final and can be cached."""
+    return pd.Timestamp(settlement_date).date() <= datetime.date.today() - datetime.timedelta(days=_settlement_lag_days)
+
+
+def get_cache_filepath(
+    endpoint: str,
+    settlement_date: str,
+    settlement_period: int | None = None
+) -> str:
+    period_partition = WHOLE_DAY_PARTITION if settlement_period is None else str(settlement_period)
+    return os.path.join(_cache_directory, endpoint, str(settlement_date), f'{period_partition}.parquet')
+
+
+def read_cached_response(
+    endpoint: str,
+    settlement_date: str,
+    settlement_period: int | None = None
+) -> pd.DataFrame | None:
+    # Entries for recent dates, such as those written under a shorter settlement lag, are not trusted
+    if _cache_directory is None or not is_settled(settlement_date):
+        return None
+    cache_filepath = get_cache_filepath(endpoint, settlement_date, settlement_period)
+    if not os.path.exists(cache_filepath):
+        return None
+    try:
+        return pd.read_parquet(cache_filepath)
+    except Exception as e:
+        print(f"Could not read cached response {cache_filepath}: {e}")
+        return None
+
+
+def write_cached_response(
+    endpoint: str,
+    settlement_date: str,
+    settlement_period: int | None,
+    response_df: pd.DataFrame
+) -> None:
+    # Empty responses are not cached as they usually mean the data has not been published yet
+    if _cache_directory is None or response_df is None or response_df.empty or not is_settled(settlement_date):
+        return
+    cache_filepath = get_cache_filepath(endpoint, settlement_date, settlement_period)
+    os.makedirs(os.path.dirname(cache_filepath), exist_ok=True)
+    temporary_filepath = f'{cache_filepath}.{uuid.uuid4().hex}.tmp'
+    try:
+        response_df.reset_index(drop=True).to_parquet(temporary_filepath, index=False)
+        os.replace(temporary_filepath, cache_filepath)
+    except Exception as e:
+        print(f"Could not cache response for {endpoint} {settlement_date} {settlement_period}: {e}")
+        if os.path.exists(temporary_filepath):
+            os.remove(temporary_filepath)
+
+
+def clear_cache(
+    endpoint: str | None = None,
+    settlement_date: str | None = None
+) -> None:
+    """Remove cached responses for one endpoint, one settlement date, both, or everything when neither is given."""
+    if _cache_directory is None:
+        return
+    endpoint_directories = [endpoint] if endpoint is not None else (os.listdir(_cache_directory) if os.path.isdir(_cache_directory) else [])
+    for endpoint_directory in endpoint_directories:
+        target_directory = os.path.join(_cache_directory, endpoint_directory)
+        if settlement_date is not None:
+            target_directory = os.path.join(target_directory, str(settlement_date))
+        remove_cached_files(target_directory)
+
+
+def remove_cached_files(
+    target_directory: str
+) -> None:
+    for directory, _, filenames in os.walk(target_directory, topdown=False):
+        for filename in filenames:
+            if filename.endswith('.parquet'):
+                os.remove(os.path.join(directory, filename))
+        if not os.listdir(directory):
+            os.rmdir(directory)
+    # Parent directories left empty by a per-date clear are removed too
+    parent_directory = os.path.dirname(target_directory)
+    if parent_directory != _cache_directory and os.path.isdir(parent_directory) and not os.listdir(parent_directory):
+        os.rmdir(parent_directory)
@@ -0,0 +1,176 @@
+import asyncio
+
+import aiohttp
+import pandas as pd
+
+import elexonpy.models as elexon_models
+from elexonpy.configuration import Configuration
+
+ELEXON_API_HOST = 'https://data.elexon.co.uk/bmrs/api/v1'
+
+# elexonpy function name -> (path template, positional argument names, response item model)
+ELEXON_ENDPOINTS = {
+    'balancing_settlement_system_prices_settlement_date_get': (
+        '/balancing/settlement/system-prices/{settlement_date}',
+        ['settlement_date'],
+        'InsightsApiModelsResponsesBalancingSettlementSystemPriceResponse'
+    ),
+    'balancing_settlement_stack_all_bid_offer_settlement_date_settlement_period_get': (
+        '/balancing/settlement/stack/all/{bid_offer}/{settlement_date}/{settlement_period}',
+        ['bid_offer', 'settlement_date', 'settlement_period'],
+        'InsightsApiModelsResponsesBalancingSettlementSettlementStackResponse'
+    ),
+    'balancing_bid_offer_all_get': (
+        '/balancing/bid-offer/all',
+        ['settlement_date', 'settlement_period'],
+        'InsightsApiModelsResponsesBalancingBidOfferResponse'
+    ),
+    'balancing_physical_all_get': (
+        '/balancing/physical/all',
+        ['dataset', 'settlement_date', 'settlement_period'],
+        'InsightsApiModelsResponsesBalancingPhysicalPhysicalData'
+    ),
+    'balancing_pricing_market_index_get': (
+        '/balancing/pricing/market-index',
+        ['_from', 'to'],
+        'InsightsApiModelsResponsesBalancingMarketIndexResponse'
+    ),
+    'balancing_nonbm_netbsad_get': (
+        '/balancing/nonbm/netbsad',
+        ['_from', 'to'],
+        'InsightsApiModelsResponsesBalancingNetBalancingServicesAdjustmentResponse'
+    ),
+    'balancing_acceptances_all_get': (
+        '/balancing/acceptances/all',
+        ['settlement_date', 'settlement_period'],
+        'InsightsApiModelsResponsesBalancingBidOfferAcceptancesResponse'
+    ),
+    'datasets_pn_stream_get': (
+        '/datasets/PN/stream',
+        ['_from', 'to'],
+        'InsightsApiModelsResponsesBalancingPhysicalDatasetRowsPhysicalNotificationData'
+    ),
+    'datasets_mels_stream_get': (
+        '/datasets/MELS/stream',
+        ['_from', 'to'],
+        'InsightsApiModelsResponsesBalancingPhysicalDatasetRowsDeliveryLimitMaxData'
+    ),
+    'datasets_mils_stream_get': (
+        '/datasets/MILS/stream',
+        ['_from', 'to'],
+        'InsightsApiModelsResponsesBalancingPhysicalDatasetRowsDeliveryLimitMaxData'
+    ),
+    'datasets_bod_stream_get': (
+        '/datasets/BOD/stream',
+        ['_from', 'to'],
+        'InsightsApiModelsResponsesBalancingDatasetRowsBidOfferDatasetResponse'
+    ),
+}
+
+
+def _to_camel_case(
+    parameter_name: str
+) -> str:
+    first_word, *other_words = parameter_name.lstrip('_').split('_')
+    return first_word + ''.join(word.capitalize() for word in other_words)
+
+
+def records_to_dataframe(
+    records: list[dict],
+    model_name: str
+) -> pd.DataFrame:
+    if not records:
+        return pd.DataFrame()
+    model = getattr(elexon_models, model_name)
+    columns = {}
+    for column_name, json_key in model.attribute_map.items():
+        values = [record.get(json_key) for record in records]
+        column_type = model.swagger_types[column_name]
+        if column_type == 'datetime':
+            columns[column_name] = pd.to_datetime(pd.Series(values, dtype=object), utc=True, format='ISO8601')
+        elif column_type == 'date':
+            columns[column_name] = pd.to_datetime(pd.Series(values, dtype=object), format='ISO8601').dt.date
+        else:
+            columns[column_name] = pd.Series(values)
+
+    return pd.DataFrame(columns)
+
+
+class ElexonHttpClient:
+    """Async Elexon Insights client on one pooled aiohttp session, used in place of elexonpy's ApiClient."""
+
+    def __init__(
+        self,
+        host: str | None = None,
+        connection_limit: int = 64,
+        keepalive_timeout: float = 60,
+        request_timeout: float = 120
+    ):
+        # Follow elexonpy's default configuration so both transports can be redirected in one place
+        self.host = (host or Configuration().host).rstrip('/')
+        self.connection_limit = connection_limit
+        self.keepalive_timeout = keepalive_timeout
+        self.request_timeout = request_timeout
+        self._session = None
+        self._loop = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit=self.connection_limit,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=300
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers={'Accept': 'application/json', 'Accept-Encoding': 'gzip, deflate'},
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout)
+            )
+            self._loop = loop
+        return self._session
+
+    async def get_json(
+        self,
+        path: str,
+        query_params: dict | None = None
+    ) -> dict:
+        session = self._get_session()
+        async with session.get(f'{self.host}{path}', params=query_params) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+    async def get_dataframe(
+        self,
+        function_name: str,
+        *args,
+        **kwargs
+    ) -> pd.DataFrame:
+        path_template, positional_argument_names, model_name = ELEXON_ENDPOINTS[function_name]
+        parameters = dict(zip(positional_argument_names, args))
+        parameters.update(kwargs)
+        parameters.pop('format', None)
+        parameters.pop('async_req', None)
+        path_parameters = {
+            name: value for name, value in parameters.items() if '{' + name + '}' in path_template
+        }
+        query_params = {
+            _to_camel_case(name): str(value) for name, value in parameters.items()
+            if name not in path_parameters and value is not None
+        }
+        response_json = await self.get_json(path_template.format(**path_parameters), query_params)
+        # Stream endpoints return a bare list rather than a {'data': [...]} envelope
+        records = response_json if isinstance(response_json, list) else response_json.get('data', [])
+
+        return records_to_dataframe(records, model_name)
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
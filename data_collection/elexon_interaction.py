@@ -11,10 +11,44 @@ from elexonpy.api.market_index_api import MarketIndexApi
 from elexonpy.api.balancing_services_adjustment___net_api import BalancingServicesAdjustmentNetApi
 from elexonpy.api.bid_offer_acceptances_api import BidOfferAcceptancesApi
 from elexonpy.api.reference_api import ReferenceApi
-from elexonpy.rest import ApiException
+from elexonpy.api.datasets_api import DatasetsApi
+from data_collection import elexon_cache
+from data_collection.elexon_http_client import ElexonHttpClient
+from data_collection.request_scheduler import RequestScheduler
+import data_processing.bm_physical_data_handler as bm_physical_data_handler
+from data_processing.missing_data import MissingData
+from data_processing.period_indexed_data import PeriodIndexedData
 
-from data_processing.bm_physical_data_handler import get_physical_volume
+# Datasets whose stream rows carry one entry per notification rather than one per interval
+NOTIFIED_PHYSICAL_DATASETS = ['MELS', 'MILS']
 
+request_scheduler = RequestScheduler()
+
+def configure_request_scheduler(
+    **scheduler_kwargs
+) -> RequestScheduler:
+    global request_scheduler
+    request_scheduler = RequestScheduler(**scheduler_kwargs)
+    
+    return request_scheduler
+
+def get_request_statistics() -> dict[str, float]:
+    return request_scheduler.get_statistics()
+
+def create_api_client(
+    transport: str = 'elexonpy'
+) -> ApiClient | ElexonHttpClient:
+    if transport == 'elexonpy':
+        return ApiClient()
+    if transport == 'aiohttp':
+        return ElexonHttpClient()
+    raise ValueError(f"Unknown Elexon transport '{transport}', should be 'elexonpy' or 'aiohttp'")
+
+async def close_api_client(
+    api_client: ApiClient | ElexonHttpClient
+) -> None:
+    if isinstance(api_client, ElexonHttpClient):
+        await api_client.close()
 
 def _concat_valid_dataframes(dataframes: list[pd.DataFrame], ignore_index: bool = True) -> pd.DataFrame:
     cleaned_dataframes = []
@@ -37,16 +71,69 @@ def _concat_valid_dataframes(dataframes: list[pd.DataFrame], ignore_index: bool
         )
         return pd.concat(cleaned_dataframes, ignore_index=ignore_index)
 
+def _get_endpoint_name(
+    api_function,
+    *discriminators: str
+) -> str:
+    return '_'.join([api_function.__name__, *[str(discriminator) for discriminator in discriminators]])
+
+def _build_request(
+    api_function,
+    *args,
+    **kwargs
+):
+    api_client = api_function.__self__.api_client
+    if isinstance(api_client, ElexonHttpClient):
+        async def request() -> pd.DataFrame:
+            return await api_client.get_dataframe(api_function.__name__, *args, **kwargs)
+    else:
+        async def request() -> pd.DataFrame:
+            task = api_function(*args, format='dataframe', async_req=True, **kwargs)
+            return await asyncio.to_thread(task.get)
+    
+    return request
+
+def _build_stream_request(
+    api_function,
+    *args,
+    **kwargs
+):
+    # elexonpy's stream endpoints return a bare list of models and do not accept format='dataframe'
+    api_client = api_function.__self__.api_client
+    if isinstance(api_client, ElexonHttpClient):
+        return _build_request(api_function, *args, **kwargs)
+    async def request() -> pd.DataFrame:
+        task = api_function(*args, async_req=True, **kwargs)
+        records = await asyncio.to_thread(task.get)
+        return pd.DataFrame([record.to_dict() for record in records])
+    
+    return request
+
+async def _get_dataframe(
+    endpoint: str,
+    settlement_date: str,
+    settlement_period: int | None,
+    request
+) -> pd.DataFrame:
+    cached_response = await asyncio.to_thread(elexon_cache.read_cached_response, endpoint, settlement_date, settlement_period)
+    if cached_response is not None:
+        return cached_response
+    response_df = await request_scheduler.run(endpoint, request)
+    await asyncio.to_thread(elexon_cache.write_cached_response, endpoint, settlement_date, settlement_period, response_df)
+    
+    return response_df
+
 async def fetch_data_by_settlement_date(
     settlement_dates: list[str], 
     api_function, 
     column_headers_to_keep: list[str] = None
 ) -> list[pd.DataFrame]:
     data_dfs = []
-    tasks = [api_function(date, format = 'dataframe', async_req=True) 
+    endpoint = _get_endpoint_name(api_function)
+    tasks = [_get_dataframe(endpoint, date, None, _build_request(api_function, date))
              for date in settlement_dates]
     
-    results = await asyncio.gather(*[asyncio.to_thread(task.get) for task in tasks])
+    results = await asyncio.gather(*tasks)
 
     for df in results:
         data = df.copy()
@@ -64,12 +151,14 @@ async def fetch_data_from_and_to_date(
     column_headers: list[str] = None
 ) -> list[pd.DataFrame]:
     data_dfs = []
+    endpoint = _get_endpoint_name(api_function)
     tasks = [
-        api_function(settlement_date, settlement_date, settlement_period_from = 1, settlement_period_to = settlement_periods_in_day, format='dataframe', async_req=True)
+        _get_dataframe(endpoint, settlement_date, None, _build_request(
+            api_function, settlement_date, settlement_date, settlement_period_from = 1, settlement_period_to = settlement_periods_in_day))
         for settlement_date, settlement_periods_in_day in settlement_dates_with_periods_per_day.items()
     ]
     
-    results = await asyncio.gather(*[asyncio.to_thread(task.get) for task in tasks])
+    results = await asyncio.gather(*tasks)
 
     for df in results:
         data = df.copy()
@@ -99,7 +188,7 @@ async def get_niv_data(
 async def get_full_settlement_stacks_by_date_and_period(
     api_client: ApiClient, 
     settlement_dates_with_periods_per_day: dict[str, int],
-    missing_data: set[tuple[str, int]]
+    missing_data: MissingData
 ) -> dict[tuple[str, int], pd.DataFrame]:
     full_settlement_stacks_by_date_and_period = {}
     tasks = [get_full_ascending_settlement_stack_one_period(api_client, settlement_date, settlement_period, missing_data) 
@@ -114,16 +203,14 @@ async def get_full_ascending_settlement_stack_one_period(
     api_client: ApiClient, 
     settlement_date: str, 
     settlement_period: int,
-    missing_data: set[tuple[str, int]]
+    missing_data: MissingData
 ) -> tuple[tuple[str, int], pd.DataFrame]:
     imbalance_settlement_api = IndicativeImbalanceSettlementApi(api_client)
     tasks = [
-        imbalance_settlement_api.balancing_settlement_stack_all_bid_offer_settlement_date_settlement_period_get(
-            'offer', settlement_date, settlement_period, format='dataframe', async_req=True), 
-        imbalance_settlement_api.balancing_settlement_stack_all_bid_offer_settlement_date_settlement_period_get(
-            'bid', settlement_date, settlement_period, format='dataframe', async_req=True)
+        _get_settlement_stack_one_period(imbalance_settlement_api, 'offer', settlement_date, settlement_period),
+        _get_settlement_stack_one_period(imbalance_settlement_api, 'bid', settlement_date, settlement_period)
         ]
-    results = await asyncio.gather(*[asyncio.to_thread(task.get) for task in tasks])
+    results = await asyncio.gather(*tasks)
     offer_settlement_stack, bid_settlement_stack = results
     
     non_empty_stacks = [df for df in [offer_settlement_stack, bid_settlement_stack] if not df.empty]
@@ -132,7 +219,7 @@ async def get_full_ascending_settlement_stack_one_period(
         full_settlement_stack_one_period = _concat_valid_dataframes(non_empty_stacks, ignore_index=True)
         if full_settlement_stack_one_period.empty:
             full_ordered_settlement_stack_one_period = pd.DataFrame()
-            missing_data.add((settlement_date, settlement_period))
+            missing_data.mark(settlement_date, settlement_period, MissingData.STACK)
             return ((settlement_date, settlement_period), full_ordered_settlement_stack_one_period)
         full_ordered_settlement_stack_one_period = full_settlement_stack_one_period.sort_values(
             by=['original_price', 'bid_offer_pair_id'],
@@ -141,22 +228,37 @@ async def get_full_ascending_settlement_stack_one_period(
         full_ordered_settlement_stack_one_period.reset_index(drop=True, inplace=True)
     else:
         full_ordered_settlement_stack_one_period = pd.DataFrame()
-        missing_data.add((settlement_date, settlement_period))
+        missing_data.mark(settlement_date, settlement_period, MissingData.STACK)
     
     return ((settlement_date, settlement_period), full_ordered_settlement_stack_one_period)
 
+async def _get_settlement_stack_one_period(
+    imbalance_settlement_api: IndicativeImbalanceSettlementApi,
+    bid_offer: str,
+    settlement_date: str,
+    settlement_period: int
+) -> pd.DataFrame:
+    api_function = imbalance_settlement_api.balancing_settlement_stack_all_bid_offer_settlement_date_settlement_period_get
+    settlement_stack = await _get_dataframe(
+        _get_endpoint_name(api_function, bid_offer),
+        settlement_date,
+        settlement_period,
+        _build_request(api_function, bid_offer, settlement_date, settlement_period)
+    )
+    
+    return settlement_stack
+
 async def get_accepted_offers_by_date_and_period(
     api_client: ApiClient,
     settlement_dates_with_periods_per_day: dict[str, int]
 ) -> list[pd.DataFrame]:
     imbalance_settlement_api = IndicativeImbalanceSettlementApi(api_client)
     tasks = [
-        imbalance_settlement_api.balancing_settlement_stack_all_bid_offer_settlement_date_settlement_period_get(
-            'offer', settlement_date, settlement_period, format='dataframe', async_req=True)
+        _get_settlement_stack_one_period(imbalance_settlement_api, 'offer', settlement_date, settlement_period)
         for settlement_date, settlement_periods_in_day in settlement_dates_with_periods_per_day.items()
         for settlement_period in range(1, settlement_periods_in_day + 1)
     ]
-    results = await asyncio.gather(*[asyncio.to_thread(task.get) for task in tasks])
+    results = await asyncio.gather(*tasks)
     accepted_offers_by_date_and_period = []
     for df in results:
         if not df.empty:
@@ -175,44 +277,86 @@ async def get_bid_offer_pairs_data_one_period(
     settlement_period: int
 ) -> pd.DataFrame:
     bid_offer_api = BidOfferApi(api_client)
-    task = bid_offer_api.balancing_bid_offer_all_get(settlement_date, settlement_period, format='dataframe', async_req=True)
-    bid_offer_data_one_period = await retry_api_call(task)
+    api_function = bid_offer_api.balancing_bid_offer_all_get
+    bid_offer_data_one_period = await _get_dataframe(
+        _get_endpoint_name(api_function),
+        settlement_date,
+        settlement_period,
+        _build_request(api_function, settlement_date, settlement_period)
+    )
     if bid_offer_data_one_period.empty:
         return pd.DataFrame()
     bid_offer_useful_data_one_period = bid_offer_data_one_period[['bm_unit', 'level_from', 'bid', 'offer', 'pair_id']]
     
     return bid_offer_useful_data_one_period
 
+async def get_bid_offer_and_physical_data(
+    api_client: ApiClient,
+    settlement_dates: list[str]
+) -> dict[str, PeriodIndexedData]:
+    datasets_api = DatasetsApi(api_client)
+    api_functions = {
+        'BOD': datasets_api.datasets_bod_stream_get,
+        'PN': datasets_api.datasets_pn_stream_get,
+        'MELS': datasets_api.datasets_mels_stream_get,
+        'MILS': datasets_api.datasets_mils_stream_get
+    }
+    tasks = [
+        _get_dataframe(
+            _get_endpoint_name(api_function),
+            settlement_date,
+            None,
+            _build_stream_request(api_function, settlement_date, settlement_date, settlement_period_from=1, settlement_period_to=50)
+        )
+        for api_function in api_functions.values()
+        for settlement_date in settlement_dates
+    ]
+    results = await asyncio.gather(*tasks)
+    data_by_dataset = {}
+    for dataset_index, dataset in enumerate(api_functions):
+        day_dfs = results[dataset_index * len(settlement_dates):(dataset_index + 1) * len(settlement_dates)]
+        dataset_df = _concat_valid_dataframes(day_dfs)
+        if dataset in NOTIFIED_PHYSICAL_DATASETS:
+            dataset_df = _keep_latest_notifications(dataset_df)
+        data_by_dataset[dataset] = PeriodIndexedData(dataset_df)
+    
+    return data_by_dataset
+
+def _keep_latest_notifications(
+    physical_data: pd.DataFrame
+) -> pd.DataFrame:
+    # A limit re-declared for the same interval appears once per notification in the stream,
+    # where /balancing/physical/all gave only the valid level, so the latest notification wins
+    if physical_data.empty or 'notification_time' not in physical_data.columns:
+        return physical_data
+    notification_columns = ['notification_time', 'notification_sequence'] if 'notification_sequence' in physical_data.columns else ['notification_time']
+    physical_data = physical_data.sort_values(notification_columns, kind='stable', na_position='first')
+    physical_data = physical_data.drop_duplicates(['bm_unit', 'time_from', 'time_to'], keep='last')
+
+    return physical_data.sort_index()
+
 async def get_physical_volumes_by_bmu(
     api_client: ApiClient, 
     settlement_date: str, 
     settlement_period: int, 
-    bmus: list[str]):
+    bmus: list[str]
+) -> pd.DataFrame:
     balancing_mechanism_physical_api = BalancingMechanismPhysicalApi(api_client)
-    tasks = [balancing_mechanism_physical_api.balancing_physical_all_get(
-        'PN', settlement_date, settlement_period, format='dataframe', async_req=True),
-             balancing_mechanism_physical_api.balancing_physical_all_get(
-        'MELS', settlement_date, settlement_period, format='dataframe', async_req=True),
-                balancing_mechanism_physical_api.balancing_physical_all_get(
-        'MILS', settlement_date, settlement_period, format='dataframe', async_req=True)]
-    results = await asyncio.gather(*[retry_api_call(task) for task in tasks])
-    full_PN_data_one_period, full_MELS_data_one_period, full_MILS_data_one_period = results
-    if full_PN_data_one_period.empty or full_MELS_data_one_period.empty or full_MILS_data_one_period.empty:
-        return {}
-    physical_volumes_by_bmu = {}
-    for bmu in bmus:
-        PN_data = full_PN_data_one_period[full_PN_data_one_period['bm_unit'] == bmu]
-        MELS_data = full_MELS_data_one_period[full_MELS_data_one_period['bm_unit'] == bmu]
-        MILS_data = full_MILS_data_one_period[full_MILS_data_one_period['bm_unit'] == bmu]
-        
-        scheduled_energy_delivery = get_physical_volume(PN_data)
-        max_energy_delivery = get_physical_volume(MELS_data)
-        max_energy_import = get_physical_volume(MILS_data)
-        physical_volumes_by_bmu[bmu] = pd.Series({
-            'PN': scheduled_energy_delivery,
-            'MELS': max_energy_delivery,
-            'MILS': max_energy_import
-        })
+    api_function = balancing_mechanism_physical_api.balancing_physical_all_get
+    tasks = [
+        _get_dataframe(
+            _get_endpoint_name(api_function, dataset),
+            settlement_date,
+            settlement_period,
+            _build_request(api_function, dataset, settlement_date, settlement_period)
+        )
+        for dataset in bm_physical_data_handler.PHYSICAL_DATASETS
+    ]
+    results = await asyncio.gather(*tasks)
+    if any(physical_data.empty for physical_data in results):
+        return pd.DataFrame()
+    physical_data_by_dataset = dict(zip(bm_physical_data_handler.PHYSICAL_DATASETS, results))
+    physical_volumes_by_bmu = bm_physical_data_handler.get_physical_volumes_by_bmu(physical_data_by_dataset, bmus)
         
     return physical_volumes_by_bmu
 
@@ -245,29 +389,19 @@ async def get_bid_offer_acceptance_data(
     api_client: ApiClient
 ) -> dict[tuple[str, int], pd.DataFrame]:
     bid_offer_accpetance_api = BidOfferAcceptancesApi(api_client)
+    api_function = bid_offer_accpetance_api.balancing_acceptances_all_get
     tasks = [
-        bid_offer_accpetance_api.balancing_acceptances_all_get(
-            settlement_date, settlement_period, format='dataframe', async_req=True
+        _get_dataframe(
+            _get_endpoint_name(api_function),
+            settlement_date,
+            settlement_period,
+            _build_request(api_function, settlement_date, settlement_period)
         )
         for settlement_period in range(1, settlement_periods_in_day + 1)
     ]
-    results = await asyncio.gather(*[asyncio.to_thread(task.get) for task in tasks])
+    results = await asyncio.gather(*tasks)
     bid_offer_acceptances_by_date_and_period = {
         (settlement_date, settlement_period): df for settlement_period, df in enumerate(results, start=1)
     }
     
     return bid_offer_acceptances_by_date_and_period
-    
-
-async def retry_api_call(task, max_retries=3, backoff=2):
-    for attempt in range(1, max_retries + 1):
-        try:
-            return await asyncio.to_thread(task.get)
-        except ApiException as e:
-            if attempt == max_retries:
-                raise e
-            else:
-                sleep_time = backoff ** attempt
-                print(f"API call failed. Retrying in {sleep_time} seconds.")
-                await asyncio.sleep(sleep_time)
-                
\ No newline at end of file
@@ -0,0 +1,319 @@
+import json
+import os
+import re
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+import ancillary_files.excel_interaction as excel_interaction
+
+STORE_DIRECTORY_ENVIRONMENT_VARIABLE = 'MR1B_STORE_DIRECTORY'
+DEFAULT_STORE_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'niv-chasing-analysis', 'mr1b')
+SOURCE_PARTITION_PREFIX = 'source='
+MONTH_PARTITION_PREFIX = 'year_month='
+MONTH_PARTITION_FILENAME = 'part-0.parquet'
+SOURCE_MANIFEST_FILENAME = '_ingested_sources.json'
+ROW_GROUP_SIZE = 100_000
+# Monthly workbooks and the bulk CSV carry different columns, so each is stored under its own partitions
+WORKBOOK_SOURCE = 'workbook'
+CSV_SOURCE = 'csv'
+SOURCE_KINDS = [WORKBOOK_SOURCE, CSV_SOURCE]
+
+# MR1B exports spell their headers differently ('Party ID' in the monthly workbooks, 'PartyID' in the bulk CSV),
+# so columns are matched on their lowercase alphanumeric characters and stored under the workbook spelling
+CANONICAL_COLUMN_NAMES = {
+    'settlementdate': 'Settlement Date',
+    'settlementperiod': 'Settlement Period',
+    'partyid': 'Party ID',
+    'energyimbalancevol': 'Energy Imbalance Vol',
+    'creditedenergyvol': 'Credited Energy Vol',
+    'imbalancecharge': 'Imbalance Charge'
+}
+REQUIRED_COLUMNS = ['Settlement Date', 'Settlement Period', 'Party ID']
+FLOAT_COLUMNS = ['Energy Imbalance Vol', 'Credited Energy Vol', 'Imbalance Charge']
+# Set in DataFrame.attrs on every frame this module returns, so consumers can skip their own cleaning
+NORMALISED_ATTRIBUTE = 'mr1b_normalised'
+IMBALANCE_COLUMNS = ['Settlement Date', 'Settlement Period', 'Party ID', 'Energy Imbalance Vol', 'Credited Energy Vol', 'Imbalance Charge']
+
+_store_directory = os.environ.get(STORE_DIRECTORY_ENVIRONMENT_VARIABLE, DEFAULT_STORE_DIRECTORY)
+
+def set_store_directory(
+    store_directory: str
+) -> None:
+    global _store_directory
+    _store_directory = store_directory
+
+def get_store_directory() -> str:
+    return _store_directory
+
+def get_source_directory(
+    source_kind: str
+) -> str:
+    if source_kind not in SOURCE_KINDS:
+        raise ValueError(f"Unknown MR1B source kind '{source_kind}'. Options: {SOURCE_KINDS}")
+    return os.path.join(_store_directory, f'{SOURCE_PARTITION_PREFIX}{source_kind}')
+
+def get_partition_filepath(
+    year_month: str,
+    source_kind: str
+) -> str:
+    return os.path.join(get_source_directory(source_kind), f'{MONTH_PARTITION_PREFIX}{year_month}', MONTH_PARTITION_FILENAME)
+
+def get_stored_year_months(
+    source_kinds: list[str] = SOURCE_KINDS
+) -> list[str]:
+    year_months = set()
+    for source_kind in source_kinds:
+        source_directory = get_source_directory(source_kind)
+        if not os.path.isdir(source_directory):
+            continue
+        year_months.update(
+            directory_name[len(MONTH_PARTITION_PREFIX):] for directory_name in os.listdir(source_directory)
+            if directory_name.startswith(MONTH_PARTITION_PREFIX) and os.path.exists(get_partition_filepath(directory_name[len(MONTH_PARTITION_PREFIX):], source_kind))
+        )
+    return sorted(year_months)
+
+def ingest_mr1b_directory(
+    mr1b_file_directory: str
+) -> None:
+    filepath_dict = excel_interaction.create_filepath_dict(excel_interaction.get_excel_filepaths(mr1b_file_directory))
+    for i, (year_month, mr1b_filepath) in enumerate(sorted(filepath_dict.items())):
+        ingest_mr1b_workbook(mr1b_filepath, year_month)
+        print(f"Ingested MR1B workbook {i+1} of {len(filepath_dict)}")
+
+def ingest_mr1b_workbook(
+    mr1b_filepath: str,
+    year_month: str | None = None
+) -> None:
+    # Every row of a monthly workbook lands in that month's partition, so reading the month back returns the workbook
+    if is_source_ingested(mr1b_filepath, WORKBOOK_SOURCE):
+        return
+    if year_month is None:
+        year_month = get_year_month_from_filepath(mr1b_filepath)
+    mr1b_df = normalise_mr1b_data(pd.read_excel(mr1b_filepath))
+    write_partition(year_month, mr1b_df, WORKBOOK_SOURCE)
+    record_ingested_source(mr1b_filepath, WORKBOOK_SOURCE, [year_month])
+
+def ingest_mr1b_csv(
+    mr1b_filepath: str,
+    chunksize: int = 250_000
+) -> None:
+    # The bulk CSV spans many months, so its rows are partitioned by their own settlement date
+    if is_source_ingested(mr1b_filepath, CSV_SOURCE):
+        return
+    chunks_by_year_month = {}
+    for chunk in pd.read_csv(mr1b_filepath, chunksize=chunksize, low_memory=False):
+        chunk = normalise_mr1b_data(chunk)
+        for year_month, chunk_for_month in chunk.groupby(chunk['Settlement Date'].dt.strftime('%Y_%m'), sort=False):
+            chunks_by_year_month.setdefault(year_month, []).append(chunk_for_month)
+    if not chunks_by_year_month:
+        raise ValueError(f"No MR1B data could be read from {mr1b_filepath}")
+    for year_month, chunks in chunks_by_year_month.items():
+        write_partition(year_month, pd.concat(chunks, ignore_index=True), CSV_SOURCE)
+    record_ingested_source(mr1b_filepath, CSV_SOURCE, list(chunks_by_year_month))
+    print(f"Ingested {len(chunks_by_year_month)} months of MR1B data from {mr1b_filepath}")
+
+def get_year_month_from_filepath(
+    mr1b_filepath: str
+) -> str:
+    match = re.search(r'MR1B_(\d{4}_\d{2})\.xlsx$', os.path.basename(mr1b_filepath), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Cannot tell which month {mr1b_filepath} covers; pass year_month explicitly")
+    return match.group(1)
+
+def normalise_mr1b_data(
+    mr1b_df: pd.DataFrame
+) -> pd.DataFrame:
+    """Canonical, stripped and typed MR1B rows. Frames that are already normalised are returned unchanged."""
+    if is_normalised_mr1b(mr1b_df):
+        return mr1b_df
+    mr1b_df = mr1b_df.rename(columns={
+        column_name: CANONICAL_COLUMN_NAMES[normalise_column_name(column_name)] for column_name in mr1b_df.columns
+        if normalise_column_name(column_name) in CANONICAL_COLUMN_NAMES
+    })
+    missing_columns = [column_name for column_name in REQUIRED_COLUMNS if column_name not in mr1b_df.columns]
+    if missing_columns:
+        raise ValueError(f"MR1B data is missing {missing_columns}. Available columns: {list(mr1b_df.columns)}")
+
+    for column_name in mr1b_df.columns[mr1b_df.dtypes == object]:
+        mr1b_df[column_name] = strip_strings(mr1b_df[column_name])
+    mr1b_df['Settlement Date'] = pd.to_datetime(mr1b_df['Settlement Date'], errors='coerce')
+    mr1b_df['Settlement Period'] = pd.to_numeric(mr1b_df['Settlement Period'], errors='coerce')
+    # Rows without a settlement date or period fall out of every groupby downstream, so they are not stored
+    mr1b_df = mr1b_df.dropna(subset=['Settlement Date', 'Settlement Period'])
+    mr1b_df['Settlement Period'] = mr1b_df['Settlement Period'].astype('int64')
+    for column_name in FLOAT_COLUMNS:
+        if column_name in mr1b_df.columns:
+            mr1b_df[column_name] = pd.to_numeric(mr1b_df[column_name], errors='coerce').astype('float64')
+    for column_name in mr1b_df.columns[mr1b_df.dtypes == object]:
+        if column_name != 'Party ID':
+            mr1b_df[column_name] = to_typed_column(mr1b_df[column_name])
+    mr1b_df['Party ID'] = mr1b_df['Party ID'].where(mr1b_df['Party ID'].isna(), mr1b_df['Party ID'].astype(str)).astype('category')
+    mr1b_df = mr1b_df.reset_index(drop=True)
+    mr1b_df.attrs[NORMALISED_ATTRIBUTE] = True
+
+    return mr1b_df
+
+def is_normalised_mr1b(
+    mr1b_df: pd.DataFrame
+) -> bool:
+    return bool(mr1b_df.attrs.get(NORMALISED_ATTRIBUTE, False))
+
+def normalise_column_name(
+    column_name
+) -> str:
+    return ''.join(character for character in str(column_name).lower() if character.isalnum())
+
+def strip_strings(
+    column: pd.Series
+) -> pd.Series:
+    # Each distinct value is stripped once, which on columns like Party ID is a few hundred strings rather than millions of cells
+    codes, unique_values = pd.factorize(column)
+    unique_values = pd.Series(np.asarray(unique_values, dtype=object))
+    if pd.api.types.infer_dtype(unique_values, skipna=True) not in ('string', 'mixed', 'mixed-integer', 'mixed-integer-float'):
+        return column
+    # .str.strip gives NaN for values that are not strings, which are put back as they were
+    stripped_values = unique_values.str.strip()
+    stripped_values = stripped_values.where(stripped_values.notna(), unique_values).to_numpy()
+    return pd.Series(np.where(codes >= 0, stripped_values[codes], column.to_numpy()), index=column.index, dtype=object)
+
+def to_typed_column(
+    column: pd.Series
+) -> pd.Series:
+    numeric_column = pd.to_numeric(column, errors='coerce')
+    if numeric_column.notna().sum() == column.notna().sum():
+        return numeric_column
+    return column.where(column.isna(), column.astype(str))
+
+def write_partition(
+    year_month: str,
+    mr1b_df: pd.DataFrame,
+    source_kind: str
+) -> None:
+    # Sorted by date and period with a stable sort so rows keep their source order within a period,
+    # and the row group statistics let date filters skip most of a month
+    mr1b_df = mr1b_df.sort_values(['Settlement Date', 'Settlement Period'], kind='stable')
+    partition_filepath = get_partition_filepath(year_month, source_kind)
+    os.makedirs(os.path.dirname(partition_filepath), exist_ok=True)
+    temporary_filepath = f'{partition_filepath}.{uuid.uuid4().hex}.tmp'
+    try:
+        mr1b_df.to_parquet(temporary_filepath, index=False, row_group_size=ROW_GROUP_SIZE)
+        os.replace(temporary_filepath, partition_filepath)
+    finally:
+        if os.path.exists(temporary_filepath):
+            os.remove(temporary_filepath)
+
+def read_source_manifest(
+    source_kind: str
+) -> dict[str, dict]:
+    """The sources ingested under source_kind with their modification times, and which source last wrote each month."""
+    manifest_filepath = os.path.join(get_source_directory(source_kind), SOURCE_MANIFEST_FILENAME)
+    if not os.path.exists(manifest_filepath):
+        return {'sources': {}, 'partitions': {}}
+    with open(manifest_filepath) as manifest_file:
+        return json.load(manifest_file)
+
+def is_source_ingested(
+    source_filepath: str,
+    source_kind: str
+) -> bool:
+    # A source is re-ingested whenever it has been modified since it was last written to the store,
+    # or another source has since overwritten one of the months it wrote
+    source_filepath = os.path.abspath(source_filepath)
+    source_manifest = read_source_manifest(source_kind)
+    source_entry = source_manifest['sources'].get(source_filepath)
+    if source_entry is None or source_entry['mtime_ns'] != os.stat(source_filepath).st_mtime_ns:
+        return False
+    return all(
+        source_manifest['partitions'].get(year_month) == source_filepath and os.path.exists(get_partition_filepath(year_month, source_kind))
+        for year_month in source_entry['year_months']
+    )
+
+def record_ingested_source(
+    source_filepath: str,
+    source_kind: str,
+    year_months: list[str]
+) -> None:
+    source_filepath = os.path.abspath(source_filepath)
+    source_manifest = read_source_manifest(source_kind)
+    source_manifest['sources'][source_filepath] = {'mtime_ns': os.stat(source_filepath).st_mtime_ns, 'year_months': sorted(year_months)}
+    source_manifest['partitions'].update({year_month: source_filepath for year_month in year_months})
+    manifest_filepath = os.path.join(get_source_directory(source_kind), SOURCE_MANIFEST_FILENAME)
+    os.makedirs(os.path.dirname(manifest_filepath), exist_ok=True)
+    temporary_filepath = f'{manifest_filepath}.{uuid.uuid4().hex}.tmp'
+    with open(temporary_filepath, 'w') as manifest_file:
+        json.dump(source_manifest, manifest_file, indent=2)
+    os.replace(temporary_filepath, manifest_filepath)
+
+def read_mr1b_month(
+    year: int,
+    month: int,
+    columns: list[str] | None = None,
+    mr1b_filepath: str | None = None
+) -> pd.DataFrame:
+    """
+    Read one month of MR1B data, ingesting mr1b_filepath first if the store does not have its current contents.
+    The month's workbook is read where one has been ingested, and the bulk CSV's rows for the month otherwise.
+    """
+    if mr1b_filepath is not None:
+        ingest_mr1b_workbook(mr1b_filepath, f'{year}_{month:02d}')
+
+    return read_partitions([f'{year}_{month:02d}'], columns, source_kinds=[WORKBOOK_SOURCE, CSV_SOURCE])
+
+def read_mr1b(
+    start_date: str,
+    end_date: str,
+    columns: list[str] | None = None,
+    mr1b_csv_filepath: str | None = None,
+    chunksize: int = 250_000
+) -> pd.DataFrame:
+    """
+    Read every MR1B row settled between start_date and end_date inclusive. Each month comes from the bulk CSV
+    where it has been ingested, so a month is never mixed from two sources, and from its workbook otherwise.
+    """
+    if mr1b_csv_filepath is not None:
+        ingest_mr1b_csv(mr1b_csv_filepath, chunksize)
+    start_ts = pd.Timestamp(start_date)
+    end_ts = pd.Timestamp(end_date)
+    year_months = [year_month for year_month in get_stored_year_months() if start_ts.strftime('%Y_%m') <= year_month <= end_ts.strftime('%Y_%m')]
+
+    return read_partitions(year_months, columns, [('Settlement Date', '>=', start_ts), ('Settlement Date', '<=', end_ts)], [CSV_SOURCE, WORKBOOK_SOURCE])
+
+def read_partitions(
+    year_months: list[str],
+    columns: list[str] | None = None,
+    filters: list[tuple] | None = None,
+    source_kinds: list[str] = SOURCE_KINDS
+) -> pd.DataFrame:
+    """Each month is read from the first of source_kinds that has it."""
+    mr1b_dfs = []
+    for year_month in year_months:
+        partition_filepath = next((
+            get_partition_filepath(year_month, source_kind) for source_kind in source_kinds
+            if os.path.exists(get_partition_filepath(year_month, source_kind))
+        ), None)
+        if partition_filepath is None:
+            raise ValueError(f"No MR1B data has been ingested for {year_month}")
+        # Columns missing from a month, such as Credited Energy Vol in older workbooks, are left out rather than failing the read
+        partition_columns = None if columns is None else [column_name for column_name in columns if column_name in pq.read_schema(partition_filepath).names]
+        mr1b_dfs.append(pd.read_parquet(partition_filepath, columns=partition_columns, filters=filters))
+    if not mr1b_dfs:
+        return get_empty_mr1b_data(columns if columns is not None else IMBALANCE_COLUMNS)
+    mr1b_df = pd.concat(mr1b_dfs, ignore_index=True) if len(mr1b_dfs) > 1 else mr1b_dfs[0]
+    # Months carry their own Party ID categories, which concat widens to object
+    if 'Party ID' in mr1b_df.columns and not isinstance(mr1b_df['Party ID'].dtype, pd.CategoricalDtype):
+        mr1b_df['Party ID'] = mr1b_df['Party ID'].astype('category')
+    mr1b_df.attrs[NORMALISED_ATTRIBUTE] = True
+
+    return mr1b_df
+
+def get_empty_mr1b_data(
+    columns: list[str]
+) -> pd.DataFrame:
+    column_dtypes = {'Settlement Date': 'datetime64[ns]', 'Settlement Period': 'int64', 'Party ID': 'category'}
+    mr1b_df = pd.DataFrame({column_name: pd.Series(dtype=column_dtypes.get(column_name, 'float64')) for column_name in columns})
+    mr1b_df.attrs[NORMALISED_ATTRIBUTE] = True
+
+    return mr1b_df
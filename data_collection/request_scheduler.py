@@ -0,0 +1,183 @@
+import asyncio
+import random
+import time
+from collections import deque
+
+import aiohttp
+import urllib3.exceptions
+from elexonpy.rest import ApiException
+
+THROTTLING_STATUS_CODES = {429, 500, 502, 503, 504}
+# Timeouts and dropped connections from either transport are retried whatever their cause
+TRANSIENT_EXCEPTIONS = (
+    TimeoutError,
+    ConnectionError,
+    aiohttp.ClientConnectionError,
+    aiohttp.ClientPayloadError,
+    urllib3.exceptions.TimeoutError,
+    urllib3.exceptions.ProtocolError,
+    urllib3.exceptions.MaxRetryError
+)
+
+def is_retryable(
+    exception: Exception
+) -> bool:
+    if isinstance(exception, (ApiException, aiohttp.ClientResponseError)):
+        return getattr(exception, 'status', None) in THROTTLING_STATUS_CODES
+    return isinstance(exception, TRANSIENT_EXCEPTIONS)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.last_refill_time = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill_time) * self.rate)
+        self.last_refill_time = now
+
+    async def acquire(self) -> None:
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class RequestScheduler:
+    """Bounds in-flight requests, rate limits each endpoint and adapts concurrency (AIMD) to throttling."""
+
+    def __init__(
+        self,
+        max_in_flight: int = 64,
+        initial_in_flight: int = 16,
+        min_in_flight: int = 1,
+        default_rate_limit: float | None = None,
+        endpoint_rate_limits: dict[str, float] | None = None,
+        max_retries: int = 5,
+        backoff: float = 0.5,
+        additive_increase: float = 1.0,
+        multiplicative_decrease: float = 0.5,
+        decrease_cooldown: float = 1.0,
+        statistics_window: float = 60.0
+    ):
+        self.max_in_flight = max_in_flight
+        self.min_in_flight = min_in_flight
+        self.concurrency_limit = float(min(max(initial_in_flight, min_in_flight), max_in_flight))
+        self.default_rate_limit = default_rate_limit
+        self.endpoint_rate_limits = endpoint_rate_limits or {}
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.additive_increase = additive_increase
+        self.multiplicative_decrease = multiplicative_decrease
+        self.decrease_cooldown = decrease_cooldown
+        self.statistics_window = statistics_window
+        self.in_flight = 0
+        self.completed_requests = 0
+        self.throttled_responses = 0
+        self.failed_requests = 0
+        self.first_request_time = None
+        self.last_decrease_time = 0.0
+        self.completion_times = deque()
+        self.token_buckets = {}
+        self._condition = None
+        self._loop = None
+
+    def _get_condition(self) -> asyncio.Condition:
+        # asyncio primitives are bound to the loop they are first used on, so rebuild them per run
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._condition = asyncio.Condition()
+            self.in_flight = 0
+        return self._condition
+
+    def _get_token_bucket(self, endpoint: str) -> TokenBucket | None:
+        rate_limit = self.endpoint_rate_limits.get(endpoint, self.default_rate_limit)
+        if rate_limit is None:
+            return None
+        if endpoint not in self.token_buckets:
+            self.token_buckets[endpoint] = TokenBucket(rate_limit)
+        return self.token_buckets[endpoint]
+
+    async def _acquire_slot(self) -> None:
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self.in_flight < int(self.concurrency_limit))
+            self.in_flight += 1
+
+    async def _release_slot(self) -> None:
+        condition = self._get_condition()
+        async with condition:
+            self.in_flight -= 1
+            condition.notify_all()
+
+    def _on_success(self) -> None:
+        now = time.monotonic()
+        self.completed_requests += 1
+        self.completion_times.append(now)
+        while self.completion_times and now - self.completion_times[0] > self.statistics_window:
+            self.completion_times.popleft()
+        self.concurrency_limit = min(self.max_in_flight, self.concurrency_limit + self.additive_increase / self.concurrency_limit)
+
+    def _on_throttled(self) -> None:
+        self.throttled_responses += 1
+        now = time.monotonic()
+        if now - self.last_decrease_time < self.decrease_cooldown:
+            return
+        self.last_decrease_time = now
+        self.concurrency_limit = max(self.min_in_flight, self.concurrency_limit * self.multiplicative_decrease)
+
+    async def run(
+        self,
+        endpoint: str,
+        request
+    ):
+        if self.first_request_time is None:
+            self.first_request_time = time.monotonic()
+        token_bucket = self._get_token_bucket(endpoint)
+        for attempt in range(1, self.max_retries + 1):
+            if token_bucket is not None:
+                await token_bucket.acquire()
+            await self._acquire_slot()
+            try:
+                result = await request()
+            except Exception as e:
+                # Client errors, invalid responses and bugs in the request fail at once rather than after every retry
+                if not is_retryable(e):
+                    self.failed_requests += 1
+                    raise
+                status = getattr(e, 'status', None)
+                if status in THROTTLING_STATUS_CODES:
+                    self._on_throttled()
+                if attempt == self.max_retries:
+                    self.failed_requests += 1
+                    raise e
+                sleep_time = self.backoff * 2 ** (attempt - 1) * (1 + random.random())
+                reason = f'status {status}' if status is not None else type(e).__name__
+                print(f"API call to {endpoint} failed with {reason}. Retrying in {sleep_time:.1f} seconds.")
+            else:
+                self._on_success()
+                return result
+            finally:
+                await self._release_slot()
+            await asyncio.sleep(sleep_time)
+
+    def get_statistics(self) -> dict[str, float]:
+        now = time.monotonic()
+        elapsed = now - self.first_request_time if self.first_request_time is not None else 0.0
+        recent_completions = [t for t in self.completion_times if now - t <= self.statistics_window]
+        recent_window = min(self.statistics_window, elapsed) if elapsed > 0 else 0.0
+
+        return {
+            'completed_requests': self.completed_requests,
+            'throttled_responses': self.throttled_responses,
+            'failed_requests': self.failed_requests,
+            'concurrency_limit': int(self.concurrency_limit),
+            'requests_per_second': self.completed_requests / elapsed if elapsed > 0 else 0.0,
+            'recent_requests_per_second': len(recent_completions) / recent_window if recent_window > 0 else 0.0
+        }
@@ -1,13 +1,33 @@
+import numpy as np
 import pandas as pd
 
-def get_physical_volume(
-    original_data: pd.DataFrame
-) -> float:
-    physical_data = original_data.copy()
-    physical_data.loc[:, 'time_from'] = pd.to_datetime(physical_data['time_from'])
-    physical_data.loc[:, 'time_to'] = pd.to_datetime(physical_data['time_to'])
-    physical_data.loc[:, 'duration_hours'] = (physical_data['time_to'] - physical_data['time_from']).dt.total_seconds() / 3600
-    physical_data.loc[:, 'energy_MWh'] = ((physical_data['level_from'] + physical_data['level_to']) / 2) * physical_data['duration_hours']
-    total_energy_MWh = physical_data['energy_MWh'].sum()
+PHYSICAL_DATASETS = ['PN', 'MELS', 'MILS']
+
+def get_physical_volumes_by_bmu(
+    physical_data_by_dataset: dict[str, pd.DataFrame],
+    bmus
+) -> pd.DataFrame:
+    # One row per BMU with a float column per dataset; BMUs with no physical data get zero energy
+    bm_units = []
+    dataset_codes = []
+    energies_MWh = []
+    for dataset_code, dataset in enumerate(PHYSICAL_DATASETS):
+        physical_data = physical_data_by_dataset[dataset]
+        time_from = pd.to_datetime(physical_data['time_from'])
+        time_to = pd.to_datetime(physical_data['time_to'])
+        duration_hours = (time_to - time_from).dt.total_seconds().to_numpy() / 3600
+        mean_level = (physical_data['level_from'].to_numpy(dtype=float) + physical_data['level_to'].to_numpy(dtype=float)) / 2
+        bm_units.append(physical_data['bm_unit'].to_numpy())
+        dataset_codes.append(np.full(len(physical_data), dataset_code))
+        energies_MWh.append(mean_level * duration_hours)
+    
+    bm_unit_codes, bm_unit_ids = pd.factorize(np.concatenate(bm_units))
+    dataset_codes = np.concatenate(dataset_codes)
+    energies_MWh = np.concatenate(energies_MWh)
+    # Rows without a BMU belong to no total, and NaN energy is skipped as a per-BMU sum would skip it
+    is_counted = (bm_unit_codes >= 0) & np.isfinite(energies_MWh)
+    energy_table = np.zeros((len(bm_unit_ids), len(PHYSICAL_DATASETS)))
+    np.add.at(energy_table, (bm_unit_codes[is_counted], dataset_codes[is_counted]), energies_MWh[is_counted])
+    physical_volumes_by_bmu = pd.DataFrame(energy_table, index=pd.Index(bm_unit_ids, name='bm_unit'), columns=PHYSICAL_DATASETS)
     
-    return total_energy_MWh
\ No newline at end of file
+    return physical_volumes_by_bmu.reindex(list(bmus), fill_value=0.0)
@@ -1,42 +1,80 @@
-class BMUnit:
-    def __init__(self, bmu_id, bid_offer_pairs_submitted, factual_acceptance_volume_by_pair, physical_volumes):
-        self.unit_id = bmu_id
-        self.bid_offer_pairs_submitted = bid_offer_pairs_submitted
-        self.factual_acceptance_volume_by_pair = factual_acceptance_volume_by_pair
-        self.physical_volumes = physical_volumes
-        self.remaining_volume_by_pair = self.get_remaining_volume_by_pair()
-    
-    #Aim of this method is to respect MELS and MILS
-    def get_remaining_volume_by_pair(self):
-        remaining_volume_by_pair = {}
-        positive_pair_ids = sorted([pair_id for pair_id in self.bid_offer_pairs_submitted.keys() if pair_id > 0])
-        negative_pair_ids = sorted([pair_id for pair_id in self.bid_offer_pairs_submitted.keys() if pair_id < 0], reverse=True)
-        max_energy_export = self.physical_volumes['MELS']
-        max_energy_import = self.physical_volumes['MILS']
-        scheduled_energy_delivery = self.physical_volumes['PN']
-        for pair_index in range(len(positive_pair_ids)):
-            energy_from_previous_offers = sum([self.bid_offer_pairs_submitted[pair_id]['level_from'] for pair_id in positive_pair_ids[:pair_index]])/2
-            available_energy_this_offer = self.bid_offer_pairs_submitted[positive_pair_ids[pair_index]]['level_from']/2
-            total_offer_energy_used = self.factual_acceptance_volume_by_pair[positive_pair_ids[pair_index]] if positive_pair_ids[pair_index] in self.factual_acceptance_volume_by_pair else 0
-            
-            total_energy_delivered = energy_from_previous_offers + scheduled_energy_delivery
-            total_stated_deliverable_energy_this_bid = total_energy_delivered + available_energy_this_offer
-            total_physically_deliverable_energy = min(total_stated_deliverable_energy_this_bid, max_energy_export)
-            
-            available_volume = max(total_physically_deliverable_energy - (total_offer_energy_used + total_energy_delivered), 0)
-            remaining_volume_by_pair[positive_pair_ids[pair_index]] = available_volume
-            
-        for pair_index in range(len(negative_pair_ids)):
-            energy_from_previous_bids = sum([self.bid_offer_pairs_submitted[pair_id]['level_from'] for pair_id in negative_pair_ids[:pair_index]])/2
-            available_energy_this_bid = self.bid_offer_pairs_submitted[negative_pair_ids[pair_index]]['level_from']/2
-            total_bid_energy_used = self.factual_acceptance_volume_by_pair[negative_pair_ids[pair_index]] if negative_pair_ids[pair_index] in self.factual_acceptance_volume_by_pair else 0
-            
-            total_energy_delivered = energy_from_previous_bids + scheduled_energy_delivery
-            total_stated_deliverable_energy_this_bid = total_energy_delivered + available_energy_this_bid
-            total_physically_deliverable_energy = max(total_stated_deliverable_energy_this_bid, max_energy_import)
-            
-            available_volume = min(total_physically_deliverable_energy - (total_bid_energy_used + total_energy_delivered), 0)
-            remaining_volume_by_pair[negative_pair_ids[pair_index]] = available_volume
-        
-        return remaining_volume_by_pair
-    
\ No newline at end of file
+import numpy as np
+import pandas as pd
+
+class BidOfferHeadroom:
+    """
+    Remaining volume of every bid-offer pair submitted in one settlement period, held as arrays over the
+    (bm_unit, pair_id) pairs of every BMU at once.
+
+    Offers stack up from pair 1 and bids down from pair -1. A pair's headroom is its half hour of energy on top of
+    PN and the pairs before it, capped at MELS for offers and MILS for bids, less any volume already accepted from it.
+    """
+    __slots__ = ('pair_index', 'bids', 'offers', 'remaining_volumes')
+
+    def __init__(
+        self,
+        pair_index: pd.MultiIndex,
+        bids: np.ndarray,
+        offers: np.ndarray,
+        remaining_volumes: np.ndarray
+    ):
+        self.pair_index = pair_index
+        self.bids = bids
+        self.offers = offers
+        self.remaining_volumes = remaining_volumes
+
+    @classmethod
+    def from_bid_offer_data(
+        cls,
+        bid_offer_data_one_period: pd.DataFrame,
+        acceptance_volumes_by_bmu_and_pair: pd.Series,
+        physical_volumes_by_bmu: pd.DataFrame
+    ) -> 'BidOfferHeadroom':
+        # The last submission of a repeated pair wins, and pair 0 is neither a bid nor an offer
+        bid_offer_data = bid_offer_data_one_period[bid_offer_data_one_period['bm_unit'].notna() & (bid_offer_data_one_period['pair_id'] != 0)]
+        bid_offer_data = bid_offer_data.drop_duplicates(['bm_unit', 'pair_id'], keep='last')
+        bm_unit_codes, _ = pd.factorize(bid_offer_data['bm_unit'])
+        pair_ids = bid_offer_data['pair_id'].to_numpy(dtype=np.int64)
+        is_offer = pair_ids > 0
+        order = np.lexsort((np.abs(pair_ids), is_offer, bm_unit_codes))
+        bid_offer_data = bid_offer_data.iloc[order]
+        bm_unit_ids = bid_offer_data['bm_unit'].to_numpy(dtype=object)
+        pair_ids = pair_ids[order]
+        is_offer = is_offer[order]
+        pair_index = pd.MultiIndex.from_arrays([bm_unit_ids, pair_ids], names=['bm_unit', 'pair_id'])
+
+        # Grouped cumulative sums over the sorted pairs give the energy of all earlier pairs in one pass
+        group_keys = [bm_unit_codes[order], is_offer]
+        level_froms = pd.Series(bid_offer_data['level_from'].to_numpy(dtype=np.float64))
+        previous_level_froms = level_froms.groupby(group_keys).cumsum().groupby(group_keys).shift(fill_value=0.0).to_numpy()
+        physical_volumes = physical_volumes_by_bmu.reindex(bm_unit_ids)
+        total_energy_delivered = previous_level_froms / 2 + physical_volumes['PN'].to_numpy(dtype=np.float64)
+        total_stated_deliverable_energy = total_energy_delivered + level_froms.to_numpy() / 2
+        # -1 positions pick the appended zero, so pairs with no accepted volume have used none
+        acceptance_positions = acceptance_volumes_by_bmu_and_pair.index.get_indexer(pair_index)
+        total_energy_used = np.append(acceptance_volumes_by_bmu_and_pair.to_numpy(dtype=np.float64), 0.0)[acceptance_positions]
+        remaining_volumes = np.where(
+            is_offer,
+            np.maximum(np.minimum(total_stated_deliverable_energy, physical_volumes['MELS'].to_numpy(dtype=np.float64)) - (total_energy_used + total_energy_delivered), 0),
+            np.minimum(np.maximum(total_stated_deliverable_energy, physical_volumes['MILS'].to_numpy(dtype=np.float64)) - (total_energy_used + total_energy_delivered), 0)
+        )
+
+        return cls(
+            pair_index,
+            bid_offer_data['bid'].to_numpy(dtype=np.float64),
+            bid_offer_data['offer'].to_numpy(dtype=np.float64),
+            remaining_volumes
+        )
+
+    def get_positions(
+        self,
+        bm_unit_ids,
+        pair_ids
+    ) -> np.ndarray:
+        positions = self.pair_index.get_indexer(pd.MultiIndex.from_arrays([bm_unit_ids, pair_ids]))
+        if (positions < 0).any():
+            raise ValueError(f"No bid-offer pair submitted for {len(positions[positions < 0])} of the requested (bm_unit, pair_id) pairs")
+        return positions
+
+    def __len__(self) -> int:
+        return len(self.remaining_volumes)
@@ -0,0 +1,138 @@
+import hashlib
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+CACHE_DIRECTORY_ENVIRONMENT_VARIABLE = 'BSC_ROLES_CACHE_DIRECTORY'
+DEFAULT_CACHE_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'niv-chasing-analysis', 'bsc_roles')
+ROLE_FLAG_COLUMNS = ['TN', 'TS', 'TG']
+ROLES = ['npt', 'strict_npt', 'supplier', 'strict_supplier', 'generator', 'strict_generator', 'mixed_role']
+
+_cache_directory = os.environ.get(CACHE_DIRECTORY_ENVIRONMENT_VARIABLE, DEFAULT_CACHE_DIRECTORY)
+_bsc_roles_by_source = {}
+
+class BscRoles:
+    """
+    The BSC roles workbook held as one boolean array per role flag (TN, TS, TG) over a categorical of BSC ids, so
+    every strict and loose role mask is a vectorised expression over the same rows. A strict role excludes parties
+    that also hold either of the other two flags, and a mixed role party holds at least two of them.
+    """
+
+    def __init__(
+        self,
+        bsc_ids: pd.Categorical,
+        is_npt: np.ndarray,
+        is_supplier: np.ndarray,
+        is_generator: np.ndarray
+    ):
+        self.bsc_ids = bsc_ids
+        self.is_npt = is_npt
+        self.is_supplier = is_supplier
+        self.is_generator = is_generator
+
+    @classmethod
+    def from_dataframe(
+        cls,
+        bsc_roles_df: pd.DataFrame
+    ) -> 'BscRoles':
+        # Rows without a BSC id, such as stray blank rows, cannot match a party and are left out
+        has_bsc_id = bsc_roles_df['BSC_ID'].notna().to_numpy()
+        if not has_bsc_id.all():
+            print(f"Skipping {int((~has_bsc_id).sum())} rows without a BSC_ID in the BSC roles workbook")
+            bsc_roles_df = bsc_roles_df[has_bsc_id]
+        # Later rows win for repeated BSC ids, as they did when the roles were read into dicts
+        bsc_roles_df = bsc_roles_df.drop_duplicates('BSC_ID', keep='last')
+        bsc_ids = pd.Categorical(bsc_roles_df['BSC_ID'])
+        # Reordered so row i holds the BSC id with category code i
+        row_order = np.argsort(bsc_ids.codes)
+        return cls(
+            pd.Categorical.from_codes(bsc_ids.codes[row_order], bsc_ids.categories),
+            *[(bsc_roles_df[column_name] == True).to_numpy()[row_order] for column_name in ROLE_FLAG_COLUMNS]
+        )
+
+    @classmethod
+    def load(
+        cls,
+        bsc_roles_filepath: str
+    ) -> 'BscRoles':
+        """Load the roles workbook once per process, reading the on-disk cache rather than Excel while the workbook is unchanged."""
+        source_key = (os.path.abspath(bsc_roles_filepath), os.stat(bsc_roles_filepath).st_mtime_ns)
+        if source_key not in _bsc_roles_by_source:
+            _bsc_roles_by_source[source_key] = cls.from_dataframe(read_bsc_roles_dataframe(bsc_roles_filepath, source_key))
+        return _bsc_roles_by_source[source_key]
+
+    def get_role_mask(
+        self,
+        role: str
+    ) -> np.ndarray:
+        if role == 'npt':
+            return self.is_npt
+        if role == 'strict_npt':
+            return self.is_npt & ~self.is_supplier & ~self.is_generator
+        if role == 'supplier':
+            return self.is_supplier
+        if role == 'strict_supplier':
+            return self.is_supplier & ~self.is_npt & ~self.is_generator
+        if role == 'generator':
+            return self.is_generator
+        if role == 'strict_generator':
+            return self.is_generator & ~self.is_npt & ~self.is_supplier
+        if role == 'mixed_role':
+            return (self.is_npt & self.is_supplier) | (self.is_npt & self.is_generator) | (self.is_supplier & self.is_generator)
+        raise ValueError(f"Unknown BSC role '{role}'. Roles: {ROLES}")
+
+    def get_role_mask_for_parties(
+        self,
+        role: str,
+        party_ids
+    ) -> np.ndarray:
+        # Parties missing from the workbook hold no role
+        party_codes = pd.Categorical(party_ids, categories=self.bsc_ids.categories).codes
+        return np.where(party_codes >= 0, self.get_role_mask(role)[party_codes], False)
+
+    def get_mapping(
+        self,
+        role: str
+    ) -> dict[str, bool]:
+        return dict(zip(self.bsc_ids.categories, self.get_role_mask(role).tolist()))
+
+def read_bsc_roles_dataframe(
+    bsc_roles_filepath: str,
+    source_key: tuple[str, int]
+) -> pd.DataFrame:
+    cache_filepath = None
+    if _cache_directory is not None:
+        cache_filepath = os.path.join(_cache_directory, hashlib.sha1(repr(source_key).encode()).hexdigest() + '.parquet')
+        if os.path.exists(cache_filepath):
+            return pd.read_parquet(cache_filepath)
+    bsc_roles_df = pd.read_excel(bsc_roles_filepath)[['BSC_ID'] + ROLE_FLAG_COLUMNS]
+    bsc_roles_df[ROLE_FLAG_COLUMNS] = bsc_roles_df[ROLE_FLAG_COLUMNS] == True
+    if cache_filepath is not None:
+        os.makedirs(_cache_directory, exist_ok=True)
+        temporary_filepath = f'{cache_filepath}.{uuid.uuid4().hex}.tmp'
+        try:
+            bsc_roles_df.to_parquet(temporary_filepath, index=False)
+            os.replace(temporary_filepath, cache_filepath)
+        except Exception as e:
+            print(f"Could not cache BSC roles to {cache_filepath}: {e}")
+        finally:
+            if os.path.exists(temporary_filepath):
+                os.remove(temporary_filepath)
+
+    return bsc_roles_df
+
+def set_cache_directory(
+    cache_directory: str | None
+) -> None:
+    """Point the on-disk cache at a new directory, or pass None to always read the workbook."""
+    global _cache_directory
+    _cache_directory = cache_directory
+
+def as_bsc_roles(
+    bsc_roles: str | BscRoles
+) -> BscRoles:
+    if isinstance(bsc_roles, BscRoles):
+        return bsc_roles
+    return BscRoles.load(bsc_roles)
@@ -0,0 +1,209 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sparse
+
+from data_collection.mr1b_store import is_normalised_mr1b, strip_strings
+from data_processing.bsc_roles import ROLES, BscRoles
+
+MAXIMUM_ROLE_COUNT = 64
+
+class ImbalanceCube:
+    """
+    MR1B summed into sparse party × settlement period matrices, so a total over any set of parties is one
+    matrix-vector product rather than a filter and groupby of the whole frame.
+
+    Periods are the (Settlement Date, Settlement Period) pairs present in MR1B, in ascending order and with
+    dates as MR1B gave them. Zero credited energy volume is judged row by row before summing, which is what
+    the zero metered volume NIV needs. Roles added with add_role are held as one bit per role in a uint64
+    bitmask per party; add_bsc_roles adds every BSC role at once.
+
+    Imbalance Charge and Credited Energy Vol are missing from some MR1B sources. Their matrices are then None,
+    and consumers call require_columns for the columns their totals need.
+    """
+
+    def __init__(
+        self,
+        party_ids: np.ndarray,
+        settlement_dates: np.ndarray,
+        settlement_periods: np.ndarray,
+        row_counts: sparse.csr_matrix,
+        energy_imbalance_volumes: sparse.csr_matrix,
+        imbalance_charges: sparse.csr_matrix | None,
+        credited_energy_volumes: sparse.csr_matrix | None,
+        zero_credited_row_counts: sparse.csr_matrix | None,
+        zero_credited_energy_imbalance_volumes: sparse.csr_matrix | None,
+        missing_columns: list[str] | None = None
+    ):
+        self.party_ids = party_ids
+        self.settlement_dates = settlement_dates
+        self.settlement_periods = settlement_periods
+        self.row_counts = row_counts
+        self.energy_imbalance_volumes = energy_imbalance_volumes
+        self.imbalance_charges = imbalance_charges
+        self.credited_energy_volumes = credited_energy_volumes
+        self.zero_credited_row_counts = zero_credited_row_counts
+        self.zero_credited_energy_imbalance_volumes = zero_credited_energy_imbalance_volumes
+        self.missing_columns = [] if missing_columns is None else list(missing_columns)
+        self.role_bits = {}
+        self.role_bitmasks = np.zeros(len(party_ids), dtype=np.uint64)
+
+    @classmethod
+    def from_mr1b(
+        cls,
+        mr1b_df: pd.DataFrame
+    ) -> 'ImbalanceCube':
+        party_codes, party_ids = pd.factorize(mr1b_df['Party ID'])
+        if not is_normalised_mr1b(mr1b_df):
+            # Only the distinct party ids are stripped, then codes are merged for ids that only differed by whitespace
+            stripped_codes, party_ids = pd.factorize(strip_strings(pd.Series(np.asarray(party_ids, dtype=object))))
+            party_codes = np.where(party_codes >= 0, stripped_codes[party_codes], -1)
+        party_ids = np.asarray(party_ids, dtype=object)
+        # Rows without a party id still count towards totals over every party
+        if (party_codes < 0).any():
+            party_ids = np.append(party_ids, None)
+            party_codes = np.where(party_codes < 0, len(party_ids) - 1, party_codes)
+
+        period_codes, periods = pd.factorize(
+            pd.MultiIndex.from_arrays([mr1b_df['Settlement Date'], mr1b_df['Settlement Period']]), sort=True)
+        has_period = period_codes >= 0
+        party_codes = party_codes[has_period]
+        period_codes = period_codes[has_period]
+        shape = (len(party_ids), len(periods))
+
+        def to_matrix(values: np.ndarray) -> sparse.csr_matrix:
+            # Duplicate party and period pairs are summed, and missing values count as zero as they do in a groupby sum
+            return sparse.csr_matrix((np.nan_to_num(values[has_period]), (party_codes, period_codes)), shape=shape)
+
+        if 'Energy Imbalance Vol' not in mr1b_df.columns:
+            raise ValueError(f"MR1B data is missing 'Energy Imbalance Vol'. Available columns: {list(mr1b_df.columns)}")
+        energy_imbalance_volumes = mr1b_df['Energy Imbalance Vol'].to_numpy(dtype=float)
+        missing_columns = []
+        if 'Imbalance Charge' in mr1b_df.columns:
+            imbalance_charges = to_matrix(mr1b_df['Imbalance Charge'].to_numpy(dtype=float))
+        else:
+            imbalance_charges = None
+            missing_columns.append('Imbalance Charge')
+        credited_energy_vol_column_name = 'Credited Energy Vol' if 'Credited Energy Vol' in mr1b_df.columns else 'CreditedEnergyVol'
+        if credited_energy_vol_column_name in mr1b_df.columns:
+            credited_energy_volumes = mr1b_df[credited_energy_vol_column_name].to_numpy(dtype=float)
+            is_zero_credited = credited_energy_volumes == 0
+            credited_energy_volumes = to_matrix(credited_energy_volumes)
+            zero_credited_row_counts = to_matrix(is_zero_credited.astype(float))
+            zero_credited_energy_imbalance_volumes = to_matrix(np.where(is_zero_credited, energy_imbalance_volumes, 0.0))
+        else:
+            credited_energy_volumes = zero_credited_row_counts = zero_credited_energy_imbalance_volumes = None
+            missing_columns.append('Credited Energy Vol')
+
+        return cls(
+            party_ids,
+            np.asarray(periods.get_level_values(0)),
+            np.asarray(periods.get_level_values(1)),
+            to_matrix(np.ones(len(mr1b_df))),
+            to_matrix(energy_imbalance_volumes),
+            imbalance_charges,
+            credited_energy_volumes,
+            zero_credited_row_counts,
+            zero_credited_energy_imbalance_volumes,
+            missing_columns
+        )
+
+    @property
+    def nbytes(self) -> int:
+        matrices = [
+            self.row_counts, self.energy_imbalance_volumes, self.imbalance_charges, self.credited_energy_volumes,
+            self.zero_credited_row_counts, self.zero_credited_energy_imbalance_volumes
+        ]
+        matrix_bytes = sum(matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes for matrix in matrices if matrix is not None)
+        return matrix_bytes + self.party_ids.nbytes + self.settlement_dates.nbytes + self.settlement_periods.nbytes + self.role_bitmasks.nbytes
+
+    def require_columns(
+        self,
+        column_names: list[str]
+    ) -> None:
+        missing_columns = [column_name for column_name in column_names if column_name in self.missing_columns]
+        if missing_columns:
+            raise ValueError(f"MR1B data is missing {missing_columns}, which this calculation needs")
+
+    def add_role(
+        self,
+        role: str,
+        bsc_id_to_role_mapping: dict[str, bool]
+    ) -> None:
+        self._set_role_bits(role, self.get_party_mask(bsc_id_to_role_mapping))
+
+    def _set_role_bits(
+        self,
+        role: str,
+        party_mask: np.ndarray
+    ) -> None:
+        if role not in self.role_bits:
+            if len(self.role_bits) == MAXIMUM_ROLE_COUNT:
+                raise ValueError(f"An imbalance cube holds at most {MAXIMUM_ROLE_COUNT} roles")
+            self.role_bits[role] = np.uint64(1) << np.uint64(len(self.role_bits))
+        role_bit = self.role_bits[role]
+        self.role_bitmasks &= ~role_bit
+        self.role_bitmasks[party_mask] |= role_bit
+
+    def add_bsc_roles(
+        self,
+        bsc_roles: BscRoles
+    ) -> None:
+        for role in ROLES:
+            self._set_role_bits(role, bsc_roles.get_role_mask_for_parties(role, self.party_ids))
+
+    def get_role_mask(
+        self,
+        role: str
+    ) -> np.ndarray:
+        if role not in self.role_bits:
+            raise ValueError(f"Role '{role}' has not been added to the imbalance cube. Roles: {list(self.role_bits)}")
+        return (self.role_bitmasks & self.role_bits[role]) != 0
+
+    def get_party_mask(
+        self,
+        parties: str | dict[str, bool] | None
+    ) -> np.ndarray:
+        """Parties in a role added to the cube, parties a mapping marks True, or every party for None."""
+        if parties is None:
+            return np.ones(len(self.party_ids), dtype=bool)
+        if isinstance(parties, str):
+            return self.get_role_mask(parties)
+        return np.fromiter((parties.get(party_id) == True for party_id in self.party_ids), dtype=bool, count=len(self.party_ids))
+
+    def get_period_totals(
+        self,
+        matrix: sparse.csr_matrix,
+        party_mask: np.ndarray
+    ) -> np.ndarray:
+        return matrix.T @ party_mask.astype(float)
+
+    def get_settlement_date_strings(self) -> np.ndarray:
+        if pd.api.types.is_string_dtype(self.settlement_dates):
+            return self.settlement_dates
+        return pd.to_datetime(self.settlement_dates).strftime('%Y-%m-%d').to_numpy(dtype=object)
+
+    def to_dataframe(
+        self,
+        period_mask: np.ndarray,
+        columns: dict[str, np.ndarray],
+        settlement_dates: np.ndarray | None = None
+    ) -> pd.DataFrame:
+        settlement_dates = self.settlement_dates if settlement_dates is None else settlement_dates
+        period_df = pd.DataFrame({
+            'settlement_date': settlement_dates[period_mask],
+            'settlement_period': self.settlement_periods[period_mask]
+        })
+        for column_name, values in columns.items():
+            period_df[column_name] = values[period_mask]
+
+        return period_df
+
+    def __len__(self) -> int:
+        return len(self.settlement_periods)
+
+def as_imbalance_cube(
+    mr1b_data: pd.DataFrame | ImbalanceCube
+) -> ImbalanceCube:
+    if isinstance(mr1b_data, ImbalanceCube):
+        return mr1b_data
+    return ImbalanceCube.from_mr1b(mr1b_data)
@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+
+from data_processing.bm_unit import BidOfferHeadroom
+
+class MeritOrderIndex:
+    """
+    One period's bid or offer stack indexed for the marginal plant search: the first stack position of every
+    (bm_unit, pair_id), and the stack's prices as an ascending array. Offer stacks run from the cheapest offer up and
+    bid stacks from the dearest bid down, so bid prices are held negated.
+
+    The stack's BMU and pair ids are kept as arrays, and the position of each row in a BidOfferHeadroom is worked
+    out once, so accepting volume from the stack many times over only gathers from arrays.
+    """
+
+    def __init__(
+        self,
+        position_by_bmu_and_pair: dict[tuple[str, int], int],
+        merit_order_prices: np.ndarray,
+        is_offer_stack: bool,
+        bm_unit_ids: np.ndarray,
+        pair_ids: np.ndarray
+    ):
+        self.position_by_bmu_and_pair = position_by_bmu_and_pair
+        self.merit_order_prices = merit_order_prices
+        self.is_offer_stack = is_offer_stack
+        self.bm_unit_ids = bm_unit_ids
+        self.pair_ids = pair_ids
+        self._headroom = None
+        self._headroom_positions = None
+
+    @classmethod
+    def from_bid_or_offer_stack(
+        cls,
+        bid_or_offer_stack: pd.DataFrame
+    ) -> 'MeritOrderIndex':
+        is_offer_stack = bool(len(bid_or_offer_stack) > 0 and bid_or_offer_stack['pair_id'].iloc[0] > 0)
+        bm_unit_ids = bid_or_offer_stack['bm_unit'].to_numpy(dtype=object)
+        pair_ids = bid_or_offer_stack['pair_id'].to_numpy()
+        keys = list(zip(bm_unit_ids.tolist(), pair_ids.tolist()))
+        # Built back to front so a pair listed more than once keeps its first position
+        position_by_bmu_and_pair = {key: position for position, key in reversed(list(enumerate(keys)))}
+        if is_offer_stack:
+            merit_order_prices = bid_or_offer_stack['offer'].to_numpy(dtype=np.float64)
+        else:
+            merit_order_prices = -bid_or_offer_stack['bid'].to_numpy(dtype=np.float64)
+
+        return cls(position_by_bmu_and_pair, merit_order_prices, is_offer_stack, bm_unit_ids, pair_ids)
+
+    def get_position(
+        self,
+        bm_unit_id: str,
+        pair_id: int
+    ) -> int | None:
+        return self.position_by_bmu_and_pair.get((bm_unit_id, pair_id))
+
+    def get_next_position_beyond_price(
+        self,
+        accepted_price: float
+    ) -> int:
+        """First position priced strictly beyond accepted_price in merit order: the cheapest dearer offer, or the dearest cheaper bid."""
+        merit_order_price = accepted_price if self.is_offer_stack else -accepted_price
+        # searchsorted orders NaN last, as sort_values put missing prices at the end of the stack
+        position = int(np.searchsorted(self.merit_order_prices, merit_order_price, side='right'))
+        if position == len(self.merit_order_prices) or not self.merit_order_prices[position] > merit_order_price:
+            raise ValueError(f"No {'offer' if self.is_offer_stack else 'bid'} in the stack is priced beyond the marginal price {accepted_price}")
+
+        return position
+
+    def get_headroom_positions(
+        self,
+        bid_offer_headroom: BidOfferHeadroom
+    ) -> np.ndarray:
+        """Position of each stack row in bid_offer_headroom, or -1 for rows without a BMU. Kept for the last headroom asked for."""
+        if self._headroom is not bid_offer_headroom:
+            has_bm_unit = pd.notna(self.bm_unit_ids)
+            headroom_positions = np.full(len(self), -1, dtype=np.intp)
+            headroom_positions[has_bm_unit] = bid_offer_headroom.get_positions(self.bm_unit_ids[has_bm_unit], self.pair_ids[has_bm_unit])
+            self._headroom = bid_offer_headroom
+            self._headroom_positions = headroom_positions
+        return self._headroom_positions
+
+    def __len__(self) -> int:
+        return len(self.merit_order_prices)
+
+class PeriodMeritOrder:
+    """
+    One period's submitted offers and bids in merit order with the headroom left on every pair. Built once per
+    period, it is shared by every recalculation of that period's stack, such as one per counterfactual NIV in a sweep.
+    """
+
+    def __init__(
+        self,
+        offers: MeritOrderIndex,
+        bids: MeritOrderIndex,
+        bid_offer_headroom: BidOfferHeadroom
+    ):
+        self.offers = offers
+        self.bids = bids
+        self.bid_offer_headroom = bid_offer_headroom
+
+def as_merit_order_index(
+    bid_or_offer_stack: pd.DataFrame | MeritOrderIndex
+) -> MeritOrderIndex:
+    if isinstance(bid_or_offer_stack, MeritOrderIndex):
+        return bid_or_offer_stack
+    return MeritOrderIndex.from_bid_or_offer_stack(bid_or_offer_stack)
@@ -0,0 +1,165 @@
+import numpy as np
+import pandas as pd
+
+from ancillary_files.settlement_calendar import get_first_period_indices, get_period_indices, get_settlement_dates_and_periods
+
+class MissingData:
+    """
+    Reason codes for missing settlement periods, held as one uint8 per period over a contiguous run of the
+    settlement calendar's period index. The run grows as periods are marked, so one instance can collect a
+    month or several years. add, update, len, in and iteration behave like the set of (settlement_date,
+    settlement_period) tuples this replaces.
+    """
+    # One bit per data source, so a period missing from several sources keeps every reason
+    STACK = 1
+    NIV = 2
+    MIDP = 4
+    BID_OFFER = 8
+    PHYSICAL = 16
+    UNSPECIFIED = 128
+    REASON_NAMES = {
+        STACK: 'stack',
+        NIV: 'niv',
+        MIDP: 'midp',
+        BID_OFFER: 'bid_offer',
+        PHYSICAL: 'physical',
+        UNSPECIFIED: 'unspecified'
+    }
+
+    def __init__(self):
+        self.first_period_index = 0
+        self.reasons = np.zeros(0, dtype=np.uint8)
+        self._first_period_index_by_date = {}
+
+    def mark(
+        self,
+        settlement_date: str,
+        settlement_period: int,
+        reason: int = UNSPECIFIED
+    ) -> None:
+        if settlement_date not in self._first_period_index_by_date:
+            self._first_period_index_by_date[settlement_date] = int(get_first_period_indices([pd.Timestamp(settlement_date)])[0])
+        self.mark_period_indices(np.array([self._first_period_index_by_date[settlement_date] + int(settlement_period) - 1]), reason)
+
+    def mark_periods(
+        self,
+        dates_and_periods,
+        reason: int = UNSPECIFIED
+    ) -> None:
+        dates_and_periods = list(dates_and_periods)
+        if not dates_and_periods:
+            return
+        settlement_dates, settlement_periods = zip(*dates_and_periods)
+        self.mark_period_indices(get_valid_period_indices(settlement_dates, settlement_periods)[0], reason)
+
+    def mark_period_indices(
+        self,
+        period_indices: np.ndarray,
+        reason: int
+    ) -> None:
+        if len(period_indices) == 0:
+            return
+        self._extend_to(int(period_indices.min()), int(period_indices.max()))
+        self.reasons[period_indices - self.first_period_index] |= np.uint8(reason)
+
+    def _extend_to(
+        self,
+        first_period_index: int,
+        last_period_index: int
+    ) -> None:
+        if len(self.reasons) == 0:
+            self.first_period_index = first_period_index
+            self.reasons = np.zeros(last_period_index - first_period_index + 1, dtype=np.uint8)
+            return
+        new_first_period_index = min(first_period_index, self.first_period_index)
+        new_last_period_index = max(last_period_index, self.first_period_index + len(self.reasons) - 1)
+        if new_first_period_index == self.first_period_index and new_last_period_index == self.first_period_index + len(self.reasons) - 1:
+            return
+        reasons = np.zeros(new_last_period_index - new_first_period_index + 1, dtype=np.uint8)
+        offset = self.first_period_index - new_first_period_index
+        reasons[offset:offset + len(self.reasons)] = self.reasons
+        self.first_period_index = new_first_period_index
+        self.reasons = reasons
+
+    def add(
+        self,
+        date_and_period: tuple[str, int]
+    ) -> None:
+        self.mark(*date_and_period)
+
+    def update(
+        self,
+        other
+    ) -> None:
+        if not isinstance(other, MissingData):
+            self.mark_periods(other)
+            return
+        missing_positions = np.flatnonzero(other.reasons)
+        for reason in np.unique(other.reasons[missing_positions]):
+            self.mark_period_indices(other.first_period_index + missing_positions[other.reasons[missing_positions] == reason], int(reason))
+
+    def get_period_indices(self) -> np.ndarray:
+        return self.first_period_index + np.flatnonzero(self.reasons)
+
+    def get_reasons(
+        self,
+        settlement_dates,
+        settlement_periods
+    ) -> np.ndarray:
+        # 0 for periods that are not missing, including rows without a usable date or period
+        period_indices, is_valid = get_valid_period_indices(settlement_dates, settlement_periods)
+        reasons = np.zeros(len(is_valid), dtype=np.uint8)
+        positions = period_indices - self.first_period_index
+        in_range = (positions >= 0) & (positions < len(self.reasons))
+        valid_rows = np.flatnonzero(is_valid)
+        reasons[valid_rows[in_range]] = self.reasons[positions[in_range]]
+
+        return reasons
+
+    def get_missing_mask(
+        self,
+        df: pd.DataFrame
+    ) -> np.ndarray:
+        return self.get_reasons(df['settlement_date'], df['settlement_period']) != 0
+
+    def to_dataframe(self) -> pd.DataFrame:
+        period_indices = self.get_period_indices()
+        settlement_dates, settlement_periods = get_settlement_dates_and_periods(period_indices)
+        reasons = self.reasons[period_indices - self.first_period_index]
+
+        return pd.DataFrame({
+            'settlement_date': settlement_dates,
+            'settlement_period': settlement_periods,
+            'missing_data_reasons': [self.get_reason_names(reason) for reason in reasons]
+        })
+
+    @classmethod
+    def get_reason_names(
+        cls,
+        reason: int
+    ) -> str:
+        return ', '.join(name for code, name in cls.REASON_NAMES.items() if reason & code)
+
+    def __contains__(self, date_and_period: tuple[str, int]) -> bool:
+        return bool(self.get_reasons([date_and_period[0]], [date_and_period[1]])[0])
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.reasons))
+
+    def __iter__(self):
+        settlement_dates, settlement_periods = get_settlement_dates_and_periods(self.get_period_indices())
+        return iter(zip(settlement_dates, settlement_periods.tolist()))
+
+def get_valid_period_indices(
+    settlement_dates,
+    settlement_periods
+) -> tuple[np.ndarray, np.ndarray]:
+    settlement_dates = settlement_dates if isinstance(settlement_dates, pd.Series) else pd.Series(list(settlement_dates))
+    settlement_periods = settlement_periods if isinstance(settlement_periods, pd.Series) else pd.Series(list(settlement_periods))
+    settlement_dates = pd.to_datetime(settlement_dates, errors='coerce').reset_index(drop=True)
+    settlement_periods = pd.to_numeric(settlement_periods, errors='coerce').reset_index(drop=True)
+    is_valid = (settlement_dates.notna() & settlement_periods.notna()).to_numpy()
+    if not is_valid.any():
+        return np.array([], dtype=np.int64), is_valid
+
+    return get_period_indices(settlement_dates[is_valid], settlement_periods[is_valid]), is_valid
@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+
+INDEX_COLUMNS = ['settlement_date', 'settlement_period', 'bm_unit']
+
+class PeriodIndexedData:
+    """Rows sorted by (settlement_date, settlement_period, bm_unit) so each period is one contiguous block."""
+
+    def __init__(self, data: pd.DataFrame):
+        if data.empty:
+            self.data = pd.DataFrame()
+            self.period_bounds = {}
+            return
+        data = data.copy()
+        data['settlement_date'] = data['settlement_date'].astype(str)
+        data['settlement_period'] = data['settlement_period'].astype(int)
+        self.data = data.sort_values(INDEX_COLUMNS, kind='stable', ignore_index=True)
+        settlement_dates = self.data['settlement_date'].to_numpy()
+        settlement_periods = self.data['settlement_period'].to_numpy()
+        period_changes = (settlement_dates[1:] != settlement_dates[:-1]) | (settlement_periods[1:] != settlement_periods[:-1])
+        block_starts = np.flatnonzero(np.r_[True, period_changes])
+        block_ends = np.r_[block_starts[1:], len(self.data)]
+        self.period_bounds = {
+            (settlement_dates[start], int(settlement_periods[start])): (int(start), int(end))
+            for start, end in zip(block_starts, block_ends)
+        }
+
+    def get_period(
+        self,
+        settlement_date: str,
+        settlement_period: int
+    ) -> pd.DataFrame:
+        if (settlement_date, settlement_period) not in self.period_bounds:
+            return pd.DataFrame()
+        start, end = self.period_bounds[(settlement_date, settlement_period)]
+        return self.data.iloc[start:end]
+
+    def __contains__(self, date_and_period: tuple[str, int]) -> bool:
+        return date_and_period in self.period_bounds
+
+class PeriodLookup:
+    """Row position of each (settlement_date, settlement_period) in a table with one row per period."""
+
+    def __init__(self, data: pd.DataFrame):
+        self.data = data.reset_index(drop=True)
+        if self.data.empty:
+            self.row_positions = {}
+            return
+        # Dates are normalised once here so callers can look periods up by their '%Y-%m-%d' strings
+        settlement_dates = pd.to_datetime(self.data['settlement_date']).dt.strftime('%Y-%m-%d').to_numpy()
+        settlement_periods = self.data['settlement_period'].to_numpy()
+        self.row_positions = {}
+        for row_position, date_and_period in enumerate(zip(settlement_dates, settlement_periods)):
+            # Keep the first row for a period, as the .values[0] lookups this replaces did
+            self.row_positions.setdefault((date_and_period[0], int(date_and_period[1])), row_position)
+
+    def get_rows(
+        self,
+        settlement_date: str,
+        settlement_period: int
+    ) -> pd.DataFrame:
+        if (settlement_date, settlement_period) not in self.row_positions:
+            return self.data.iloc[0:0]
+        row_position = self.row_positions[(settlement_date, settlement_period)]
+        return self.data.iloc[row_position:row_position + 1]
+
+    def get_value(
+        self,
+        settlement_date: str,
+        settlement_period: int,
+        column: str,
+        default=None
+    ):
+        if (settlement_date, settlement_period) not in self.row_positions:
+            return default
+        return self.data[column].iat[self.row_positions[(settlement_date, settlement_period)]]
+
+    def get_row_positions(
+        self,
+        dates_and_periods: list[tuple[str, int]]
+    ) -> np.ndarray:
+        return np.array([self.row_positions.get(date_and_period, -1) for date_and_period in dates_and_periods], dtype=np.int64)
+
+    def get_float_column(
+        self,
+        column: str,
+        row_positions: np.ndarray
+    ) -> np.ndarray:
+        # NaN where a period has no row, for row_positions from get_row_positions
+        if self.data.empty:
+            return np.full(len(row_positions), np.nan)
+        column_values = self.data[column].to_numpy(dtype=float)
+        return np.where(row_positions >= 0, column_values[np.maximum(row_positions, 0)], np.nan)
+
+    def __contains__(self, date_and_period: tuple[str, int]) -> bool:
+        return date_and_period in self.row_positions
+
+def as_period_lookup(data: pd.DataFrame | PeriodLookup) -> PeriodLookup:
+    if isinstance(data, PeriodLookup):
+        return data
+    return PeriodLookup(data)
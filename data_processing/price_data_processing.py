@@ -4,16 +4,17 @@ import pandas as pd
 from ancillary_files.excel_interaction import get_csv_filepaths, dataframes_to_excel
 from data_collection.elexon_interaction import get_full_midp_data, get_price_adjustment_data
 from elexonpy.api_client import ApiClient
+from data_processing.missing_data import MissingData
 from data_processing.stack_data_handler import check_missing_data
 
 async def get_ancillary_price_data_for_sp_calculation(
     api_client: ApiClient,
     settlement_dates_with_periods_per_day: dict[str, int],
-    missing_data = set[tuple[str, int]]
+    missing_data: MissingData
 ):
     mid_data = await get_market_index_price_data(settlement_dates_with_periods_per_day, api_client)
     missing_mid_data = check_missing_data(mid_data, settlement_dates_with_periods_per_day)
-    missing_data.update(missing_mid_data)
+    missing_data.mark_periods(missing_mid_data, MissingData.MIDP)
     
     price_adjustment_data = await get_price_adjustment_data(['settlement_date', 'settlement_period', 'buy_price_price_adjustment', 'sell_price_price_adjustment'], settlement_dates_with_periods_per_day, api_client)
     if price_adjustment_data.empty: 
@@ -0,0 +1,330 @@
+import numpy as np
+import pandas as pd
+
+CORE_COLUMNS = ['id', 'bid_offer_pair_id', 'so_flag', 'cadl_flag', 'original_price', 'volume', 'dmat_adjusted_volume']
+ARRAY_ATTRIBUTES = ['id_codes', 'bid_offer_pair_ids', 'so_flags', 'cadl_flags', 'original_prices', 'volumes', 'dmat_adjusted_volumes']
+
+class SettlementStack:
+    """
+    One settlement period's stack held as NumPy arrays, always in ascending (original_price, bid_offer_pair_id) order.
+
+    BMU ids are stored as integer codes into bm_unit_ids, with -1 for actions that have no BMU. Columns other
+    than the core ones are carried along untouched so the stack converts back to the DataFrame it came from.
+    """
+
+    def __init__(
+        self,
+        bm_unit_ids: np.ndarray,
+        id_codes: np.ndarray,
+        bid_offer_pair_ids: np.ndarray,
+        so_flags: np.ndarray,
+        cadl_flags: np.ndarray,
+        original_prices: np.ndarray,
+        volumes: np.ndarray,
+        dmat_adjusted_volumes: np.ndarray,
+        other_columns: dict[str, np.ndarray] | None = None,
+        columns: list[str] | None = None
+    ):
+        self.bm_unit_ids = bm_unit_ids
+        self.id_codes = id_codes
+        self.bid_offer_pair_ids = bid_offer_pair_ids
+        self.so_flags = so_flags
+        self.cadl_flags = cadl_flags
+        self.original_prices = original_prices
+        self.volumes = volumes
+        self.dmat_adjusted_volumes = dmat_adjusted_volumes
+        self.other_columns = other_columns if other_columns is not None else {}
+        self.columns = columns if columns is not None else CORE_COLUMNS + list(self.other_columns)
+
+    @classmethod
+    def from_dataframe(
+        cls,
+        settlement_stack_df: pd.DataFrame
+    ) -> 'SettlementStack':
+        if settlement_stack_df.empty:
+            return cls.empty_stack()
+        row_count = len(settlement_stack_df)
+
+        def get_column(column_name: str, default, dtype) -> np.ndarray:
+            if column_name not in settlement_stack_df.columns:
+                return np.full(row_count, default, dtype=dtype)
+            return settlement_stack_df[column_name].to_numpy(dtype=dtype, na_value=default)
+
+        id_codes, bm_unit_ids = pd.factorize(settlement_stack_df['id']) if 'id' in settlement_stack_df.columns else (np.full(row_count, -1), np.array([], dtype=object))
+        settlement_stack = cls(
+            np.asarray(bm_unit_ids, dtype=object),
+            id_codes.astype(np.int32),
+            get_column('bid_offer_pair_id', np.nan, np.float64),
+            settlement_stack_df['so_flag'].to_numpy() == True if 'so_flag' in settlement_stack_df.columns else np.zeros(row_count, dtype=bool),
+            settlement_stack_df['cadl_flag'].to_numpy() == True if 'cadl_flag' in settlement_stack_df.columns else np.zeros(row_count, dtype=bool),
+            get_column('original_price', np.nan, np.float64),
+            get_column('volume', 0.0, np.float64),
+            get_column('dmat_adjusted_volume', np.nan, np.float64),
+            {column: settlement_stack_df[column].to_numpy() for column in settlement_stack_df.columns if column not in CORE_COLUMNS},
+            list(settlement_stack_df.columns) + [column for column in CORE_COLUMNS if column not in settlement_stack_df.columns]
+        )
+
+        return settlement_stack.sorted()
+
+    @classmethod
+    def from_acceptances(
+        cls,
+        bm_unit_ids: list[str],
+        bid_offer_pair_ids: list[int],
+        original_prices: list[float],
+        volumes: list[float]
+    ) -> 'SettlementStack':
+        row_count = len(bm_unit_ids)
+        id_codes, unique_bm_unit_ids = pd.factorize(np.asarray(bm_unit_ids, dtype=object))
+        return cls(
+            np.asarray(unique_bm_unit_ids, dtype=object),
+            id_codes.astype(np.int32),
+            np.asarray(bid_offer_pair_ids, dtype=np.float64),
+            np.zeros(row_count, dtype=bool),
+            np.zeros(row_count, dtype=bool),
+            np.asarray(original_prices, dtype=np.float64),
+            np.asarray(volumes, dtype=np.float64),
+            np.full(row_count, np.nan)
+        )
+
+    @classmethod
+    def empty_stack(cls) -> 'SettlementStack':
+        return cls.from_acceptances([], [], [], [])
+
+    def __len__(self) -> int:
+        return len(self.volumes)
+
+    @property
+    def empty(self) -> bool:
+        return len(self.volumes) == 0
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [getattr(self, attribute) for attribute in ARRAY_ATTRIBUTES] + list(self.other_columns.values())
+        return sum(array.nbytes for array in arrays)
+
+    @property
+    def ids(self) -> np.ndarray:
+        lookup = np.append(self.bm_unit_ids, None)
+        return lookup[self.id_codes]
+
+    def get_bm_unit_id(self, position: int) -> str | None:
+        id_code = self.id_codes[position]
+        return None if id_code < 0 else self.bm_unit_ids[id_code]
+
+    def take(self, indexer) -> 'SettlementStack':
+        """Rows selected by a slice, boolean mask or ordered positions; slices share memory with this stack."""
+        return SettlementStack(
+            self.bm_unit_ids,
+            *[getattr(self, attribute)[indexer] for attribute in ARRAY_ATTRIBUTES],
+            {column: values[indexer] for column, values in self.other_columns.items()},
+            self.columns
+        )
+
+    def drop(self, positions) -> 'SettlementStack':
+        positions = np.unique(np.asarray(positions, dtype=np.intp))
+        # A run of rows at either end is dropped with a slice, so the result shares memory with this stack
+        if len(positions) == 0:
+            return self.take(slice(None))
+        if positions[-1] - positions[0] == len(positions) - 1:
+            if positions[0] == 0:
+                return self.take(slice(len(positions), None))
+            if positions[-1] == len(self) - 1:
+                return self.take(slice(0, positions[0]))
+        keep_mask = np.ones(len(self), dtype=bool)
+        keep_mask[positions] = False
+        return self.take(keep_mask)
+
+    def copy(self) -> 'SettlementStack':
+        return SettlementStack(
+            self.bm_unit_ids,
+            *[getattr(self, attribute).copy() for attribute in ARRAY_ATTRIBUTES],
+            {column: values.copy() for column, values in self.other_columns.items()},
+            self.columns
+        )
+
+    def sorted(self) -> 'SettlementStack':
+        # lexsort is stable and puts NaN last, matching sort_values(['original_price', 'bid_offer_pair_id'])
+        order = np.lexsort((self.bid_offer_pair_ids, self.original_prices))
+        if np.array_equal(order, np.arange(len(order))):
+            return self
+        return self.take(order)
+
+    def insert(
+        self,
+        new_actions: 'SettlementStack'
+    ) -> 'SettlementStack':
+        if new_actions.empty:
+            return self.copy()
+        new_actions = new_actions.sorted()
+        bm_unit_ids = pd.Index(self.bm_unit_ids).append(pd.Index(new_actions.bm_unit_ids)).unique()
+        # -1 codes pick the appended -1, so actions without a BMU stay without one
+        new_id_code_lookup = np.append(bm_unit_ids.get_indexer(new_actions.bm_unit_ids), -1)
+        recoded_new_id_codes = new_id_code_lookup[new_actions.id_codes].astype(np.int32)
+        new_arrays = [recoded_new_id_codes] + [getattr(new_actions, attribute) for attribute in ARRAY_ATTRIBUTES[1:]]
+        insert_positions = self.get_insert_positions(new_actions.original_prices, new_actions.bid_offer_pair_ids)
+        other_columns = {
+            column: np.insert(
+                values.astype(object), insert_positions,
+                new_actions.other_columns[column].astype(object) if column in new_actions.other_columns else np.full(len(new_actions), np.nan, dtype=object)
+            )
+            for column, values in self.other_columns.items()
+        }
+
+        return SettlementStack(
+            np.asarray(bm_unit_ids, dtype=object),
+            *[np.insert(getattr(self, attribute), insert_positions, new_array) for attribute, new_array in zip(ARRAY_ATTRIBUTES, new_arrays)],
+            other_columns,
+            self.columns
+        )
+
+    def get_insert_positions(
+        self,
+        original_prices: np.ndarray,
+        bid_offer_pair_ids: np.ndarray
+    ) -> np.ndarray:
+        # Each action goes after every action already in the stack with a lower or equal (original_price, bid_offer_pair_id),
+        # which is where a stable sort of the two stacks concatenated would put it. searchsorted orders NaN last, as lexsort does
+        first_positions = np.searchsorted(self.original_prices, original_prices, side='left')
+        end_positions = np.searchsorted(self.original_prices, original_prices, side='right')
+        insert_positions = end_positions.copy()
+        for i in np.flatnonzero(end_positions > first_positions):
+            insert_positions[i] = first_positions[i] + np.searchsorted(
+                self.bid_offer_pair_ids[first_positions[i]:end_positions[i]], bid_offer_pair_ids[i], side='right')
+
+        return insert_positions
+
+    def to_dataframe(self) -> pd.DataFrame:
+        if self.empty:
+            return pd.DataFrame()
+        bid_offer_pair_ids = self.bid_offer_pair_ids
+        if not np.isnan(bid_offer_pair_ids).any():
+            bid_offer_pair_ids = bid_offer_pair_ids.astype(np.int64)
+        core_columns = {
+            'id': self.ids,
+            'bid_offer_pair_id': bid_offer_pair_ids,
+            'so_flag': self.so_flags,
+            'cadl_flag': self.cadl_flags,
+            'original_price': self.original_prices,
+            'volume': self.volumes,
+            'dmat_adjusted_volume': self.dmat_adjusted_volumes
+        }
+
+        return pd.DataFrame({
+            column: core_columns[column] if column in core_columns else self.other_columns[column]
+            for column in self.columns
+        })
+
+def as_settlement_stack(
+    settlement_stack: pd.DataFrame | SettlementStack
+) -> SettlementStack:
+    if isinstance(settlement_stack, SettlementStack):
+        return settlement_stack
+    return SettlementStack.from_dataframe(settlement_stack)
+
+class SettlementStackTable:
+    """
+    Many settlement stacks concatenated into one set of arrays, with period i in rows
+    period_offsets[i]:period_offsets[i + 1]. BMU id codes index one bm_unit_ids array shared by all periods.
+    """
+
+    def __init__(
+        self,
+        bm_unit_ids: np.ndarray,
+        period_offsets: np.ndarray,
+        id_codes: np.ndarray,
+        bid_offer_pair_ids: np.ndarray,
+        so_flags: np.ndarray,
+        cadl_flags: np.ndarray,
+        original_prices: np.ndarray,
+        volumes: np.ndarray
+    ):
+        self.bm_unit_ids = bm_unit_ids
+        self.period_offsets = period_offsets
+        self.id_codes = id_codes
+        self.bid_offer_pair_ids = bid_offer_pair_ids
+        self.so_flags = so_flags
+        self.cadl_flags = cadl_flags
+        self.original_prices = original_prices
+        self.volumes = volumes
+
+    @classmethod
+    def from_settlement_stacks(
+        cls,
+        settlement_stacks: list[SettlementStack]
+    ) -> 'SettlementStackTable':
+        stack_lengths = np.array([len(settlement_stack) for settlement_stack in settlement_stacks], dtype=np.int64)
+        period_offsets = np.concatenate([[0], np.cumsum(stack_lengths)])
+        # Each stack's own BMU codes are shifted into one list of every stack's ids, then factorized across all stacks
+        local_bm_unit_ids = [settlement_stack.bm_unit_ids for settlement_stack in settlement_stacks]
+        local_id_counts = np.array([len(bm_unit_ids) for bm_unit_ids in local_bm_unit_ids], dtype=np.int64)
+        local_id_offsets = np.concatenate([[0], np.cumsum(local_id_counts)])[:len(local_id_counts)].astype(np.int64)
+        all_local_bm_unit_ids = np.concatenate(local_bm_unit_ids + [np.array([], dtype=object)])
+        global_codes_of_local_ids, bm_unit_ids = pd.factorize(all_local_bm_unit_ids)
+        local_id_codes = np.concatenate([settlement_stack.id_codes for settlement_stack in settlement_stacks] + [np.array([], dtype=np.int32)])
+        has_bmu = local_id_codes >= 0
+        id_codes = np.full(len(local_id_codes), -1, dtype=np.int32)
+        id_codes[has_bmu] = global_codes_of_local_ids[
+            np.repeat(local_id_offsets, stack_lengths)[has_bmu] + local_id_codes[has_bmu]
+        ]
+
+        def concatenate(attribute: str, dtype) -> np.ndarray:
+            return np.concatenate([getattr(settlement_stack, attribute) for settlement_stack in settlement_stacks] + [np.array([], dtype=dtype)])
+
+        return cls(
+            np.asarray(bm_unit_ids, dtype=object),
+            period_offsets,
+            id_codes,
+            concatenate('bid_offer_pair_ids', np.float64),
+            concatenate('so_flags', bool),
+            concatenate('cadl_flags', bool),
+            concatenate('original_prices', np.float64),
+            concatenate('volumes', np.float64)
+        )
+
+    @classmethod
+    def from_dataframes(
+        cls,
+        settlement_stack_dfs: list[pd.DataFrame]
+    ) -> 'SettlementStackTable':
+        # One concat instead of converting every period to a SettlementStack first
+        stack_lengths = np.array([len(settlement_stack_df) for settlement_stack_df in settlement_stack_dfs], dtype=np.int64)
+        period_offsets = np.concatenate([[0], np.cumsum(stack_lengths)])
+        non_empty_dfs = [settlement_stack_df for settlement_stack_df in settlement_stack_dfs if not settlement_stack_df.empty]
+        if not non_empty_dfs:
+            return cls(np.array([], dtype=object), period_offsets, *[np.array([], dtype=dtype) for dtype in (np.int32, np.float64, bool, bool, np.float64, np.float64)])
+        all_stacks_df = pd.concat(non_empty_dfs, ignore_index=True)
+        row_count = len(all_stacks_df)
+
+        def get_column(column_name: str, default, dtype) -> np.ndarray:
+            if column_name not in all_stacks_df.columns:
+                return np.full(row_count, default, dtype=dtype)
+            return all_stacks_df[column_name].to_numpy(dtype=dtype, na_value=default)
+
+        def get_flags(column_name: str) -> np.ndarray:
+            if column_name not in all_stacks_df.columns:
+                return np.zeros(row_count, dtype=bool)
+            return all_stacks_df[column_name].to_numpy() == True
+
+        id_codes, bm_unit_ids = pd.factorize(all_stacks_df['id']) if 'id' in all_stacks_df.columns else (np.full(row_count, -1), np.array([], dtype=object))
+        return cls(
+            np.asarray(bm_unit_ids, dtype=object),
+            period_offsets,
+            id_codes.astype(np.int32),
+            get_column('bid_offer_pair_id', np.nan, np.float64),
+            get_flags('so_flag'),
+            get_flags('cadl_flag'),
+            get_column('original_price', np.nan, np.float64),
+            get_column('volume', 0.0, np.float64)
+        )
+
+    @property
+    def period_count(self) -> int:
+        return len(self.period_offsets) - 1
+
+    @property
+    def period_ids(self) -> np.ndarray:
+        return np.repeat(np.arange(self.period_count), np.diff(self.period_offsets))
+
+    def __len__(self) -> int:
+        return len(self.volumes)
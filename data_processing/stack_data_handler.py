@@ -5,101 +5,103 @@ import numpy as np
 
 import data_processing.bm_unit as bm_unit
 import data_processing.boa as boa
+from ancillary_files.settlement_calendar import SettlementCalendar, get_period_indices
+from data_processing.merit_order_index import MeritOrderIndex, PeriodMeritOrder, as_merit_order_index
+from data_processing.settlement_stack import SettlementStack
 
-def get_bmus_one_period(
-    grouped_bid_offer_data_one_period, 
-    full_settlement_stack_one_period: pd.DataFrame, 
-    physical_volumes_by_bmu: dict[str, pd.Series]
-) -> dict[str, bm_unit.BMUnit]:
-    grouped_full_settlement_stack = full_settlement_stack_one_period.groupby('id')
-    bmus = populate_bmu_objects_one_period(grouped_bid_offer_data_one_period, grouped_full_settlement_stack, physical_volumes_by_bmu)
+def get_bid_offer_headroom_one_period(
+    bid_offer_data_one_period: pd.DataFrame, 
+    full_settlement_stack_one_period: SettlementStack, 
+    physical_volumes_by_bmu: pd.DataFrame
+) -> bm_unit.BidOfferHeadroom:
+    acceptance_volumes_by_bmu_and_pair = get_acceptance_volumes_by_bmu_and_pair(full_settlement_stack_one_period)
     
-    return bmus
+    return bm_unit.BidOfferHeadroom.from_bid_offer_data(bid_offer_data_one_period, acceptance_volumes_by_bmu_and_pair, physical_volumes_by_bmu)
 
-def populate_bmu_objects_one_period(
-    grouped_bid_offer_data_one_period, 
-    grouped_full_settlement_stack_one_period, 
-    physical_volumes_by_bmu):
-    bmus = {}
-    acceptance_volumes_by_bmu_by_pair = get_acceptance_volumes_by_bmu_by_pair(grouped_full_settlement_stack_one_period)
-    for bm_unit_id, bid_offer_pairs_df in grouped_bid_offer_data_one_period:
-        bid_offer_pairs = bid_offer_pairs_df.set_index('pair_id').to_dict('index')
-        factual_acceptance_volumes_by_pair = {pair_id: 0 for pair_id in bid_offer_pairs.keys()}
-        if bm_unit_id in acceptance_volumes_by_bmu_by_pair:
-            for pair_id, acceptance_volume in acceptance_volumes_by_bmu_by_pair[bm_unit_id].items():
-                factual_acceptance_volumes_by_pair[pair_id] = acceptance_volume
-                
-        bmu = bm_unit.BMUnit(bm_unit_id, bid_offer_pairs, factual_acceptance_volumes_by_pair, physical_volumes_by_bmu[bm_unit_id])
-        bmus[bm_unit_id] = bmu
-    
-    return bmus
-
-def get_acceptance_volumes_by_bmu_by_pair(grouped_full_settlement_stack):
-    acceptance_volumes_by_bmu_by_pair = {}
-    for bm_unit_id, boa_data_df in grouped_full_settlement_stack:
-        acceptance_volumes_by_pair = {}
-        for pair_id, pair_acceptances in boa_data_df.groupby('bid_offer_pair_id'):
-            acceptance_volumes_by_pair[pair_id] = pair_acceptances['volume'].sum()
-        acceptance_volumes_by_bmu_by_pair[bm_unit_id] = acceptance_volumes_by_pair
+def get_acceptance_volumes_by_bmu_and_pair(
+    full_settlement_stack: SettlementStack
+) -> pd.Series:
+    # Actions without a BMU or pair id are skipped, as a groupby on those columns would drop them
+    has_bmu_and_pair = (full_settlement_stack.id_codes >= 0) & ~np.isnan(full_settlement_stack.bid_offer_pair_ids)
+    bmu_and_pair_keys = pd.MultiIndex.from_arrays([
+        full_settlement_stack.bm_unit_ids[full_settlement_stack.id_codes[has_bmu_and_pair]],
+        full_settlement_stack.bid_offer_pair_ids[has_bmu_and_pair].astype(np.int64)
+    ], names=['bm_unit', 'pair_id'])
+    if bmu_and_pair_keys.empty:
+        return pd.Series([], index=bmu_and_pair_keys, name='volume', dtype=np.float64)
+    key_codes, unique_bmu_and_pair_keys = bmu_and_pair_keys.factorize()
+    # bincount adds each pair's volumes in stack order
+    acceptance_volumes = np.bincount(key_codes, weights=full_settlement_stack.volumes[has_bmu_and_pair], minlength=len(unique_bmu_and_pair_keys))
     
-    return acceptance_volumes_by_bmu_by_pair
+    return pd.Series(acceptance_volumes, index=unique_bmu_and_pair_keys, name='volume')
     
 def get_marginal_boa(
-    full_ascending_settlement_stack: pd.DataFrame, 
-    bid_or_offer_stack: pd.DataFrame
+    full_ascending_settlement_stack: SettlementStack, 
+    bid_or_offer_stack: pd.DataFrame | MeritOrderIndex
 ) -> boa.Boa:
-    ordered_unflagged_actions = full_ascending_settlement_stack[full_ascending_settlement_stack['so_flag'] == False]
-    if (bid_or_offer_stack['pair_id'] > 0).any():
-        ordered_unflagged_offers = ordered_unflagged_actions[ordered_unflagged_actions['bid_offer_pair_id'] > 0]
-        if ordered_unflagged_offers.empty:
+    unflagged_positions = np.flatnonzero(~full_ascending_settlement_stack.so_flags)
+    unflagged_pair_ids = full_ascending_settlement_stack.bid_offer_pair_ids[unflagged_positions]
+    if as_merit_order_index(bid_or_offer_stack).is_offer_stack:
+        ordered_unflagged_offer_positions = unflagged_positions[unflagged_pair_ids > 0]
+        if len(ordered_unflagged_offer_positions) == 0:
             marginal_boa = boa.Boa(0, 1, 0)
             return marginal_boa
-        marginal_plant_row = get_marginal_plant_offer_row(ordered_unflagged_offers)
-        if marginal_plant_row is None:
+        marginal_plant_position = get_marginal_plant_offer_position(full_ascending_settlement_stack, ordered_unflagged_offer_positions)
+        if marginal_plant_position is None:
             marginal_boa = boa.Boa(0, 1, 0)
             return marginal_boa
     else:
-        ordered_unflagged_bids = ordered_unflagged_actions[ordered_unflagged_actions['bid_offer_pair_id'] < 0]
-        if ordered_unflagged_bids.empty:
+        ordered_unflagged_bid_positions = unflagged_positions[unflagged_pair_ids < 0]
+        if len(ordered_unflagged_bid_positions) == 0:
             marginal_boa = boa.Boa(0, -1, 0)
             return marginal_boa
-        marginal_plant_row = get_marginal_plant_bid_row(ordered_unflagged_bids)
-        if marginal_plant_row is None:
+        marginal_plant_position = get_marginal_plant_bid_position(full_ascending_settlement_stack, ordered_unflagged_bid_positions)
+        if marginal_plant_position is None:
             marginal_boa = boa.Boa(0, -1, 0)
             return marginal_boa
     
-    marginal_plant_id = marginal_plant_row['id']
-    marginal_plant_bid_offer_pair_id = marginal_plant_row['bid_offer_pair_id']
-    marginal_plant_accepted_price = marginal_plant_row['original_price']
+    marginal_plant_id = full_ascending_settlement_stack.get_bm_unit_id(marginal_plant_position)
+    marginal_plant_bid_offer_pair_id = full_ascending_settlement_stack.bid_offer_pair_ids[marginal_plant_position]
+    marginal_plant_accepted_price = full_ascending_settlement_stack.original_prices[marginal_plant_position]
     marginal_boa = boa.Boa(marginal_plant_id, marginal_plant_bid_offer_pair_id, marginal_plant_accepted_price)
     
     return marginal_boa
 
-def get_marginal_plant_offer_row(
-    ordered_unflagged_offers: pd.DataFrame
-) -> pd.Series:
-    for i in range(len(ordered_unflagged_offers) - 1, -1, -1):
-        row = ordered_unflagged_offers.iloc[i]
-        plant_id = row['id']
-        plant_offer_id = row['bid_offer_pair_id']
-        dmat_adjusted_volume = row['dmat_adjusted_volume']
-        if plant_id is not None and plant_offer_id is not None and dmat_adjusted_volume > 0:
-            return row
+def get_marginal_plant_offer_position(
+    full_ascending_settlement_stack: SettlementStack,
+    ordered_unflagged_offer_positions: np.ndarray
+) -> int | None:
+    # Most expensive unflagged offer with a BMU and a positive DMAT adjusted volume
+    candidate_mask = (
+        (full_ascending_settlement_stack.id_codes[ordered_unflagged_offer_positions] >= 0) &
+        (full_ascending_settlement_stack.dmat_adjusted_volumes[ordered_unflagged_offer_positions] > 0)
+    )
+    candidate_positions = ordered_unflagged_offer_positions[candidate_mask]
     
-    return None
+    return int(candidate_positions[-1]) if len(candidate_positions) > 0 else None
 
-def get_marginal_plant_bid_row(
-    ordered_unflagged_bids: pd.DataFrame
-) -> pd.Series:
-    for i in range(len(ordered_unflagged_bids)):
-        row = ordered_unflagged_bids.iloc[i]
-        plant_id = row['id']
-        plant_bid_id = row['bid_offer_pair_id']
-        dmat_adjusted_volume = row['dmat_adjusted_volume']
-        if plant_id is not None and plant_bid_id is not None and dmat_adjusted_volume < 0:
-            return row
+def get_marginal_plant_bid_position(
+    full_ascending_settlement_stack: SettlementStack,
+    ordered_unflagged_bid_positions: np.ndarray
+) -> int | None:
+    # Cheapest unflagged bid with a BMU and a negative DMAT adjusted volume
+    candidate_mask = (
+        (full_ascending_settlement_stack.id_codes[ordered_unflagged_bid_positions] >= 0) &
+        (full_ascending_settlement_stack.dmat_adjusted_volumes[ordered_unflagged_bid_positions] < 0)
+    )
+    candidate_positions = ordered_unflagged_bid_positions[candidate_mask]
     
-    return None
+    return int(candidate_positions[0]) if len(candidate_positions) > 0 else None
+
+def get_period_merit_order(
+    bid_offer_data_one_period: pd.DataFrame,
+    bid_offer_headroom: bm_unit.BidOfferHeadroom
+) -> PeriodMeritOrder:
+    return PeriodMeritOrder(
+        MeritOrderIndex.from_bid_or_offer_stack(get_offer_stack_one_period(bid_offer_data_one_period)),
+        MeritOrderIndex.from_bid_or_offer_stack(get_bid_stack_one_period(bid_offer_data_one_period)),
+        bid_offer_headroom
+    )
 
 def get_offer_stack_one_period(
     bid_offer_data_one_period: pd.DataFrame
@@ -122,169 +124,150 @@ def get_bid_stack_one_period(
 def accept_balancing_actions_until_quota_met(
     energy_before: float, 
     energy_after: float, 
-    full_ascending_settlement_stack_one_period: pd.DataFrame,
-    bid_or_offer_stack: pd.DataFrame, 
-    bmus: list[bm_unit.BMUnit]
-) -> pd.DataFrame:
+    full_ascending_settlement_stack_one_period: SettlementStack,
+    bid_or_offer_stack: pd.DataFrame | MeritOrderIndex, 
+    bid_offer_headroom: bm_unit.BidOfferHeadroom
+) -> SettlementStack:
     energy_target = energy_after - energy_before
     
-    marginal_boa = get_marginal_boa(full_ascending_settlement_stack_one_period, bid_or_offer_stack)
-    marginal_plant_index = set_marginal_plant_index(marginal_boa, bid_or_offer_stack)
-    new_acceptances = add_new_bid_offer_acceptances(marginal_plant_index, bid_or_offer_stack, bmus, energy_target)
+    merit_order_index = as_merit_order_index(bid_or_offer_stack)
+    marginal_boa = get_marginal_boa(full_ascending_settlement_stack_one_period, merit_order_index)
+    marginal_plant_index = set_marginal_plant_index(marginal_boa, merit_order_index)
+    new_acceptances = add_new_bid_offer_acceptances(marginal_plant_index, merit_order_index, bid_offer_headroom, energy_target)
     ordered_settlement_stack = get_new_ordered_settlement_stack(new_acceptances, full_ascending_settlement_stack_one_period) 
      
     return ordered_settlement_stack
 
 def set_marginal_plant_index(
     marginal_boa: boa.Boa, 
-    bid_or_offer_stack : pd.DataFrame
+    bid_or_offer_stack : pd.DataFrame | MeritOrderIndex
 ) -> int:
     if marginal_boa.plant_id == 0:
         marginal_plant_index = marginal_boa.plant_id #If all actions are for system balancing, we then start accepting offers in merit order
     else:
-        marginal_boa_df = bid_or_offer_stack[
-            (bid_or_offer_stack['bm_unit'] == marginal_boa.plant_id) &
-            (bid_or_offer_stack['pair_id'] == marginal_boa.bid_offer_pair_id)
-        ]
-        if not marginal_boa_df.empty:
-            marginal_plant_index = marginal_boa_df.index[0]
-        else:
-            if bid_or_offer_stack['pair_id'].iloc[0] > 0:
-                higher_offers = bid_or_offer_stack[bid_or_offer_stack['offer'] > marginal_boa.accepted_price]
-                diff = higher_offers['offer'] - marginal_boa.accepted_price
-                marginal_plant_index = higher_offers[diff == diff.min()].index[0]
-            else:
-                lower_bids = bid_or_offer_stack[bid_or_offer_stack['bid'] < marginal_boa.accepted_price]
-                diff = marginal_boa.accepted_price - lower_bids['bid']
-                marginal_plant_index = lower_bids[diff == diff.min()].index[0]
+        merit_order_index = as_merit_order_index(bid_or_offer_stack)
+        marginal_plant_index = merit_order_index.get_position(marginal_boa.plant_id, marginal_boa.bid_offer_pair_id)
+        if marginal_plant_index is None:
+            # The marginal pair is not in the submitted stack, so start from the nearest price beyond it
+            marginal_plant_index = merit_order_index.get_next_position_beyond_price(marginal_boa.accepted_price)
         
     return marginal_plant_index
 
 def add_new_bid_offer_acceptances(
     marginal_plant_index: int, 
-    bid_or_offer_stack: pd.DataFrame, 
-    bmus: list[bm_unit.BMUnit], 
+    bid_or_offer_stack: pd.DataFrame | MeritOrderIndex, 
+    bid_offer_headroom: bm_unit.BidOfferHeadroom, 
     energy_target: float
-) -> list[pd.DataFrame]:
-    total_additional_volume_accepted = 0
-    new_acceptances = []
+) -> SettlementStack:
+    merit_order_index = as_merit_order_index(bid_or_offer_stack)
+    headroom_positions = merit_order_index.get_headroom_positions(bid_offer_headroom)
+    merit_order_positions = marginal_plant_index + np.flatnonzero(headroom_positions[marginal_plant_index:] >= 0)
+    if len(merit_order_positions) == 0:
+        return SettlementStack.empty_stack()
+    headroom_positions = headroom_positions[merit_order_positions]
+    remaining_volumes = bid_offer_headroom.remaining_volumes[headroom_positions]
     
-    for i in range(marginal_plant_index, len(bid_or_offer_stack)):
-        row = bid_or_offer_stack.iloc[i]
-        bm_unit_id = row['bm_unit']
-        if bm_unit_id is None: 
-            continue
-        pair_id = row['pair_id']
-        bm_unit = bmus[bm_unit_id]
-        remaining_volume_in_pair = bm_unit.remaining_volume_by_pair[pair_id]
+    # Bid volumes and targets are negative, so bids are negated to accept them with the offer arithmetic
+    is_bid_stack = merit_order_index.pair_ids[merit_order_positions[0]] < 0
+    sign = -1.0 if is_bid_stack else 1.0
+    accepted_volumes = sign * get_merit_order_acceptances(sign * remaining_volumes, sign * energy_target)
+    accepted_positions = np.flatnonzero(accepted_volumes != 0)
+    prices = (bid_offer_headroom.bids if is_bid_stack else bid_offer_headroom.offers)[headroom_positions[accepted_positions]]
+    accepted_stack_positions = merit_order_positions[accepted_positions]
         
-        if pair_id < 0:
-            volume_to_accept = max(remaining_volume_in_pair, energy_target - total_additional_volume_accepted) #Both values will always be negative
-            pair_price = bm_unit.bid_offer_pairs_submitted[pair_id]['bid']
-        else:
-            volume_to_accept = min(remaining_volume_in_pair, energy_target - total_additional_volume_accepted) #Both values will always be positive
-            pair_price = bm_unit.bid_offer_pairs_submitted[pair_id]['offer']
-        
-        total_additional_volume_accepted += volume_to_accept
-        if volume_to_accept != 0:
-            new_acceptance = pd.DataFrame([{'id': bm_unit_id, 
-                                            'bid_offer_pair_id': pair_id, 
-                                            'so_flag': False,
-                                            'original_price': pair_price, 
-                                            'volume': volume_to_accept}])
-            new_acceptances.append(new_acceptance)
-        if abs(total_additional_volume_accepted) >= abs(energy_target):
-            break
-        
-    return new_acceptances
+    return SettlementStack.from_acceptances(
+        merit_order_index.bm_unit_ids[accepted_stack_positions], merit_order_index.pair_ids[accepted_stack_positions], prices, accepted_volumes[accepted_positions])
 
-def get_new_ordered_settlement_stack(
-    new_acceptances: pd.DataFrame, 
-    full_ascending_settlement_stack_one_period: pd.DataFrame
-) -> pd.DataFrame:
-    non_empty_new_acceptances = [acceptance for acceptance in new_acceptances if acceptance.empty == False]
-    if len(non_empty_new_acceptances) == 0:
-        return full_ascending_settlement_stack_one_period.copy()
-    new_acceptances_df = pd.concat(non_empty_new_acceptances, ignore_index=True)
-    new_acceptances_df = new_acceptances_df.reindex(columns=full_ascending_settlement_stack_one_period.columns, fill_value=np.nan)
-    new_settlement_stack = pd.concat([full_ascending_settlement_stack_one_period, new_acceptances_df], ignore_index=True)
-    ordered_settlement_stack = new_settlement_stack.sort_values(by=['original_price', 'bid_offer_pair_id'], ascending=[True, True])
-    ordered_settlement_stack.reset_index(drop=True, inplace=True)
+def get_merit_order_acceptances(
+    remaining_volumes: np.ndarray,
+    energy_target: float
+) -> np.ndarray:
+    """Volume accepted from each pair in merit order, stopping at the pair that meets the target, which only gives what is still needed."""
+    cumulative_volumes = np.cumsum(remaining_volumes)
+    # Remaining volumes are never negative, so the cumulative volume is sorted and the pair that meets the target is a binary search away
+    last_accepted_position = int(np.searchsorted(cumulative_volumes, energy_target, side='left'))
+    if last_accepted_position == len(remaining_volumes):
+        return remaining_volumes.copy()
+    accepted_volumes = remaining_volumes[:last_accepted_position + 1].copy()
+    volume_accepted_before = cumulative_volumes[last_accepted_position - 1] if last_accepted_position > 0 else 0
+    accepted_volumes[last_accepted_position] = min(remaining_volumes[last_accepted_position], energy_target - volume_accepted_before)
     
-    return ordered_settlement_stack
+    return accepted_volumes
+
+def get_new_ordered_settlement_stack(
+    new_acceptances: SettlementStack, 
+    full_ascending_settlement_stack_one_period: SettlementStack
+) -> SettlementStack:
+    return full_ascending_settlement_stack_one_period.insert(new_acceptances)
 
 def remove_offers_until_quota_met(
     niv_with_npts: float, 
     niv_without_npts: float, 
-    ordered_settlement_stack_one_period : pd.DataFrame
-) -> tuple[pd.DataFrame, float]:
+    ordered_settlement_stack_one_period : SettlementStack
+) -> tuple[SettlementStack, float]:
     energy_surplus = niv_with_npts - niv_without_npts
-    total_offer_volume_removed = 0
-    row_indices_to_remove = []
-    
-    for i in range(len(ordered_settlement_stack_one_period) -1, -1, -1):
-        row = ordered_settlement_stack_one_period.iloc[i]
-        if row['volume'] == True:
-            continue
-        
-        accepted_offer_volume = ordered_settlement_stack_one_period.at[ordered_settlement_stack_one_period.index[i], 'volume']
-        
-        volume_to_remove = min(accepted_offer_volume, energy_surplus - total_offer_volume_removed)
-        total_offer_volume_removed += volume_to_remove
-        
-        if total_offer_volume_removed >= energy_surplus:
-            ordered_settlement_stack_one_period.at[ordered_settlement_stack_one_period.index[i], 'volume'] -= volume_to_remove
-            break
-        else:
-            row_indices_to_remove.append(ordered_settlement_stack_one_period.index[i])
-        
-    new_settlement_stack = ordered_settlement_stack_one_period.drop(index=row_indices_to_remove)
+    volumes = ordered_settlement_stack_one_period.volumes
+    # Offers are removed from the top of the stack down, passing over rows with a volume of exactly 1 as the row loop did
+    removal_order = np.flatnonzero(volumes != 1)[::-1]
+    removed_row_count, partial_volume_removed, total_offer_volume_removed = get_quota_cut(volumes[removal_order], energy_surplus)
+    if removed_row_count < len(removal_order):
+        volumes[removal_order[removed_row_count]] -= partial_volume_removed
+    new_settlement_stack = ordered_settlement_stack_one_period.drop(removal_order[:removed_row_count])
     
     return new_settlement_stack, total_offer_volume_removed
 
 def remove_bids_until_quota_met(
     niv_with_npts: float, 
     niv_without_npts: float, 
-    ordered_settlement_stack_one_period : pd.DataFrame
-) -> tuple[pd.DataFrame, float]:
+    ordered_settlement_stack_one_period : SettlementStack
+) -> tuple[SettlementStack, float]:
     energy_deficit = niv_with_npts - niv_without_npts
-    total_bid_volume_removed = 0
-    row_indices_to_remove = []
-    
-    for i in range(len(ordered_settlement_stack_one_period)):
-        row = ordered_settlement_stack_one_period.iloc[i]
-        if row['so_flag'] == True:
-            continue
-        
-        accepted_bid_volume = ordered_settlement_stack_one_period.at[ordered_settlement_stack_one_period.index[i], 'volume']
-        
-        volume_to_remove = max(accepted_bid_volume, energy_deficit - total_bid_volume_removed) #Both values will always be negative
-        total_bid_volume_removed += volume_to_remove
-        
-        if total_bid_volume_removed <= energy_deficit:
-            ordered_settlement_stack_one_period.at[ordered_settlement_stack_one_period.index[i], 'volume'] -= volume_to_remove
-            break
-        else:
-            row_indices_to_remove.append(ordered_settlement_stack_one_period.index[i])
-        
-    new_settlement_stack = ordered_settlement_stack_one_period.drop(row_indices_to_remove, axis=0)
+    volumes = ordered_settlement_stack_one_period.volumes
+    # Bids are removed from the bottom of the stack up, passing over SO flagged actions. Bid volumes and the deficit
+    # are negative, so they are negated to reuse the offer search
+    removal_order = np.flatnonzero(~ordered_settlement_stack_one_period.so_flags)
+    removed_row_count, partial_volume_removed, total_bid_volume_removed = get_quota_cut(-volumes[removal_order], -energy_deficit)
+    if removed_row_count < len(removal_order):
+        volumes[removal_order[removed_row_count]] += partial_volume_removed
+    new_settlement_stack = ordered_settlement_stack_one_period.drop(removal_order[:removed_row_count])
+
+    return new_settlement_stack, -total_bid_volume_removed
 
-    return new_settlement_stack, total_bid_volume_removed
+def get_quota_cut(
+    volumes_in_removal_order: np.ndarray,
+    quota: float
+) -> tuple[int, float, float]:
+    """
+    Rows are removed in order until the volume removed reaches the quota. Returns the number of rows removed outright,
+    the volume taken from the row that meets the quota (0 if none does) and the total volume removed.
+    """
+    cumulative_volumes = np.cumsum(volumes_in_removal_order)
+    # The running maximum is sorted even when volumes change sign, and its first value at or above the quota
+    # is the first row whose cumulative volume reaches it
+    removed_row_count = int(np.searchsorted(np.maximum.accumulate(cumulative_volumes), quota, side='left'))
+    if removed_row_count == len(volumes_in_removal_order):
+        return removed_row_count, 0.0, float(cumulative_volumes[-1]) if removed_row_count > 0 else 0.0
+    volume_removed_before_cut = float(cumulative_volumes[removed_row_count - 1]) if removed_row_count > 0 else 0.0
+    partial_volume_removed = min(float(volumes_in_removal_order[removed_row_count]), quota - volume_removed_before_cut)
+    
+    return removed_row_count, partial_volume_removed, volume_removed_before_cut + partial_volume_removed
 
 def check_missing_data(
     dataframe_to_check: pd.DataFrame,
     settlement_dates_with_periods_per_day: dict[str, int]
 ) -> set[tuple[str, int]]:
     dataframe_to_check_copy = dataframe_to_check.copy()
-    dataframe_to_check_copy['settlement_date'] = pd.to_datetime(dataframe_to_check_copy['settlement_date']).dt.date
-    complete_dates_and_periods = [
-        (datetime.datetime.strptime(settlement_date, '%Y-%m-%d').date(), settlement_period) 
-        for settlement_date, periods_per_day in settlement_dates_with_periods_per_day.items() 
-        for settlement_period in range(1, periods_per_day + 1)
-    ]
-    complete_dates_and_periods_set = set(complete_dates_and_periods)
-    present_dates_and_periods = set(zip(dataframe_to_check_copy['settlement_date'], dataframe_to_check_copy['settlement_period']))
-    missing_dates_and_periods = complete_dates_and_periods_set - present_dates_and_periods
+    settlement_dates = pd.to_datetime(dataframe_to_check_copy['settlement_date'])
+    dataframe_to_check_copy['settlement_date'] = settlement_dates.dt.date
+    settlement_calendar = SettlementCalendar(settlement_dates_with_periods_per_day)
+    has_date_and_period = settlement_dates.notna() & dataframe_to_check_copy['settlement_period'].notna()
+    present_period_indices = get_period_indices(
+        settlement_dates[has_date_and_period], dataframe_to_check_copy.loc[has_date_and_period, 'settlement_period'])
+    is_missing = ~np.isin(settlement_calendar.period_indices, present_period_indices)
+    missing_dates_and_periods = set(zip(
+        [datetime.datetime.strptime(settlement_date, '%Y-%m-%d').date() for settlement_date in settlement_calendar.settlement_dates[is_missing]],
+        settlement_calendar.settlement_periods[is_missing].tolist()
+    ))
     nan_rows = dataframe_to_check_copy[dataframe_to_check_copy.isna().any(axis=1)]
     nan_tuples = set(zip(nan_rows['settlement_date'], nan_rows['settlement_period']))
     missing_dates_and_periods.update(nan_tuples)
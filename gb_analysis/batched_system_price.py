@@ -0,0 +1,361 @@
+import operator
+
+import numpy as np
+
+from data_processing.settlement_stack import SettlementStackTable
+from gb_analysis.system_price_from_arrays import UNSET_FLAG, get_ranked_order
+
+class BatchedRankedSet:
+    """One side (buy or sell) of every period's ranked set, sorted by period and then rank."""
+
+    def __init__(
+        self,
+        settlement_stack_table: SettlementStackTable,
+        rows: np.ndarray
+    ):
+        self.period_ids = settlement_stack_table.period_ids[rows]
+        self.period_offsets = np.searchsorted(self.period_ids, np.arange(settlement_stack_table.period_count + 1))
+        self.id_codes = settlement_stack_table.id_codes[rows]
+        self.bid_offer_pair_ids = settlement_stack_table.bid_offer_pair_ids[rows]
+        self.so_flags = settlement_stack_table.so_flags[rows]
+        self.cadl_flags = settlement_stack_table.cadl_flags[rows]
+        self.original_prices = settlement_stack_table.original_prices[rows]
+        self.volumes = settlement_stack_table.volumes[rows]
+
+    def __len__(self) -> int:
+        return len(self.volumes)
+
+def get_new_system_prices(
+    settlement_stack_table: SettlementStackTable,
+    price_adjustments: np.ndarray,
+    market_index_prices: np.ndarray,
+    tlm_by_bmu: dict,
+    nivs_without_npts: np.ndarray
+) -> np.ndarray:
+    """
+    The Annex T pipeline of system_price_from_arrays applied to every period of the table at once.
+
+    Each stage runs over all periods together, using segment reductions where a stage reduces over a
+    ranked set and advancing every period by one step per pass where a stage walks its ranked sets in
+    order. Actions at the same price are ranked in the order sort_values gives them, so prices agree with
+    the per-period engines. Returns one price per period, in the table's period order.
+    """
+    period_count = settlement_stack_table.period_count
+    if period_count == 0:
+        return np.array([], dtype=np.float64)
+    buy_ranked_set, sell_ranked_set = get_ranked_sets(settlement_stack_table)
+    buy_dmat_volumes, sell_dmat_volumes = perform_de_minimis_tagging(buy_ranked_set, sell_ranked_set)
+    buy_arbitrage_volumes, sell_arbitrage_volumes = perform_arbitrage_tagging(buy_ranked_set, buy_dmat_volumes, sell_ranked_set, sell_dmat_volumes)
+    buy_second_stage_flags = get_second_stage_flags(buy_ranked_set, buy_arbitrage_volumes, np.greater)
+    sell_second_stage_flags = get_second_stage_flags(sell_ranked_set, sell_arbitrage_volumes, np.less)
+    buy_niv_volumes, sell_niv_volumes = perform_niv_tagging(buy_ranked_set, buy_arbitrage_volumes, sell_ranked_set, sell_arbitrage_volumes)
+
+    # Each period prices from one side only, so the chosen rows of both sides interleave by period alone
+    uses_buy_set = nivs_without_npts > 0
+    chosen_buy_rows = np.flatnonzero(uses_buy_set[buy_ranked_set.period_ids] & (buy_niv_volumes != 0))
+    chosen_sell_rows = np.flatnonzero(~uses_buy_set[sell_ranked_set.period_ids] & (sell_niv_volumes != 0))
+    period_ids = np.concatenate([buy_ranked_set.period_ids[chosen_buy_rows], sell_ranked_set.period_ids[chosen_sell_rows]])
+    order = np.argsort(period_ids, kind='stable')
+    period_ids = period_ids[order]
+    original_prices = np.concatenate([buy_ranked_set.original_prices[chosen_buy_rows], sell_ranked_set.original_prices[chosen_sell_rows]])[order]
+    niv_adjusted_volumes = np.concatenate([buy_niv_volumes[chosen_buy_rows], sell_niv_volumes[chosen_sell_rows]])[order]
+    second_stage_flags = np.concatenate([buy_second_stage_flags[chosen_buy_rows], sell_second_stage_flags[chosen_sell_rows]])[order]
+    id_codes = np.concatenate([buy_ranked_set.id_codes[chosen_buy_rows], sell_ranked_set.id_codes[chosen_sell_rows]])[order]
+
+    total_niv_adjusted_volumes = np.bincount(period_ids, weights=niv_adjusted_volumes, minlength=period_count)
+    final_prices, order = replace_prices_for_second_stage_flagged_actions(
+        period_ids, original_prices, niv_adjusted_volumes, second_stage_flags, market_index_prices, uses_buy_set)
+    niv_adjusted_volumes = niv_adjusted_volumes[order]
+    id_codes = id_codes[order]
+    par_limits = np.where(uses_buy_set, 1.0, -1.0)
+    par_adjusted_volumes, _ = get_volumes_up_to_limit(period_ids, niv_adjusted_volumes, par_limits, period_count)
+    tlm_by_id_code = np.array([tlm_by_bmu[bmu_id] if bmu_id in tlm_by_bmu else 1 for bmu_id in settlement_stack_table.bm_unit_ids] + [1], dtype=np.float64)
+    imbalance_prices = perform_final_imbalance_price_calculation(
+        period_ids, par_adjusted_volumes, final_prices, tlm_by_id_code[id_codes], price_adjustments, period_count)
+
+    return np.where(total_niv_adjusted_volumes == 0, market_index_prices, imbalance_prices)
+
+def get_ranked_sets(
+    settlement_stack_table: SettlementStackTable
+) -> tuple[BatchedRankedSet, BatchedRankedSet]:
+    period_ids = settlement_stack_table.period_ids
+    prices = settlement_stack_table.original_prices
+    period_count = settlement_stack_table.period_count
+    buy_rows = np.flatnonzero(settlement_stack_table.volumes >= 0) #System buying to increase generation
+    buy_rows = buy_rows[get_ranked_order_by_period(period_ids[buy_rows], prices[buy_rows], np.ones(period_count, dtype=bool))]
+    sell_rows = np.flatnonzero(settlement_stack_table.volumes < 0)
+    sell_rows = sell_rows[get_ranked_order_by_period(period_ids[sell_rows], prices[sell_rows], np.zeros(period_count, dtype=bool))]
+
+    return BatchedRankedSet(settlement_stack_table, buy_rows), BatchedRankedSet(settlement_stack_table, sell_rows)
+
+def get_ranked_order_by_period(
+    period_ids: np.ndarray,
+    prices: np.ndarray,
+    ascending: np.ndarray
+) -> np.ndarray:
+    """
+    Rows grouped by period, each period ranked on price as system_price_from_arrays.get_ranked_order ranks it,
+    ascending or descending per period. period_ids must be sorted. Where tied prices fall under sort_values'
+    quicksort depends on the prices around them, so periods with a tie are ranked one at a time and the rest in one lexsort.
+    """
+    rank_prices = np.where(ascending[period_ids], prices, -prices)
+    order = np.lexsort((rank_prices, period_ids))
+    sorted_periods = period_ids[order]
+    sorted_prices = rank_prices[order]
+    is_tied = (sorted_periods[1:] == sorted_periods[:-1]) & (
+        (sorted_prices[1:] == sorted_prices[:-1]) | (np.isnan(sorted_prices[1:]) & np.isnan(sorted_prices[:-1])))
+    tied_periods = np.unique(sorted_periods[1:][is_tied])
+    period_starts = np.searchsorted(period_ids, tied_periods, side='left')
+    period_ends = np.searchsorted(period_ids, tied_periods, side='right')
+    for period, period_start, period_end in zip(tied_periods.tolist(), period_starts.tolist(), period_ends.tolist()):
+        order[period_start:period_end] = period_start + get_ranked_order(prices[period_start:period_end], ascending[period])
+
+    return order
+
+def perform_de_minimis_tagging(
+    buy_ranked_set: BatchedRankedSet,
+    sell_ranked_set: BatchedRankedSet
+) -> tuple[np.ndarray, np.ndarray]:
+    total_buy_volumes = get_total_volume_by_period_bmu_and_pair(buy_ranked_set)
+    total_sell_volumes = get_total_volume_by_period_bmu_and_pair(sell_ranked_set)
+    buy_dmat_volumes = np.where((buy_ranked_set.volumes < 0.1) & (total_buy_volumes < 0.1), 0.0, buy_ranked_set.volumes)
+    sell_dmat_volumes = np.where((sell_ranked_set.volumes > -0.1) & (total_sell_volumes > -0.1), 0.0, sell_ranked_set.volumes)
+
+    return buy_dmat_volumes, sell_dmat_volumes
+
+def get_total_volume_by_period_bmu_and_pair(
+    ranked_set: BatchedRankedSet
+) -> np.ndarray:
+    if len(ranked_set) == 0:
+        return np.zeros(0)
+    _, pair_codes = np.unique(np.nan_to_num(ranked_set.bid_offer_pair_ids, nan=0), return_inverse=True)
+    bmu_code_count = int(ranked_set.id_codes.max()) + 2
+    keys = (ranked_set.period_ids.astype(np.int64) * bmu_code_count + ranked_set.id_codes + 1) * (pair_codes.max() + 1) + pair_codes
+    _, group_codes = np.unique(keys, return_inverse=True)
+    total_volumes = np.bincount(group_codes, weights=ranked_set.volumes)[group_codes]
+
+    return np.where(ranked_set.id_codes >= 0, total_volumes, ranked_set.volumes)
+
+def perform_arbitrage_tagging(
+    buy_ranked_set: BatchedRankedSet,
+    buy_dmat_volumes: np.ndarray,
+    sell_ranked_set: BatchedRankedSet,
+    sell_dmat_volumes: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    # Every pass moves each unfinished period one step through system_price_from_arrays.perform_arbitrage_tagging:
+    # start its next sell, skip a buy with no volume left, or match its current sell against its current buy
+    buy_prices = buy_ranked_set.original_prices
+    sell_prices = sell_ranked_set.original_prices
+    buy_volumes = buy_dmat_volumes.copy()
+    sell_volumes = sell_dmat_volumes.copy()
+    sell_index = sell_ranked_set.period_offsets[:-1].copy()
+    sell_end = sell_ranked_set.period_offsets[1:]
+    first_buy_index = buy_ranked_set.period_offsets[:-1].copy()
+    buy_end = buy_ranked_set.period_offsets[1:]
+    buy_index = first_buy_index.copy()
+    remaining_sell_volume = np.zeros(len(sell_index))
+    starting_sell = np.ones(len(sell_index), dtype=bool)
+    active = (sell_index < sell_end) & (first_buy_index < buy_end)
+    periods = np.flatnonzero(active)
+
+    while len(periods) > 0:
+        starting = periods[starting_sell[periods]]
+        starting_sell_volumes = sell_volumes[sell_index[starting]]
+        sell_index[starting[starting_sell_volumes == 0]] += 1
+        started = starting[starting_sell_volumes != 0]
+        remaining_sell_volume[started] = starting_sell_volumes[starting_sell_volumes != 0]
+        buy_index[started] = first_buy_index[started]
+        starting_sell[started] = False
+
+        matching = periods[~starting_sell[periods]]
+        current_buy = buy_index[matching]
+        current_sell = sell_index[matching]
+        sell_volume = remaining_sell_volume[matching]
+        has_buy = current_buy < buy_end[matching]
+        current_buy_or_first = np.where(has_buy, current_buy, 0)
+        buy_price = buy_prices[current_buy_or_first]
+        sell_price = sell_prices[current_sell]
+        buy_volume = buy_volumes[current_buy_or_first]
+        sell_finished = ~has_buy | ~(buy_price <= sell_price) | (sell_volume == 0)
+        skip_buy = ~sell_finished & (buy_volume == 0)
+        match = ~sell_finished & ~skip_buy
+
+        sell_value = -sell_price[match] * sell_volume[match]
+        buy_value = buy_price[match] * buy_volume[match]
+        volume_to_remove = np.minimum(-sell_volume[match], buy_volume[match])
+        buy_volumes[current_buy[match]] -= volume_to_remove
+        sell_volumes[current_sell[match]] += volume_to_remove
+        buy_covers_sell = buy_value >= sell_value
+        continuing = matching[match][~buy_covers_sell]
+        remaining_sell_volume[continuing] = sell_volume[match][~buy_covers_sell] + volume_to_remove[~buy_covers_sell]
+        buy_index[continuing] += 1
+        buy_index[matching[skip_buy]] += 1
+
+        # The next sell restarts from the first buy with volume left, which is the last buy reached or the one after it
+        covered = matching[match][buy_covers_sell]
+        first_buy_index[covered] = current_buy[match][buy_covers_sell]
+        finished = matching[sell_finished]
+        last_buy = current_buy[sell_finished]
+        previous_buy_has_volume = (last_buy > first_buy_index[finished]) & (buy_volumes[np.maximum(last_buy - 1, 0)] != 0)
+        first_buy_index[finished] = np.where(previous_buy_has_volume, last_buy - 1, last_buy)
+        next_sell = np.concatenate([covered, finished])
+        sell_index[next_sell] += 1
+        starting_sell[next_sell] = True
+
+        periods = periods[(sell_index[periods] < sell_end[periods]) & (first_buy_index[periods] < buy_end[periods])]
+
+    return buy_volumes, sell_volumes
+
+def get_second_stage_flags(
+    ranked_set: BatchedRankedSet,
+    arbitrage_adjusted_volumes: np.ndarray,
+    beyond_marginal_price
+) -> np.ndarray:
+    first_stage_unflagged_rows = np.flatnonzero(~ranked_set.so_flags & ~ranked_set.cadl_flags & (arbitrage_adjusted_volumes != 0))
+    first_stage_unflagged_periods = ranked_set.period_ids[first_stage_unflagged_rows]
+    # Sliced so a side with no unflagged action in any period gives an empty mask rather than [True]
+    is_last_in_period = np.append(first_stage_unflagged_periods[1:] != first_stage_unflagged_periods[:-1], True)[:len(first_stage_unflagged_periods)]
+    most_expensive_unflagged_prices = np.full(len(ranked_set.period_offsets) - 1, np.nan)
+    most_expensive_unflagged_prices[first_stage_unflagged_periods[is_last_in_period]] = ranked_set.original_prices[first_stage_unflagged_rows[is_last_in_period]]
+    has_unflagged_action = np.zeros(len(ranked_set.period_offsets) - 1, dtype=bool)
+    has_unflagged_action[first_stage_unflagged_periods] = True
+
+    row_has_unflagged_action = has_unflagged_action[ranked_set.period_ids]
+    second_stage_flags = beyond_marginal_price(ranked_set.original_prices, most_expensive_unflagged_prices[ranked_set.period_ids]).astype(np.int8)
+    second_stage_flags[row_has_unflagged_action & np.isnan(ranked_set.original_prices)] = UNSET_FLAG
+    second_stage_flags[~row_has_unflagged_action] = 1
+
+    return second_stage_flags
+
+def perform_niv_tagging(
+    buy_ranked_set: BatchedRankedSet,
+    buy_arbitrage_volumes: np.ndarray,
+    sell_ranked_set: BatchedRankedSet,
+    sell_arbitrage_volumes: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    period_count = len(buy_ranked_set.period_offsets) - 1
+    net_imbalances = (
+        np.bincount(buy_ranked_set.period_ids, weights=buy_arbitrage_volumes, minlength=period_count) +
+        np.bincount(sell_ranked_set.period_ids, weights=sell_arbitrage_volumes, minlength=period_count)
+    )
+    buy_volumes = buy_arbitrage_volumes.copy()
+    sell_volumes = sell_arbitrage_volumes.copy()
+    long_buy_periods = np.flatnonzero(net_imbalances > 0)
+    long_sell_periods = np.flatnonzero(~(net_imbalances > 0))
+    net_off_from_most_expensive(buy_volumes, buy_ranked_set.period_offsets, sell_volumes, sell_ranked_set.period_offsets, long_buy_periods, operator.le)
+    net_off_from_most_expensive(sell_volumes, sell_ranked_set.period_offsets, buy_volumes, buy_ranked_set.period_offsets, long_sell_periods, operator.ge)
+
+    return buy_volumes, sell_volumes
+
+def net_off_from_most_expensive(
+    long_volumes: np.ndarray,
+    long_period_offsets: np.ndarray,
+    short_volumes: np.ndarray,
+    short_period_offsets: np.ndarray,
+    periods: np.ndarray,
+    short_side_remains
+) -> None:
+    # One step of system_price_from_arrays.net_off_from_most_expensive per pass for every unfinished period
+    long_index = long_period_offsets[1:] - 1
+    long_start = long_period_offsets[:-1]
+    short_index = short_period_offsets[:-1].copy()
+    short_end = short_period_offsets[1:]
+    periods = periods[(long_index[periods] >= long_start[periods]) & (short_index[periods] < short_end[periods])]
+
+    while len(periods) > 0:
+        current_short = short_index[periods]
+        current_long = long_index[periods]
+        short_volume = short_volumes[current_short]
+        long_volume = long_volumes[np.maximum(current_long, 0)]
+        short_used_up = short_volume == 0
+        short_remains = ~short_used_up & short_side_remains(short_volume + long_volume, 0)
+        long_remains = ~short_used_up & ~short_remains
+
+        short_volumes[current_short[short_remains]] = short_volume[short_remains] + long_volume[short_remains]
+        long_volumes[current_long[short_remains]] = 0
+        long_index[periods[short_remains]] -= 1
+        long_volumes[current_long[long_remains]] = long_volume[long_remains] + short_volume[long_remains]
+        short_volumes[current_short[long_remains]] = 0
+        short_index[periods[short_used_up | long_remains]] += 1
+
+        periods = periods[(long_index[periods] >= long_start[periods]) & (short_index[periods] < short_end[periods])]
+
+def replace_prices_for_second_stage_flagged_actions(
+    period_ids: np.ndarray,
+    original_prices: np.ndarray,
+    niv_adjusted_volumes: np.ndarray,
+    second_stage_flags: np.ndarray,
+    market_index_prices: np.ndarray,
+    uses_buy_set: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    period_count = len(market_index_prices)
+    needs_replacement_price = np.bincount(period_ids, weights=second_stage_flags == 1, minlength=period_count) > 0
+    unflagged_rows = np.flatnonzero(second_stage_flags == 0)
+    unflagged_period_ids = period_ids[unflagged_rows]
+    volumes_for_replacement_price, reached = get_volumes_up_to_limit(
+        unflagged_period_ids, np.abs(niv_adjusted_volumes[unflagged_rows]), np.ones(period_count), period_count)
+    reached_period_ids = unflagged_period_ids[reached]
+    replacement_volumes = np.bincount(reached_period_ids, weights=volumes_for_replacement_price[reached], minlength=period_count)
+    replacement_costs = np.bincount(
+        reached_period_ids, weights=volumes_for_replacement_price[reached] * original_prices[unflagged_rows[reached]], minlength=period_count)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        replacement_prices = np.where(replacement_volumes != 0, replacement_costs / replacement_volumes, np.nan)
+    has_unflagged_action = np.bincount(unflagged_period_ids, minlength=period_count) > 0
+    replacement_prices = np.where(has_unflagged_action, replacement_prices, market_index_prices)
+
+    final_prices = np.where(second_stage_flags == 1, replacement_prices[period_ids], original_prices)
+    # Periods with repriced actions are re-ranked on final price, the others keep their order
+    order = np.arange(len(period_ids))
+    reranked_rows = np.flatnonzero(needs_replacement_price[period_ids])
+    order[reranked_rows] = reranked_rows[get_ranked_order_by_period(period_ids[reranked_rows], final_prices[reranked_rows], uses_buy_set)]
+
+    return final_prices[order], order
+
+def get_volumes_up_to_limit(
+    period_ids: np.ndarray,
+    volumes: np.ndarray,
+    volume_limits: np.ndarray,
+    period_count: int
+) -> tuple[np.ndarray, np.ndarray]:
+    # Walks every period's actions from the end of its ranked set in step, stopping each period once
+    # its running total passes its limit, as system_price_from_arrays.get_volumes_up_to_limit does
+    period_offsets = np.searchsorted(period_ids, np.arange(period_count + 1))
+    period_lengths = np.diff(period_offsets)
+    taken_volumes = np.zeros(len(volumes))
+    reached = np.zeros(len(volumes), dtype=bool)
+    running_totals = np.zeros(period_count)
+    periods = np.flatnonzero(period_lengths > 0)
+    steps_from_end = 0
+
+    while len(periods) > 0:
+        rows = period_offsets[periods + 1] - 1 - steps_from_end
+        step_volumes = volumes[rows]
+        step_totals = step_volumes + running_totals[periods]
+        limits = volume_limits[periods]
+        beyond_limit = np.where(limits > 0, step_totals > limits, step_totals < limits)
+        taken_volumes[rows] = np.where(beyond_limit, limits - running_totals[periods], step_volumes)
+        reached[rows] = True
+        running_totals[periods] = step_totals
+        steps_from_end += 1
+        periods = periods[~beyond_limit & (period_lengths[periods] > steps_from_end)]
+
+    return taken_volumes, reached
+
+def perform_final_imbalance_price_calculation(
+    period_ids: np.ndarray,
+    par_adjusted_volumes: np.ndarray,
+    final_prices: np.ndarray,
+    tlms: np.ndarray,
+    price_adjustments: np.ndarray,
+    period_count: int
+) -> np.ndarray:
+    par_tagged = par_adjusted_volumes != 0
+    tlm_adjusted_volumes = par_adjusted_volumes[par_tagged] * tlms[par_tagged]
+    tlm_adjusted_costs = tlm_adjusted_volumes * final_prices[par_tagged]
+    par_tagged_period_ids = period_ids[par_tagged]
+    total_tlm_adjusted_volumes = np.bincount(par_tagged_period_ids, weights=tlm_adjusted_volumes, minlength=period_count)
+    total_tlm_adjusted_costs = np.bincount(par_tagged_period_ids, weights=np.nan_to_num(tlm_adjusted_costs, nan=0), minlength=period_count)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        imbalance_prices = total_tlm_adjusted_costs / total_tlm_adjusted_volumes + price_adjustments
+
+    return imbalance_prices
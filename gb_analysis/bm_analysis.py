@@ -1,9 +1,11 @@
 import pandas as pd
 import data_collection.elexon_interaction as elexon_interaction
 import ancillary_files.datetime_functions as datetime_functions
+import ancillary_files.settlement_calendar as settlement_calendar
 import ancillary_files.excel_interaction as excel_interaction
 import calendar
 
+from data_processing.missing_data import MissingData
 from elexonpy.api_client import ApiClient
 
 async def calculate_balancing_costs_breakdown(
@@ -13,7 +15,7 @@ async def calculate_balancing_costs_breakdown(
 ) -> None:
     api_client = ApiClient()
     all_results = []
-    missing_data = set()
+    missing_data = MissingData()
     for year in years:
         for month in range(1, 13):
             month_start_date = f"{year}-{month:02d}-01"
@@ -96,7 +98,7 @@ async def get_bm_volume_by_ccgt(
     bm_units = pd.read_json('/Users/josephcary/Library/CloudStorage/OneDrive-Nexus365/First Year/Papers/NIV Chasing/Supporting Data/BM_Units.json')
     ccgt_set = set(bm_units[bm_units['fuelType'] == 'CCGT']['elexonBmUnit'].to_list())
     all_results = []
-    missing_data = set()
+    missing_data = MissingData()
     for year in years:
         for month in range(1, 13):
             month_start_date = f"{year}-{month:02d}-01"
@@ -181,6 +183,7 @@ async def calculate_number_of_boa_before_settlement_period(
 ) -> None:
     api_client = ApiClient()
     all_results = []
+    date_and_period_to_start_time = settlement_calendar.get_utc_start_times_by_date_and_period(years)
     for year in years:
         for month in range(1, 13):
             month_start_date = f"{year}-{month:02d}-01"
@@ -189,9 +192,6 @@ async def calculate_number_of_boa_before_settlement_period(
                 month_start_date,
                 month_end_date
             )
-            date_and_period_to_start_time = datetime_functions.get_settlement_date_period_to_utc_start_time_mapping(
-                years
-            )
             
             for settlement_date, settlement_dates_with_periods_per_day in settlement_dates_with_periods_per_day.items():
                 bid_offer_acceptance_data_by_date_and_period = await elexon_interaction.get_bid_offer_acceptance_data(
@@ -212,7 +212,7 @@ async def calculate_number_of_boa_before_settlement_period(
     excel_interaction.dataframes_to_excel([all_results_df], output_file_directory, output_file_name)
 
 def get_number_of_boa_before_settlement_period(
-    date_and_period_to_start_time: dict[tuple[str, int], str],
+    date_and_period_to_start_time: pd.Series,
     bid_offer_acceptance_data_by_date_and_period: dict[tuple[str, int], pd.DataFrame]
 ) -> pd.DataFrame:
     results = []
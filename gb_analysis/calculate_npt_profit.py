@@ -1,5 +1,5 @@
 import pandas as pd
-from ancillary_files.datetime_functions import get_settlement_date_period_to_utc_start_time_mapping
+from ancillary_files.settlement_calendar import get_utc_start_times_by_date_and_period
 from ancillary_files.excel_interaction import dataframes_to_excel
 
 def calculate_id_position(
@@ -47,12 +47,7 @@ def calculate_npt_welfare_from_id_prices(
     system_imbalance_df = pd.read_excel(system_imbalance_filepath)
     years = system_imbalance_df['settlement_date'].dt.year.unique()
     system_imbalance_df['settlement_date'] = pd.to_datetime(system_imbalance_df['settlement_date'], errors='coerce').dt.strftime('%Y-%m-%d')
-    settlement_date_period_to_utc_start_time_mapping = get_settlement_date_period_to_utc_start_time_mapping(years)
-    settlement_date_period_to_utc_start_time_mapping_df = pd.DataFrame([
-        (key[0], key[1], value) 
-        for key, value in settlement_date_period_to_utc_start_time_mapping.items()
-    ])
-    settlement_date_period_to_utc_start_time_mapping_df.columns = ['settlement_date', 'settlement_period', 'start_time']
+    settlement_date_period_to_utc_start_time_mapping_df = get_utc_start_times_by_date_and_period(years).reset_index()
     system_imbalance_df = system_imbalance_df.merge(
         settlement_date_period_to_utc_start_time_mapping_df,
         on=['settlement_date', 'settlement_period'],
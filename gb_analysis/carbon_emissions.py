@@ -1,12 +1,16 @@
+import numpy as np
 import pandas as pd
 import ancillary_files.excel_interaction as excel_interaction
+from data_processing.period_indexed_data import PeriodLookup, as_period_lookup
+from data_processing.settlement_stack import SettlementStack, as_settlement_stack
 
 def calculate_marginal_emissions(
-    full_ascending_settlement_stack_by_date_and_period: dict[tuple[str, int], pd.DataFrame],
-    new_settlement_stacks_by_date_and_period: dict[tuple[str, int], pd.DataFrame],
-    system_imbalance_with_and_without_npts_by_date_and_period: pd.DataFrame,
+    full_ascending_settlement_stack_by_date_and_period: dict[tuple[str, int], SettlementStack],
+    new_settlement_stacks_by_date_and_period: dict[tuple[str, int], SettlementStack],
+    system_imbalance_with_and_without_npts_by_date_and_period: pd.DataFrame | PeriodLookup,
     bmu_id_to_ci_mapping: dict[str, float]
 ) -> pd.DataFrame:
+    system_imbalance_lookup = as_period_lookup(system_imbalance_with_and_without_npts_by_date_and_period)
     mefs = []
     for (settlement_date, settlement_period), settlement_stack in full_ascending_settlement_stack_by_date_and_period.items():
         if (settlement_date, settlement_period) not in new_settlement_stacks_by_date_and_period:
@@ -14,15 +18,11 @@ def calculate_marginal_emissions(
             continue
         
         new_stack = new_settlement_stacks_by_date_and_period[(settlement_date, settlement_period)]
-        row = system_imbalance_with_and_without_npts_by_date_and_period.loc[
-            (system_imbalance_with_and_without_npts_by_date_and_period['settlement_date'] == settlement_date) &
-            (system_imbalance_with_and_without_npts_by_date_and_period['settlement_period'] == settlement_period)
-        ]
-        if row.empty:
+        if (settlement_date, settlement_period) not in system_imbalance_lookup:
             mefs.append((settlement_date, settlement_period, None, None))
             continue
-        system_imbalance = row['net_imbalance_volume'].values[0]
-        counterfactual_imbalance = row['counterfactual_niv'].values[0]
+        system_imbalance = system_imbalance_lookup.get_value(settlement_date, settlement_period, 'net_imbalance_volume')
+        counterfactual_imbalance = system_imbalance_lookup.get_value(settlement_date, settlement_period, 'counterfactual_niv')
         
         if system_imbalance is None or settlement_stack.empty:
             mefs.append((settlement_date, settlement_period, None, None))
@@ -41,20 +41,21 @@ def calculate_marginal_emissions(
         
 def get_mef_and_bmu_id(
     system_imbalance: float,
-    settlement_stack: pd.DataFrame,
+    settlement_stack: pd.DataFrame | SettlementStack,
     bmu_id_to_ci_mapping: dict[str, float]
 ) -> float | None:
+    settlement_stack = as_settlement_stack(settlement_stack)
     if settlement_stack.empty:
         return None
-    unflagged_settlement_stack = settlement_stack[settlement_stack['so_flag'] == False]
-    if unflagged_settlement_stack.empty:
+    unflagged_positions = np.flatnonzero(~settlement_stack.so_flags)
+    if len(unflagged_positions) == 0:
         return None, None
     if system_imbalance > 0:
-        marginal_action = unflagged_settlement_stack.iloc[0]
+        marginal_action_position = unflagged_positions[0]
     else:
-        marginal_action = unflagged_settlement_stack.iloc[-1]
+        marginal_action_position = unflagged_positions[-1]
     
-    marginal_action_bmu_id = marginal_action['id']
+    marginal_action_bmu_id = settlement_stack.get_bm_unit_id(marginal_action_position)
     
     if marginal_action_bmu_id in bmu_id_to_ci_mapping:
         mef = bmu_id_to_ci_mapping[marginal_action_bmu_id]
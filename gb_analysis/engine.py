@@ -1,11 +1,19 @@
+import asyncio
 import datetime
 import calendar
 
+import numpy as np
 import pandas as pd
 import ancillary_files.datetime_functions as datetime_functions
 import ancillary_files.excel_interaction as excel_interaction
 import data_collection.elexon_interaction as elexon_interaction
+import data_collection.mr1b_store as mr1b_store
 from  data_processing.price_data_processing import get_ancillary_price_data_for_sp_calculation
+from data_processing.bsc_roles import BscRoles
+from data_processing.imbalance_cube import ImbalanceCube
+from data_processing.missing_data import MissingData
+from data_processing.period_indexed_data import PeriodLookup
+from data_processing.settlement_stack import SettlementStack
 import gb_analysis.recalculate_niv as recalculate_niv
 import gb_analysis.recalculate_settlement_stack as recalculate_settlement_stack
 import gb_analysis.recalculate_balancing_cashflows as recalculate_balancing_cashflows
@@ -13,7 +21,8 @@ import gb_analysis.recalculate_imbalance_cashflows as recalculate_imbalance_cash
 import gb_analysis.calculate_npt_profit as calculate_npt_profit
 import gb_analysis.carbon_emissions as carbon_emissions
 from gb_analysis.summary import create_summary_table
-from gb_analysis.system_price_from_stack import get_new_system_prices_by_date_and_period 
+from gb_analysis.system_price_from_stack import get_new_system_prices_by_date_and_period, get_system_price_matrix
+from gb_analysis.month_pipeline import MonthInputs, run_month_pipeline
 from elexonpy.api_client import ApiClient
 
 async def run(
@@ -26,8 +35,15 @@ async def run(
     strict_npt: bool,
     strict_supplier: bool,
     strict_generator: bool,
-    zero_metered_volume_only: bool
+    zero_metered_volume_only: bool,
+    transport: str = 'elexonpy',
+    look_ahead_depth: int = 1,
+    memory_ceiling_gb: float | None = None,
+    workers: int = 1,
+    price_engine: str = 'pandas',
+    npt_removal_fractions: list[float] | None = None
 ) -> None:
+    """npt_removal_fractions, when given, also sweeps each month over those fractions of NPT imbalance volume removed and adds the period by fraction system prices as a sheet."""
     system_prices = []
     system_imbalances = []
     balancing_costs = []
@@ -39,22 +55,35 @@ async def run(
     intraday_cashflows = []
     npt_cashflows = []
     mefs = []
-    all_missing_data = set()
+    niv_sweep_system_prices = []
+    all_missing_data = MissingData()
     mr1b_filepaths = excel_interaction.get_excel_filepaths('/Users/josephcary/Library/CloudStorage/OneDrive-Nexus365/First Year/Data/Elexon/MR1B Excel Reports')
     filepath_dict = excel_interaction.create_filepath_dict(mr1b_filepaths)
-    bsc_id_to_npt_mapping = recalculate_niv.get_bsc_id_to_npt_mapping(bsc_roles_filepath, strict_npt)
-    bsc_id_to_supplier_mapping = recalculate_niv.get_bsc_roles_to_supplier_mapping(bsc_roles_filepath, strict_supplier)
-    bsc_id_to_generator_mapping = recalculate_niv.get_bsc_roles_to_generator_mapping(bsc_roles_filepath, strict_generator)
+    bsc_roles = BscRoles.load(bsc_roles_filepath)
+    bsc_id_to_npt_mapping = recalculate_niv.get_bsc_id_to_npt_mapping(bsc_roles, strict_npt)
+    bsc_id_to_supplier_mapping = recalculate_niv.get_bsc_roles_to_supplier_mapping(bsc_roles, strict_supplier)
+    bsc_id_to_generator_mapping = recalculate_niv.get_bsc_roles_to_generator_mapping(bsc_roles, strict_generator)
     tlms_by_bmu = excel_interaction.create_dict_from_excel(tlms_filepath, 'BM Unit ID', 'TLM')
     bmu_id_to_ci_dict = excel_interaction.create_dict_from_excel(bmu_to_carbon_intensity_filepath, 'BMU_ID', 'Carbon Intensity')
-    for year in years:
-        for month in months:
-            year_month = datetime.date(year, month, 1).strftime('%Y-%m')
-            mr1b_filepath = filepath_dict[year_month.replace('-', '_')]
-            await run_by_month(
-                month, year, bsc_id_to_npt_mapping, bsc_id_to_supplier_mapping, bsc_id_to_generator_mapping, tlms_by_bmu, bmu_id_to_ci_dict, 
-                mr1b_filepath, output_directory, system_prices, system_imbalances, balancing_costs, original_balancing_revenue, 
-                new_balancing_revenue, so_cashflows, supplier_cashflows, generator_cashflows, intraday_cashflows, npt_cashflows, mefs, all_missing_data, zero_metered_volume_only)
+    api_client = elexon_interaction.create_api_client(transport)
+    
+    async def fetch_month(year: int, month: int) -> MonthInputs:
+        year_month = datetime.date(year, month, 1).strftime('%Y-%m')
+        mr1b_filepath = filepath_dict[year_month.replace('-', '_')]
+        return await fetch_month_inputs(month, year, bsc_id_to_npt_mapping, mr1b_filepath, zero_metered_volume_only, api_client)
+    
+    def process_month(month_inputs: MonthInputs) -> None:
+        process_month_inputs(
+            month_inputs, bsc_id_to_npt_mapping, bsc_id_to_supplier_mapping, bsc_id_to_generator_mapping, tlms_by_bmu, bmu_id_to_ci_dict, 
+            output_directory, system_prices, system_imbalances, balancing_costs, original_balancing_revenue, 
+            new_balancing_revenue, so_cashflows, supplier_cashflows, generator_cashflows, intraday_cashflows, npt_cashflows, mefs, all_missing_data, workers, price_engine,
+            npt_removal_fractions, niv_sweep_system_prices)
+    
+    year_months = [(year, month) for year in years for month in months]
+    try:
+        await run_month_pipeline(year_months, fetch_month, process_month, look_ahead_depth, memory_ceiling_gb)
+    finally:
+        await elexon_interaction.close_api_client(api_client)
     
     system_prices_df = pd.concat(system_prices)
     system_imbalances_df = pd.concat(system_imbalances)
@@ -67,7 +96,7 @@ async def run(
     intraday_cashflows_df = pd.concat(intraday_cashflows)
     npt_cashflows_df = pd.concat(npt_cashflows)
     mefs_df = pd.concat(mefs)
-    missing_data_df = pd.DataFrame(list(all_missing_data), columns=['settlement_date', 'settlement_period'])
+    missing_data_df = all_missing_data.to_dataframe()
     summary_df = create_summary_table(system_prices_df, system_imbalances_df, balancing_costs_df, so_cashflows_df, supplier_cashflows_df, generator_cashflows_df, intraday_cashflows_df, mefs_df)
     
     sheet_names_dict = {
@@ -85,6 +114,8 @@ async def run(
         'NPT Cashflows': npt_cashflows_df,
         'MEFs': mefs_df
     }
+    if niv_sweep_system_prices:
+        sheet_names_dict['NIV Sweep System Prices'] = pd.concat(niv_sweep_system_prices)
     file_name = f'{years[0]}-{months[0]}_to_{years[-1]}-{months[-1]}_results'
     excel_interaction.dataframes_to_excel(sheet_names_dict.values(), output_directory, file_name, sheet_names_dict.keys())
     print("Completed all months")
@@ -111,34 +142,110 @@ async def run_by_month(
     intraday_cashflows: list,
     npt_cashflows: list,
     mefs: list,
-    all_missing_data: set[tuple[str, int]],
-    zero_metered_volume_only: bool
+    all_missing_data: MissingData,
+    zero_metered_volume_only: bool,
+    transport: str = 'elexonpy',
+    workers: int = 1,
+    price_engine: str = 'pandas',
+    npt_removal_fractions: list[float] | None = None,
+    niv_sweep_system_prices: list | None = None
 ) -> None:
+    api_client = elexon_interaction.create_api_client(transport)
+    try:
+        month_inputs = await fetch_month_inputs(month, year, bsc_roles_to_npt_mapping, mr1b_filepath, zero_metered_volume_only, api_client)
+    finally:
+        await elexon_interaction.close_api_client(api_client)
+    process_month_inputs(
+        month_inputs, bsc_roles_to_npt_mapping, bsc_roles_to_supplier_mapping, bsc_roles_to_generator_mapping, tlms_by_bmu, bmu_id_to_ci_mapping, 
+        output_directory, system_prices, system_imbalances, balancing_costs, original_balancing_revenue, 
+        new_balancing_revenue, so_cashflows, supplier_cashflows, generator_cashflows, intraday_cashflows, npt_cashflows, mefs, all_missing_data, workers, price_engine,
+        npt_removal_fractions, niv_sweep_system_prices)
+
+async def fetch_month_inputs(
+    month: int,
+    year: int,
+    bsc_roles_to_npt_mapping : dict[str, bool],
+    mr1b_filepath: str,
+    zero_metered_volume_only: bool,
+    api_client: ApiClient
+) -> MonthInputs:
     month_start_date = datetime.date(year, month, 1).strftime('%Y-%m-%d')
     _, last_day = calendar.monthrange(year, month)
     month_end_date = datetime.date(year, month, last_day).strftime('%Y-%m-%d')
     settlement_dates_with_periods_per_day = datetime_functions.get_settlement_dates_and_settlement_periods_per_day(month_start_date, month_end_date)
-    api_client = ApiClient()
-    missing_data_points = set()
+    missing_data_points = MissingData()
     
-    # Recalculate imbalance, stack, and system price
-    mr1b_df = pd.read_excel(mr1b_filepath)
-    mr1b_df = mr1b_df.map(lambda x: x.strip() if isinstance(x, str) else x)
+    mr1b_df = await asyncio.to_thread(mr1b_store.read_mr1b_month, year, month, mr1b_store.IMBALANCE_COLUMNS, mr1b_filepath)
+    imbalance_cube = await asyncio.to_thread(ImbalanceCube.from_mr1b, mr1b_df)
+    # Only the cube is kept, so the month's MR1B rows are freed while the Elexon data is fetched
+    del mr1b_df
     full_ascending_settlement_stack_by_date_and_period = await elexon_interaction.get_full_settlement_stacks_by_date_and_period(api_client, settlement_dates_with_periods_per_day, missing_data_points)
+    full_ascending_settlement_stack_by_date_and_period = {
+        date_and_period: SettlementStack.from_dataframe(settlement_stack_df)
+        for date_and_period, settlement_stack_df in full_ascending_settlement_stack_by_date_and_period.items()
+    }
     if zero_metered_volume_only:
-        system_imbalance_with_and_without_npts_df = await recalculate_niv.recalculate_niv_zero_metered_volume(settlement_dates_with_periods_per_day, mr1b_df, bsc_roles_to_npt_mapping, missing_data_points, api_client)
+        system_imbalance_with_and_without_npts_df = await recalculate_niv.recalculate_niv_zero_metered_volume(settlement_dates_with_periods_per_day, imbalance_cube, bsc_roles_to_npt_mapping, missing_data_points, api_client)
     else:
-        system_imbalance_with_and_without_npts_df = await recalculate_niv.recalculate_niv(settlement_dates_with_periods_per_day, mr1b_df, bsc_roles_to_npt_mapping, missing_data_points)
+        system_imbalance_with_and_without_npts_df = await recalculate_niv.recalculate_niv(settlement_dates_with_periods_per_day, imbalance_cube, bsc_roles_to_npt_mapping, missing_data_points, api_client)
     ancillary_price_data_for_sp_calculation = await get_ancillary_price_data_for_sp_calculation(api_client, settlement_dates_with_periods_per_day, missing_data_points)
-    new_settlement_stacks_by_date_and_period = await recalculate_settlement_stack.recalculate_stacks(
-        api_client, settlement_dates_with_periods_per_day, system_imbalance_with_and_without_npts_df, full_ascending_settlement_stack_by_date_and_period, missing_data_points)
+    bid_offer_and_physical_data = await elexon_interaction.get_bid_offer_and_physical_data(api_client, list(settlement_dates_with_periods_per_day.keys()))
+    print(f"Fetched data for {year}-{month}")
+    
+    return MonthInputs(
+        year, month, settlement_dates_with_periods_per_day, imbalance_cube, full_ascending_settlement_stack_by_date_and_period,
+        system_imbalance_with_and_without_npts_df, ancillary_price_data_for_sp_calculation, bid_offer_and_physical_data, missing_data_points)
+
+def process_month_inputs(
+    month_inputs: MonthInputs,
+    bsc_roles_to_npt_mapping : dict[str, bool],
+    bsc_roles_to_supplier_mapping : dict[str, bool],
+    bsc_roles_to_generator_mapping : dict[str, bool],
+    tlms_by_bmu: dict[str, float],
+    bmu_id_to_ci_mapping: dict[str, float],
+    output_directory: str, 
+    system_prices: list, 
+    system_imbalances: list, 
+    balancing_costs: list, 
+    original_balancing_revenue: list, 
+    new_balancing_revenue: list, 
+    so_cashflows: list, 
+    supplier_cashflows: list, 
+    generator_cashflows: list,
+    intraday_cashflows: list,
+    npt_cashflows: list,
+    mefs: list,
+    all_missing_data: MissingData,
+    workers: int = 1,
+    price_engine: str = 'pandas',
+    npt_removal_fractions: list[float] | None = None,
+    niv_sweep_system_prices: list | None = None
+) -> None:
+    year = month_inputs.year
+    month = month_inputs.month
+    imbalance_cube = month_inputs.imbalance_cube
+    missing_data_points = month_inputs.missing_data_points
+    full_ascending_settlement_stack_by_date_and_period = month_inputs.full_ascending_settlement_stack_by_date_and_period
+    system_imbalance_with_and_without_npts_df = month_inputs.system_imbalance_with_and_without_npts_df
+    ancillary_price_data_for_sp_calculation = month_inputs.ancillary_price_data_for_sp_calculation
+    
+    # Built once per month and shared by the stack, price and emissions calculations
+    system_imbalance_lookup = PeriodLookup(system_imbalance_with_and_without_npts_df)
+    ancillary_price_lookup = PeriodLookup(ancillary_price_data_for_sp_calculation)
+    
+    # Recalculate stack and system price
+    new_settlement_stacks_by_date_and_period = recalculate_settlement_stack.recalculate_stacks_from_data(
+        month_inputs.bid_offer_and_physical_data, month_inputs.settlement_dates_with_periods_per_day, system_imbalance_lookup, 
+        full_ascending_settlement_stack_by_date_and_period, missing_data_points, workers)
     new_system_prices_by_date_and_period_df = get_new_system_prices_by_date_and_period(
-        new_settlement_stacks_by_date_and_period, ancillary_price_data_for_sp_calculation, tlms_by_bmu, system_imbalance_with_and_without_npts_df)
+        new_settlement_stacks_by_date_and_period, ancillary_price_lookup, tlms_by_bmu, system_imbalance_lookup, price_engine)
     system_price_df = system_imbalance_with_and_without_npts_df[['settlement_date', 'settlement_period', 'system_sell_price']]
     recalculated_system_prices = system_price_df.merge(
         new_system_prices_by_date_and_period_df, on=['settlement_date', 'settlement_period'], 
         how='outer'
     )
+    if npt_removal_fractions is not None:
+        niv_sweep_system_prices_df = get_niv_sweep_system_prices(month_inputs, tlms_by_bmu, npt_removal_fractions)
     
     # Recalculate balancing cashflows
     balancing_costs_df = recalculate_balancing_cashflows.calculate_balancing_costs(full_ascending_settlement_stack_by_date_and_period, new_settlement_stacks_by_date_and_period)
@@ -147,11 +254,11 @@ async def run_by_month(
     
     # Recalculate imbalance cashflows
     npt_bsc_ids = [bsc_id for bsc_id, is_npt in bsc_roles_to_npt_mapping.items() if is_npt]
-    so_cashflows_df = recalculate_imbalance_cashflows.get_recalculated_imbalance_cashflows_SO(new_system_prices_by_date_and_period_df, mr1b_df, npt_bsc_ids)
-    supplier_cashflows_df = recalculate_imbalance_cashflows.recalculate_imbalance_cashflows_by_bsc_party_type(bsc_roles_to_supplier_mapping, new_system_prices_by_date_and_period_df, mr1b_df, npt_bsc_ids)
-    generator_cashflows_df = recalculate_imbalance_cashflows.recalculate_imbalance_cashflows_by_bsc_party_type(bsc_roles_to_generator_mapping, new_system_prices_by_date_and_period_df, mr1b_df, npt_bsc_ids)
-    npt_cashflows_df = recalculate_imbalance_cashflows.calculate_net_npt_cashflow(bsc_roles_to_npt_mapping, mr1b_df)
-    marginal_emissions_df = carbon_emissions.calculate_marginal_emissions(full_ascending_settlement_stack_by_date_and_period, new_settlement_stacks_by_date_and_period, system_imbalance_with_and_without_npts_df, bmu_id_to_ci_mapping)
+    so_cashflows_df = recalculate_imbalance_cashflows.get_recalculated_imbalance_cashflows_SO(new_system_prices_by_date_and_period_df, imbalance_cube, npt_bsc_ids)
+    supplier_cashflows_df = recalculate_imbalance_cashflows.recalculate_imbalance_cashflows_by_bsc_party_type(bsc_roles_to_supplier_mapping, new_system_prices_by_date_and_period_df, imbalance_cube, npt_bsc_ids)
+    generator_cashflows_df = recalculate_imbalance_cashflows.recalculate_imbalance_cashflows_by_bsc_party_type(bsc_roles_to_generator_mapping, new_system_prices_by_date_and_period_df, imbalance_cube, npt_bsc_ids)
+    npt_cashflows_df = recalculate_imbalance_cashflows.calculate_net_npt_cashflow(bsc_roles_to_npt_mapping, imbalance_cube)
+    marginal_emissions_df = carbon_emissions.calculate_marginal_emissions(full_ascending_settlement_stack_by_date_and_period, new_settlement_stacks_by_date_and_period, system_imbalance_lookup, bmu_id_to_ci_mapping)
     
     npt_intraday_position = calculate_npt_profit.calculate_id_position(system_imbalance_with_and_without_npts_df, ancillary_price_data_for_sp_calculation)
     supplier_generator_id_positions = npt_intraday_position.copy()
@@ -170,7 +277,7 @@ async def run_by_month(
     generator_cashflows_df = excel_interaction.process_df_for_output(generator_cashflows_df, missing_data_points)
     npt_welfare_df = excel_interaction.process_df_for_output(npt_welfare, missing_data_points)
     marginal_emissions_df = excel_interaction.process_df_for_output(marginal_emissions_df, missing_data_points)
-    missing_data_df = pd.DataFrame(list(missing_data_points), columns=['settlement_date', 'settlement_period'])
+    missing_data_df = missing_data_points.to_dataframe()
     missing_data_df = excel_interaction.order_by_settlement_date_and_period(missing_data_df)
     summary_df = create_summary_table(
         system_prices_df, system_imbalances_df, balancing_costs_df, so_cashflows_df, supplier_cashflows_df, generator_cashflows_df,
@@ -192,10 +299,16 @@ async def run_by_month(
         'NPT Welfare': npt_welfare_df,
         'Marginal Emissions Factors': marginal_emissions_df
     }
+    if npt_removal_fractions is not None:
+        niv_sweep_system_prices_df = excel_interaction.process_df_for_output(niv_sweep_system_prices_df, missing_data_points)
+        sheet_names_dict['NIV Sweep System Prices'] = niv_sweep_system_prices_df
     
     excel_interaction.dataframes_to_excel(
         sheet_names_dict.values(), output_directory, f'{year}-{month}', sheet_names_dict.keys())
     print(f"Completed {year}-{month}")
+    request_statistics = elexon_interaction.get_request_statistics()
+    print(f"Elexon requests: {request_statistics['completed_requests']} completed, {request_statistics['requests_per_second']:.1f} req/s, "
+          f"{request_statistics['throttled_responses']} throttled, concurrency limit {request_statistics['concurrency_limit']}")
     
     # Append to lists
     system_prices.append(recalculated_system_prices)
@@ -209,8 +322,24 @@ async def run_by_month(
     intraday_cashflows.append(intraday_cashflow_df)
     npt_cashflows.append(npt_welfare_df)
     mefs.append(marginal_emissions_df)
+    if npt_removal_fractions is not None and niv_sweep_system_prices is not None:
+        niv_sweep_system_prices.append(niv_sweep_system_prices_df)
     all_missing_data.update(missing_data_points)
-    
+
+def get_niv_sweep_system_prices(
+    month_inputs: MonthInputs,
+    tlms_by_bmu: dict[str, float],
+    npt_removal_fractions = recalculate_settlement_stack.NPT_REMOVAL_FRACTIONS
+) -> pd.DataFrame:
+    """System prices for one month with each fraction of NPT imbalance volume removed, as a period by fraction matrix."""
+    counterfactual_nivs_df = recalculate_settlement_stack.get_npt_removal_counterfactual_nivs(month_inputs.system_imbalance_with_and_without_npts_df, npt_removal_fractions)
+    counterfactual_niv_lookup = PeriodLookup(counterfactual_nivs_df)
+    swept_settlement_stacks_by_date_and_period = recalculate_settlement_stack.sweep_stacks_from_data(
+        month_inputs.bid_offer_and_physical_data, month_inputs.settlement_dates_with_periods_per_day, month_inputs.system_imbalance_with_and_without_npts_df,
+        month_inputs.full_ascending_settlement_stack_by_date_and_period, counterfactual_niv_lookup, month_inputs.missing_data_points)
+
+    return get_system_price_matrix(swept_settlement_stacks_by_date_and_period, counterfactual_niv_lookup, month_inputs.ancillary_price_data_for_sp_calculation, tlms_by_bmu)
+
 async def get_niv_results_zero_mv(
     years: list[int],
     months: list[int],
@@ -218,7 +347,7 @@ async def get_niv_results_zero_mv(
     strict_npt: bool,
     output_directory: str
 ) -> None:
-    all_missing_data = set()
+    all_missing_data = MissingData()
     mr1b_filepaths = excel_interaction.get_excel_filepaths('/Users/josephcary/Library/CloudStorage/OneDrive-Nexus365/First Year/Data/Elexon/MR1B Excel Reports')
     filepath_dict = excel_interaction.create_filepath_dict(mr1b_filepaths)
     bsc_id_to_npt_mapping = recalculate_niv.get_bsc_id_to_npt_mapping(bsc_roles_filepath, strict_npt)
@@ -232,9 +361,9 @@ async def get_niv_results_zero_mv(
             _, last_day = calendar.monthrange(year, month)
             month_end_date = datetime.date(year, month, last_day).strftime('%Y-%m-%d')
             settlement_dates_with_periods_per_day = datetime_functions.get_settlement_dates_and_settlement_periods_per_day(month_start_date, month_end_date)
-            missing_data_points = set()
-            mr1b_df = pd.read_excel(mr1b_filepath)
-            mr1b_df = mr1b_df.map(lambda x: x.strip() if isinstance(x, str) else x)
+            missing_data_points = MissingData()
+            mr1b_df = mr1b_store.read_mr1b_month(
+                year, month, ['Settlement Date', 'Settlement Period', 'Party ID', 'Energy Imbalance Vol', 'Credited Energy Vol'], mr1b_filepath)
             zero_mv_niv_one_month = await recalculate_niv.recalculate_niv_zero_metered_volume(
                 settlement_dates_with_periods_per_day,
                 mr1b_df,
@@ -258,22 +387,25 @@ def determine_supplier_net_position(
 ) -> None:
     mr1b_filepaths = excel_interaction.get_excel_filepaths('/Users/josephcary/Library/CloudStorage/OneDrive-Nexus365/First Year/Data/Elexon/MR1B Excel Reports')
     filepath_dict = excel_interaction.create_filepath_dict(mr1b_filepaths)
-    bsc_id_to_strict_supplier_mapping = recalculate_niv.get_bsc_roles_to_supplier_mapping(bsc_roles_filepath, True)
-    bsc_id_to_loose_supplier_mapping = recalculate_niv.get_bsc_roles_to_supplier_mapping(bsc_roles_filepath, False)
+    bsc_roles = BscRoles.load(bsc_roles_filepath)
     combined_results = []
     for year in years:
         for month in months:
             year_month = datetime.date(year, month, 1).strftime('%Y-%m')
             mr1b_filepath = filepath_dict[year_month.replace('-', '_')]
-            mr1b_df = pd.read_excel(mr1b_filepath)
-            mr1b_df = mr1b_df.map(lambda x: x.strip() if isinstance(x, str) else x)
-            strict_supplier_mr1b_df = mr1b_df[mr1b_df['Party ID'].map(bsc_id_to_strict_supplier_mapping) == True]
-            loose_supplier_mr1b_df = mr1b_df[mr1b_df['Party ID'].map(bsc_id_to_loose_supplier_mapping) == True]
-            strict_supplier_grouped = strict_supplier_mr1b_df.groupby(['Settlement Date', 'Settlement Period'])['Energy Imbalance Vol'].sum().reset_index()
-            strict_supplier_grouped.columns = ['settlement_date', 'settlement_period', 'strict_supplier_total_imbalance']
-            loose_supplier_grouped = loose_supplier_mr1b_df.groupby(['Settlement Date', 'Settlement Period'])['Energy Imbalance Vol'].sum().reset_index()
-            loose_supplier_grouped.columns = ['settlement_date', 'settlement_period', 'loose_supplier_total_imbalance']
-            combined_df = strict_supplier_grouped.merge(loose_supplier_grouped, on=['settlement_date', 'settlement_period'], how='outer')
+            mr1b_df = mr1b_store.read_mr1b_month(
+                year, month, ['Settlement Date', 'Settlement Period', 'Party ID', 'Energy Imbalance Vol'], mr1b_filepath)
+            imbalance_cube = ImbalanceCube.from_mr1b(mr1b_df)
+            imbalance_cube.add_bsc_roles(bsc_roles)
+            supplier_totals = {}
+            has_supplier_rows = np.zeros(len(imbalance_cube), dtype=bool)
+            for role, column_name in [('strict_supplier', 'strict_supplier_total_imbalance'), ('supplier', 'loose_supplier_total_imbalance')]:
+                supplier_mask = imbalance_cube.get_role_mask(role)
+                has_role_rows = imbalance_cube.get_period_totals(imbalance_cube.row_counts, supplier_mask) > 0
+                supplier_totals[column_name] = np.where(
+                    has_role_rows, imbalance_cube.get_period_totals(imbalance_cube.energy_imbalance_volumes, supplier_mask), np.nan)
+                has_supplier_rows |= has_role_rows
+            combined_df = imbalance_cube.to_dataframe(has_supplier_rows, supplier_totals)
             combined_results.append(combined_df)
             print(f"Determined supplier net positions for {year}-{month}")
     
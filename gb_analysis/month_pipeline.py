@@ -0,0 +1,75 @@
+import asyncio
+from collections import deque
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+from data_processing.imbalance_cube import ImbalanceCube
+from data_processing.missing_data import MissingData
+from data_processing.period_indexed_data import PeriodIndexedData
+from data_processing.settlement_stack import SettlementStack
+
+BYTES_PER_GB = 1024 ** 3
+
+@dataclass
+class MonthInputs:
+    year: int
+    month: int
+    settlement_dates_with_periods_per_day: dict[str, int]
+    imbalance_cube: ImbalanceCube
+    full_ascending_settlement_stack_by_date_and_period: dict[tuple[str, int], SettlementStack]
+    system_imbalance_with_and_without_npts_df: pd.DataFrame
+    ancillary_price_data_for_sp_calculation: pd.DataFrame
+    bid_offer_and_physical_data: dict[str, PeriodIndexedData]
+    missing_data_points: MissingData = field(default_factory=MissingData)
+
+    def memory_usage(self) -> int:
+        dataframes = [
+            self.system_imbalance_with_and_without_npts_df,
+            self.ancillary_price_data_for_sp_calculation,
+            *[period_indexed_data.data for period_indexed_data in self.bid_offer_and_physical_data.values()]
+        ]
+        dataframe_bytes = sum(int(df.memory_usage(deep=True).sum()) for df in dataframes)
+        settlement_stack_bytes = sum(stack.nbytes for stack in self.full_ascending_settlement_stack_by_date_and_period.values())
+        return dataframe_bytes + settlement_stack_bytes + self.imbalance_cube.nbytes
+
+async def run_month_pipeline(
+    year_months: list[tuple[int, int]],
+    fetch_month,
+    process_month,
+    look_ahead_depth: int = 1,
+    memory_ceiling_gb: float | None = None
+) -> None:
+    """
+    Fetch up to look_ahead_depth months ahead while the current month is processed in a worker thread.
+
+    fetch_month(year, month) is a coroutine returning MonthInputs and process_month(month_inputs) is a
+    blocking function. A look_ahead_depth of 0 fetches and processes months strictly in turn. New
+    prefetches are held back while months already fetched but not yet processed use more than
+    memory_ceiling_gb, although the next month to process is always fetched.
+    """
+    months_to_fetch = deque(year_months)
+    fetch_tasks = deque()
+
+    def get_prefetched_memory_gb() -> float:
+        prefetched_bytes = sum(task.result().memory_usage() for task in fetch_tasks if task.done() and task.exception() is None)
+        return prefetched_bytes / BYTES_PER_GB
+
+    def start_fetches(limit: int) -> None:
+        while months_to_fetch and len(fetch_tasks) < limit:
+            if fetch_tasks and memory_ceiling_gb is not None and get_prefetched_memory_gb() >= memory_ceiling_gb:
+                print(f"Prefetched months exceed the {memory_ceiling_gb} GB memory ceiling, holding back further fetches")
+                return
+            year, month = months_to_fetch.popleft()
+            fetch_tasks.append(asyncio.create_task(fetch_month(year, month)))
+
+    try:
+        while months_to_fetch or fetch_tasks:
+            start_fetches(max(look_ahead_depth, 1))
+            month_inputs = await fetch_tasks.popleft()
+            start_fetches(look_ahead_depth)
+            await asyncio.to_thread(process_month, month_inputs)
+            del month_inputs
+    finally:
+        for task in fetch_tasks:
+            task.cancel()
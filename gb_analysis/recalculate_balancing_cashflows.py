@@ -1,20 +1,23 @@
+import numpy as np
 import pandas as pd
 
+from data_processing.settlement_stack import SettlementStack, as_settlement_stack
+
 def calculate_balancing_costs(
-    original_settlement_stacks_by_date_and_period: dict[tuple[str, int], pd.DataFrame], 
-    new_settlement_stacks_by_date_and_period : dict[tuple[str, int], pd.DataFrame]
+    original_settlement_stacks_by_date_and_period: dict[tuple[str, int], SettlementStack], 
+    new_settlement_stacks_by_date_and_period : dict[tuple[str, int], SettlementStack]
 ) -> pd.DataFrame:
     balancing_costs = []
     for (settlement_date, settlement_period), settlement_stack in original_settlement_stacks_by_date_and_period.items():
         if settlement_stack.empty:
             balancing_cost = 0
         else:
-            balancing_cost = (settlement_stack['original_price']*settlement_stack['volume']).sum()
+            balancing_cost = get_balancing_cost(settlement_stack)
         new_settlement_stack = new_settlement_stacks_by_date_and_period[(settlement_date, settlement_period)]
         if new_settlement_stack.empty:
             new_balancing_cost = 0
         else:
-            new_balancing_cost = (new_settlement_stack['original_price']*new_settlement_stack['volume']).sum()
+            new_balancing_cost = get_balancing_cost(new_settlement_stack)
         balancing_costs.append((settlement_date, settlement_period, balancing_cost, new_balancing_cost))
     
     balancing_costs_df = pd.DataFrame(balancing_costs, columns=[
@@ -25,9 +28,16 @@ def calculate_balancing_costs(
     
     return balancing_costs_df
 
+def get_balancing_cost(
+    settlement_stack: pd.DataFrame | SettlementStack
+) -> float:
+    settlement_stack = as_settlement_stack(settlement_stack)
+    # nansum matches Series.sum, which skips actions without a price
+    return np.nansum(settlement_stack.original_prices * settlement_stack.volumes)
+
 def get_original_and_new_balancing_revenue_dfs(
-    original_settlement_stacks_by_date_and_period: dict[tuple[str, int], pd.DataFrame],
-    new_settlement_stacks_by_date_and_period: dict[tuple[str, int], pd.DataFrame]
+    original_settlement_stacks_by_date_and_period: dict[tuple[str, int], SettlementStack],
+    new_settlement_stacks_by_date_and_period: dict[tuple[str, int], SettlementStack]
 ) -> tuple[pd.DataFrame, pd.DataFrame]:
     original_balancing_revenue_df = get_balancing_revenue_df(original_settlement_stacks_by_date_and_period)
     new_balancing_revenue_df = get_balancing_revenue_df(new_settlement_stacks_by_date_and_period)
@@ -35,19 +45,22 @@ def get_original_and_new_balancing_revenue_dfs(
     return original_balancing_revenue_df, new_balancing_revenue_df
 
 def get_balancing_revenue_df(
-    settlement_stacks_by_date_and_period: dict[tuple[str, int], pd.DataFrame]
+    settlement_stacks_by_date_and_period: dict[tuple[str, int], SettlementStack]
 ) -> pd.DataFrame:
     df_list = []
-    for (settlement_date, settlement_period), df in settlement_stacks_by_date_and_period.items():
-        if df.empty:
+    for (settlement_date, settlement_period), settlement_stack in settlement_stacks_by_date_and_period.items():
+        settlement_stack = as_settlement_stack(settlement_stack)
+        if settlement_stack.empty:
             df_list.append(pd.DataFrame([[settlement_date, settlement_period, '', 0]], columns=['settlement_date', 'settlement_period', 'bmu_group', 'revenue']))
         else:
-            df_copy = df.copy()
-            df_copy['bmu_group'] = df_copy['id'].str[0]
-            df_copy['revenue'] = df_copy['original_price'] * df_copy['volume']
-            df_copy['settlement_date'] = settlement_date
-            df_copy['settlement_period'] = settlement_period
-            df_list.append(df_copy[['settlement_date', 'settlement_period', 'bmu_group', 'revenue']])
+            # The group is the first character of the BMU id, looked up once per unique BMU rather than per action
+            bmu_groups = np.append([bm_unit_id[0] if isinstance(bm_unit_id, str) and bm_unit_id else None for bm_unit_id in settlement_stack.bm_unit_ids], None)
+            df_list.append(pd.DataFrame({
+                'settlement_date': settlement_date,
+                'settlement_period': settlement_period,
+                'bmu_group': bmu_groups[settlement_stack.id_codes],
+                'revenue': settlement_stack.original_prices * settlement_stack.volumes
+            }))
     
     combined_df = pd.concat(df_list, ignore_index=True)
     
@@ -1,130 +1,98 @@
+import numpy as np
 import pandas as pd
 import gb_analysis.recalculate_niv as recalculate_niv
 import ancillary_files.excel_interaction as excel_interaction
+import data_collection.mr1b_store as mr1b_store
+from data_processing.bsc_roles import BscRoles
+from data_processing.imbalance_cube import ImbalanceCube, as_imbalance_cube
+
+SO_PARTY_CLASS = 'so'
 
 def get_recalculated_imbalance_cashflows_SO(
     recalculated_system_price_df: pd.DataFrame, 
-    mr1b_data_df : pd.DataFrame,
+    mr1b_data: pd.DataFrame | ImbalanceCube,
     npt_ids: list[str],
     zero_metered_volume_only: bool,
     recalculated_system_price_column_name: str = 'recalculated_system_price'
 ) -> pd.DataFrame:
-    current_net_cashflow_df = calculate_current_net_cashflow(mr1b_data_df) #Positive implies revenue for SO
-    recalculated_mr1b_data = set_npt_imbalance_volume_to_zero(mr1b_data_df, npt_ids, zero_metered_volume_only)
-    recalculated_system_price_by_date_and_period = recalculated_system_price_df.set_index(
-        ['settlement_date', 'settlement_period'])[recalculated_system_price_column_name].to_dict()
-    recalculated_imbalance_cashflows = recalculate_imbalance_cashflows_SO(recalculated_mr1b_data, recalculated_system_price_by_date_and_period)
-    current_net_cashflow_df['settlement_date'] = pd.to_datetime(current_net_cashflow_df['settlement_date']).dt.strftime('%Y-%m-%d')
-    cashflows_df = current_net_cashflow_df.merge(recalculated_imbalance_cashflows, on=['settlement_date', 'settlement_period'])
-    
-    return cashflows_df
-
-def calculate_current_net_cashflow(
-    mr1b_data_df: pd.DataFrame
-) -> pd.DataFrame:
-    imbalance_cashflow_by_date_and_period = []
-    mr1b_data_df_copy = mr1b_data_df.copy()
-    for settlement_date, mr1b_data_by_date in mr1b_data_df_copy.groupby('Settlement Date'):
-        for settlement_period, mr1b_data_by_period in mr1b_data_by_date.groupby('Settlement Period'):
-            imbalance_cashflow = mr1b_data_by_period['Imbalance Charge'].sum()
-            imbalance_cashflow_by_date_and_period.append((settlement_date, settlement_period, imbalance_cashflow))
-    
-    imbalance_cashflow_by_date_and_period_df = pd.DataFrame(imbalance_cashflow_by_date_and_period, columns=['settlement_date', 'settlement_period', 'energy_imbalance_cashflow'])
-    
-    return imbalance_cashflow_by_date_and_period_df
-
-def set_npt_imbalance_volume_to_zero(
-    mr1b_raw_data: pd.DataFrame,
-    npt_ids: list[str],
-    zero_metered_volume_only: bool
-) -> pd.DataFrame:
-    recalculated_mr1b_data = mr1b_raw_data.copy()
-    npt_ids_set = set(npt_ids)
-    if zero_metered_volume_only:
-        credited_energy_vol_column_name = 'Credited Energy Vol' if 'Credited Energy Vol' in recalculated_mr1b_data.columns else 'CreditedEnergyVol'
-        zero_mv_npt_mask = (recalculated_mr1b_data['Party ID'].isin(npt_ids_set)) & (recalculated_mr1b_data[credited_energy_vol_column_name] == 0)
-        recalculated_mr1b_data.loc[zero_mv_npt_mask, 'Energy Imbalance Vol'] = 0
-    else:
-        recalculated_mr1b_data.loc[recalculated_mr1b_data['Party ID'].isin(npt_ids_set), 'Energy Imbalance Vol'] = 0
-    
-    return recalculated_mr1b_data
-
-def recalculate_imbalance_cashflows_SO(
-    recalculated_mr1b_data: pd.DataFrame, 
-    recalculated_system_price_by_date_and_period : dict[tuple[str, int], float]
-) -> pd.DataFrame:
-    recalculated_imbalance_cashflow_by_date_and_period = []
-    for settlement_date, recalclated_mr1b_data_by_settlement_date in recalculated_mr1b_data.groupby('Settlement Date'):
-        for settlement_period, recalculated_mr1b_data_by_settlement_period in recalclated_mr1b_data_by_settlement_date.groupby('Settlement Period'):
-            if type(settlement_date) is not str: settlement_date = settlement_date.strftime('%Y-%m-%d')
-            if (settlement_date, settlement_period) not in recalculated_system_price_by_date_and_period:
-                continue
-            recalculated_system_price = recalculated_system_price_by_date_and_period[(settlement_date, settlement_period)]
-            recalculated_imbalance_cashflow = -(recalculated_mr1b_data_by_settlement_period['Energy Imbalance Vol']*recalculated_system_price).sum()
-            recalculated_imbalance_cashflow_by_date_and_period.append((settlement_date, settlement_period, recalculated_imbalance_cashflow))
-    
-    recalculated_imbalance_cashflow_by_date_and_period_df = pd.DataFrame(recalculated_imbalance_cashflow_by_date_and_period, columns=['settlement_date', 'settlement_period', 'recalculated_energy_imbalance_cashflow'])
-    
-    return recalculated_imbalance_cashflow_by_date_and_period_df
+    return get_imbalance_cashflows_by_party_class(
+        mr1b_data, recalculated_system_price_df, {SO_PARTY_CLASS: None}, 
+        {recalculated_system_price_column_name: zero_metered_volume_only}, npt_ids, {recalculated_system_price_column_name: ''})[SO_PARTY_CLASS]
 
 def recalculate_imbalance_cashflows_by_bsc_party_type(
     bsc_party_ids_to_type_mapping: dict[str, bool], 
     recalculated_system_price_df: pd.DataFrame, 
-    mr1b_data_df : pd.DataFrame,
+    mr1b_data: pd.DataFrame | ImbalanceCube,
     npt_ids: list[str],
     zero_metered_volume_only: bool,
     recalculated_system_price_column_name: str = 'recalculated_system_price'
 ) -> pd.DataFrame:
-    mr1b_df_bsc_type_only = mr1b_data_df[mr1b_data_df['Party ID'].map(bsc_party_ids_to_type_mapping) == True]
-    recalculated_system_price_by_date_and_period = recalculated_system_price_df.set_index(
-        ['settlement_date', 'settlement_period'])[recalculated_system_price_column_name].to_dict()
-    recalculated_imbalance_cashflow_by_date_and_period = get_old_and_new_cashflows_by_bsc_party_type(
-        mr1b_df_bsc_type_only, recalculated_system_price_by_date_and_period, npt_ids, zero_metered_volume_only)
-    
-    return recalculated_imbalance_cashflow_by_date_and_period
+    return get_imbalance_cashflows_by_party_class(
+        mr1b_data, recalculated_system_price_df, {'party_type': bsc_party_ids_to_type_mapping}, 
+        {recalculated_system_price_column_name: zero_metered_volume_only}, npt_ids, {recalculated_system_price_column_name: ''})['party_type']
 
-def get_old_and_new_cashflows_by_bsc_party_type(
-    mr1b_data_by_party_type: pd.DataFrame, 
-    recalculated_system_price_by_date_and_period: dict[tuple[str, int], pd.DataFrame],
+def get_imbalance_cashflows_by_party_class(
+    mr1b_data: pd.DataFrame | ImbalanceCube,
+    system_prices_df: pd.DataFrame,
+    party_class_mappings: dict[str, dict[str, bool] | None],
+    zero_metered_volume_only_by_price_column: dict[str, bool],
     npt_ids: list[str],
-    zero_metered_volume_only: bool
-) -> pd.DataFrame:
-    recalculated_imbalance_cashflow_by_date_and_period = []
-    mr1b_data_copy = mr1b_data_by_party_type.copy()
-    recalculated_mr1b_data = set_npt_imbalance_volume_to_zero(mr1b_data_copy, npt_ids, zero_metered_volume_only)
-    for settlement_date, recalclated_mr1b_data_by_settlement_date in recalculated_mr1b_data.groupby('Settlement Date'):
-        if type(settlement_date) is not str: settlement_date = settlement_date.strftime('%Y-%m-%d')
-        for settlement_period, recalculated_mr1b_data_by_settlement_period in recalclated_mr1b_data_by_settlement_date.groupby('Settlement Period'):
-            if (settlement_date, settlement_period) not in recalculated_system_price_by_date_and_period:
-                continue
-            recalculated_system_price = recalculated_system_price_by_date_and_period[(settlement_date, settlement_period)]
-            original_imbalance_cashflow = -recalculated_mr1b_data_by_settlement_period['Imbalance Charge'].sum() # - sign to ensure that positive is profit for party
-            recalculated_imbalance_cashflow = (recalculated_mr1b_data_by_settlement_period['Energy Imbalance Vol']*recalculated_system_price).sum()
-            recalculated_imbalance_cashflow_by_date_and_period.append((settlement_date, settlement_period, original_imbalance_cashflow, recalculated_imbalance_cashflow))
-    
-    recalculated_imbalance_cashflow_by_date_and_period_df = pd.DataFrame(
-        recalculated_imbalance_cashflow_by_date_and_period, 
-        columns=['settlement_date', 'settlement_period', 'energy_imbalance_cashflow', 'recalculated_energy_imbalance_cashflow']
-    )
-    
-    return recalculated_imbalance_cashflow_by_date_and_period_df
+    column_suffixes: dict[str, str] | None = None
+) -> dict[str, pd.DataFrame]:
+    """
+    Original and recalculated imbalance cashflows for every party class under every system price column, from
+    period totals of the imbalance cube. A class mapped to None covers every party and is seen from the SO's side,
+    so positive is revenue for the SO; for other classes positive is profit for the parties. Each price column gets
+    its own pair of cashflow columns, suffixed with '_' and the lowercased column name unless column_suffixes says otherwise.
+    """
+    if column_suffixes is None:
+        column_suffixes = {}
+    imbalance_cube = as_imbalance_cube(mr1b_data)
+    npt_mask = imbalance_cube.get_party_mask(dict.fromkeys(npt_ids, True))
+
+    # Only periods with a system price row are recalculated; a missing price in that row counts as zero
+    price_columns = list(zero_metered_volume_only_by_price_column.keys())
+    system_prices_by_date_and_period = system_prices_df[['settlement_date', 'settlement_period'] + price_columns].drop_duplicates(
+        ['settlement_date', 'settlement_period'], keep='last')
+    settlement_dates = imbalance_cube.get_settlement_date_strings()
+    system_prices = pd.DataFrame({'settlement_date': settlement_dates, 'settlement_period': imbalance_cube.settlement_periods}).merge(
+        system_prices_by_date_and_period, on=['settlement_date', 'settlement_period'], how='left', indicator=True)
+    has_system_price = (system_prices['_merge'] == 'both').to_numpy()
+
+    imbalance_cube.require_columns(['Imbalance Charge'] + (['Credited Energy Vol'] if any(zero_metered_volume_only_by_price_column.values()) else []))
+    cashflows_by_party_class = {}
+    for party_class, party_class_mapping in party_class_mappings.items():
+        party_class_mask = imbalance_cube.get_party_mask(party_class_mapping)
+        has_party_class_rows = imbalance_cube.get_period_totals(imbalance_cube.row_counts, party_class_mask) > 0
+        imbalance_charges = imbalance_cube.get_period_totals(imbalance_cube.imbalance_charges, party_class_mask)
+        sign = -1 if party_class_mapping is None else 1
+        cashflow_columns = {}
+        for price_column, zero_metered_volume_only in zero_metered_volume_only_by_price_column.items():
+            # NPT volumes are zeroed in the recalculation, either all of them or only those with no credited metered volume
+            if zero_metered_volume_only:
+                energy_imbalance_volumes = (imbalance_cube.get_period_totals(imbalance_cube.energy_imbalance_volumes, party_class_mask)
+                    - imbalance_cube.get_period_totals(imbalance_cube.zero_credited_energy_imbalance_volumes, party_class_mask & npt_mask))
+            else:
+                energy_imbalance_volumes = imbalance_cube.get_period_totals(imbalance_cube.energy_imbalance_volumes, party_class_mask & ~npt_mask)
+            suffix = column_suffixes.get(price_column, f'_{price_column.lower()}')
+            cashflow_columns[f'energy_imbalance_cashflow{suffix}'] = -sign * imbalance_charges
+            cashflow_columns[f'recalculated_energy_imbalance_cashflow{suffix}'] = sign * energy_imbalance_volumes * system_prices[price_column].fillna(0).to_numpy()
+        cashflows_by_party_class[party_class] = imbalance_cube.to_dataframe(has_party_class_rows & has_system_price, cashflow_columns, settlement_dates)
+
+    return cashflows_by_party_class
 
 def calculate_net_npt_cashflow(
     bsc_party_id_to_npt_mapping: dict[str, bool],
-    mr1b_data_df: pd.DataFrame
+    mr1b_data: pd.DataFrame | ImbalanceCube
 ) -> pd.DataFrame:
-    mr1b_df_npts_only = mr1b_data_df[mr1b_data_df['Party ID'].map(bsc_party_id_to_npt_mapping) == True]
-    mr1b_data_npts_only_copy = mr1b_df_npts_only.copy()
-    mr1b_data_npts_only_copy['Settlement Date'] = pd.to_datetime(mr1b_data_npts_only_copy['Settlement Date']).dt.date
-    imbalance_cashflow = []
-    for settlement_date, mr1b_data_npts_only_by_settlement_date in mr1b_data_npts_only_copy.groupby('Settlement Date'):
-        for settlement_period, mr1b_data_npts_only_by_settlement_period in mr1b_data_npts_only_by_settlement_date.groupby('Settlement Period'):
-            factual_imbalance_cashflow = -mr1b_data_npts_only_by_settlement_period['Imbalance Charge'].sum() # - sign to ensure that positive is profit for party
-            imbalance_cashflow.append((settlement_date, settlement_period, factual_imbalance_cashflow))
+    imbalance_cube = as_imbalance_cube(mr1b_data)
+    imbalance_cube.require_columns(['Imbalance Charge'])
+    npt_mask = imbalance_cube.get_party_mask(bsc_party_id_to_npt_mapping)
+    has_npt_rows = imbalance_cube.get_period_totals(imbalance_cube.row_counts, npt_mask) > 0
+    factual_imbalance_cashflows = -imbalance_cube.get_period_totals(imbalance_cube.imbalance_charges, npt_mask) # - sign to ensure that positive is profit for party
+    settlement_dates = np.asarray(pd.to_datetime(imbalance_cube.settlement_dates).date, dtype=object)
     
-    imbalance_cashflow_df = pd.DataFrame(imbalance_cashflow, columns=['settlement_date', 'settlement_period', 'npt_imbalance_cashflow'])
-
-    return imbalance_cashflow_df
+    return imbalance_cube.to_dataframe(has_npt_rows, {'npt_imbalance_cashflow': factual_imbalance_cashflows}, settlement_dates)
 
 def calculate_cashflows_from_excel(
     bsc_roles_filepath: str,
@@ -136,20 +104,21 @@ def calculate_cashflows_from_excel(
     output_file_directory: str,
     output_filepath: str,
 ) -> None:
+    bsc_roles = BscRoles.load(bsc_roles_filepath)
     bsc_id_to_npt_mapping = recalculate_niv.get_bsc_id_to_npt_mapping(
-        bsc_roles_filepath,
+        bsc_roles,
         strict_npt
     )
     bsc_id_to_generator_mapping = recalculate_niv.get_bsc_roles_to_generator_mapping(
-        bsc_roles_filepath,
+        bsc_roles,
         strict_generator
     )
     bsc_id_to_supplier_mapping = recalculate_niv.get_bsc_roles_to_supplier_mapping(
-        bsc_roles_filepath,
+        bsc_roles,
         strict_supplier
     )
     
-    mr1b_data_filepaths = excel_interaction.get_excel_filepaths(mr1b_file_directory)
+    mr1b_data_filepaths = excel_interaction.create_filepath_dict(excel_interaction.get_excel_filepaths(mr1b_file_directory))
     system_prices_df = pd.read_excel(system_prices_filepath)
     system_prices_df['settlement_date'] = pd.to_datetime(system_prices_df['settlement_date']).dt.strftime('%Y-%m-%d')
     
@@ -158,30 +127,30 @@ def calculate_cashflows_from_excel(
     all_generator_cashflows = []
     all_npt_cashflows = []
     
-    for i, filepath in enumerate(mr1b_data_filepaths):
-        mr1b_data_df = pd.read_excel(filepath)
-        mr1b_data_df = mr1b_data_df.map(lambda x: x.strip() if isinstance(x, str) else x)
+    for i, (year_month, filepath) in enumerate(mr1b_data_filepaths.items()):
+        year, month = year_month.split('_')
+        imbalance_cube = ImbalanceCube.from_mr1b(mr1b_store.read_mr1b_month(int(year), int(month), mr1b_store.IMBALANCE_COLUMNS, filepath))
         npt_ids = [k for k, v in bsc_id_to_npt_mapping.items() if v == True]
         so_cashflows_df = get_recalculated_imbalance_cashflows_SO(
             system_prices_df, 
-            mr1b_data_df, 
+            imbalance_cube, 
             npt_ids
         )
         supplier_cashflows_df = recalculate_imbalance_cashflows_by_bsc_party_type(
             bsc_id_to_supplier_mapping, 
             system_prices_df, 
-            mr1b_data_df, 
+            imbalance_cube, 
             npt_ids
         )
         generator_cashflows_df = recalculate_imbalance_cashflows_by_bsc_party_type(
             bsc_id_to_generator_mapping, 
             system_prices_df, 
-            mr1b_data_df, 
+            imbalance_cube, 
             npt_ids
         )
         npt_cashflow_df = calculate_net_npt_cashflow(
             bsc_id_to_npt_mapping,
-            mr1b_data_df
+            imbalance_cube
         )
         
         so_cashflows_df = so_cashflows_df.dropna()
@@ -230,123 +199,53 @@ def recalculate_imbalance_cashflows_from_excel(
     mr1b_file_directory: str,
     output_directory: str
 ) -> None:
+    bsc_roles = BscRoles.load(bsc_roles_filepath)
     bsc_id_to_npt_mapping = recalculate_niv.get_bsc_id_to_npt_mapping(
-        bsc_roles_filepath,
+        bsc_roles,
         strict_npt_mapping=True
     )
     
     bsc_id_to_generator_mapping = recalculate_niv.get_bsc_roles_to_generator_mapping(
-        bsc_roles_filepath,
+        bsc_roles,
         strict_generator_mapping=True
     )
     
     bsc_id_to_supplier_mapping = recalculate_niv.get_bsc_roles_to_supplier_mapping(
-        bsc_roles_filepath,
+        bsc_roles,
         strict_supplier_mapping=True
     )
     
     bsc_id_to_mixed_role_mapping = recalculate_niv.get_bsc_roles_to_mixed_role_mapping(
-        bsc_roles_filepath
+        bsc_roles
     )
     
-    mr1b_data_filepaths = excel_interaction.get_excel_filepaths(mr1b_file_directory)
+    mr1b_data_filepaths = excel_interaction.create_filepath_dict(excel_interaction.get_excel_filepaths(mr1b_file_directory))
     system_prices_df = pd.read_excel(imbalance_price_filepath, sheet_name=imbalance_price_sheet_name)
     system_prices_df['settlement_date'] = pd.to_datetime(system_prices_df['settlement_date']).dt.strftime('%Y-%m-%d')
     all_so_cashflows = []
     all_supplier_cashflows = []
     all_generator_cashflows = []
     all_mixed_role_cashflows = []
-    for i, filepath in enumerate(mr1b_data_filepaths):
-        mr1b_data_df = pd.read_excel(filepath)
-        mr1b_data_df = mr1b_data_df.map(lambda x: x.strip() if isinstance(x, str) else x)
+    for i, (year_month, filepath) in enumerate(mr1b_data_filepaths.items()):
+        year, month = year_month.split('_')
+        imbalance_cube = ImbalanceCube.from_mr1b(mr1b_store.read_mr1b_month(int(year), int(month), mr1b_store.IMBALANCE_COLUMNS, filepath))
         npt_ids = [k for k, v in bsc_id_to_npt_mapping.items() if v == True]
-        so_cashflows_amv_df = get_recalculated_imbalance_cashflows_SO(
-            system_prices_df[['settlement_date', 'settlement_period', 'AMV']], 
-            mr1b_data_df, 
-            npt_ids,
-            zero_metered_volume_only=False,
-            recalculated_system_price_column_name='AMV'
-        )
-        supplier_cashflows_amv_df = recalculate_imbalance_cashflows_by_bsc_party_type(
-            bsc_id_to_supplier_mapping, 
-            system_prices_df[['settlement_date', 'settlement_period', 'AMV']], 
-            mr1b_data_df, 
-            npt_ids,
-            zero_metered_volume_only=False,
-            recalculated_system_price_column_name='AMV'
-        )
-        generator_cashflows_amv_df = recalculate_imbalance_cashflows_by_bsc_party_type(
-            bsc_id_to_generator_mapping, 
-            system_prices_df[['settlement_date', 'settlement_period', 'AMV']], 
-            mr1b_data_df,
-            npt_ids,
-            zero_metered_volume_only=False,
-            recalculated_system_price_column_name='AMV'
-        )
-        mixed_cashflows_amv_df = recalculate_imbalance_cashflows_by_bsc_party_type(
-            bsc_id_to_mixed_role_mapping,
-            system_prices_df[['settlement_date', 'settlement_period', 'AMV']],
-            mr1b_data_df,
-            npt_ids,
-            zero_metered_volume_only=False,
-            recalculated_system_price_column_name='AMV'
-        )
-        
-        so_cashflows_zmv_df = get_recalculated_imbalance_cashflows_SO(
-            system_prices_df[['settlement_date', 'settlement_period', 'ZMV']], 
-            mr1b_data_df, 
-            npt_ids,
-            zero_metered_volume_only=True,
-            recalculated_system_price_column_name='ZMV'
-        )
-        supplier_cashflows_zmv_df = recalculate_imbalance_cashflows_by_bsc_party_type(
-            bsc_id_to_supplier_mapping, 
-            system_prices_df[['settlement_date', 'settlement_period', 'ZMV']], 
-            mr1b_data_df, 
-            npt_ids,
-            zero_metered_volume_only=True,
-            recalculated_system_price_column_name='ZMV'
-        )
-        generator_cashflows_zmv_df = recalculate_imbalance_cashflows_by_bsc_party_type(
-            bsc_id_to_generator_mapping, 
-            system_prices_df[['settlement_date', 'settlement_period', 'ZMV']], 
-            mr1b_data_df,
-            npt_ids,
-            zero_metered_volume_only=True,
-            recalculated_system_price_column_name='ZMV'
-        )
-        mixed_cashflows_zmv_df = recalculate_imbalance_cashflows_by_bsc_party_type(
-            bsc_id_to_mixed_role_mapping,
-            system_prices_df[['settlement_date', 'settlement_period', 'ZMV']],
-            mr1b_data_df,
-            npt_ids,
-            zero_metered_volume_only=True,
-            recalculated_system_price_column_name='ZMV'
-        )
-        
-        so_cashflows_df = so_cashflows_amv_df.merge(
-            so_cashflows_zmv_df,
-            on=['settlement_date', 'settlement_period'],
-            suffixes=('_amv', '_zmv')
-        )
-        
-        supplier_cashflows_df = supplier_cashflows_amv_df.merge(
-            supplier_cashflows_zmv_df,
-            on=['settlement_date', 'settlement_period'],
-            suffixes=('_amv', '_zmv')
-        )
-        
-        generator_cashflows_df = generator_cashflows_amv_df.merge(
-            generator_cashflows_zmv_df,
-            on=['settlement_date', 'settlement_period'],
-            suffixes=('_amv', '_zmv')
-        )
-        
-        mixed_cashflows_df = mixed_cashflows_amv_df.merge(
-            mixed_cashflows_zmv_df,
-            on=['settlement_date', 'settlement_period'],
-            suffixes=('_amv', '_zmv')
+        cashflows_by_party_class = get_imbalance_cashflows_by_party_class(
+            imbalance_cube,
+            system_prices_df,
+            {
+                SO_PARTY_CLASS: None,
+                'supplier': bsc_id_to_supplier_mapping,
+                'generator': bsc_id_to_generator_mapping,
+                'mixed_role': bsc_id_to_mixed_role_mapping
+            },
+            {'AMV': False, 'ZMV': True},
+            npt_ids
         )
+        so_cashflows_df = cashflows_by_party_class[SO_PARTY_CLASS]
+        supplier_cashflows_df = cashflows_by_party_class['supplier']
+        generator_cashflows_df = cashflows_by_party_class['generator']
+        mixed_cashflows_df = cashflows_by_party_class['mixed_role']
         
         all_so_cashflows.append(so_cashflows_df)
         all_supplier_cashflows.append(supplier_cashflows_df)
@@ -1,163 +1,332 @@
-import asyncio
+from concurrent.futures import ProcessPoolExecutor
 
 import data_collection.elexon_interaction as elexon_interaction
+import data_processing.bm_physical_data_handler as bm_physical_data_handler
 import data_processing.stack_data_handler as stack_data_handler
-import data_processing.bm_unit as bm_unit
+import numpy as np
 import pandas as pd
 
 from elexonpy.api_client import ApiClient
+from data_processing.merit_order_index import PeriodMeritOrder
+from data_processing.missing_data import MissingData
+from data_processing.period_indexed_data import PeriodIndexedData, PeriodLookup, as_period_lookup
+from data_processing.settlement_stack import SettlementStack, as_settlement_stack
+
+# 0% to 100% of NPT imbalance volume removed, in 5% steps
+NPT_REMOVAL_FRACTIONS = np.round(np.arange(0, 1.0001, 0.05), 2)
 
 async def recalculate_stacks(
     api_client: ApiClient, 
     settlement_dates_with_periods_per_day : dict[str, int], 
     system_imbalance_with_and_without_npts_by_date_and_period : pd.DataFrame, 
     full_ascending_settlement_stack_by_date_and_period : dict[tuple[str, int], pd.DataFrame],
-    missing_data: set[tuple[str, int]]
+    missing_data: MissingData,
+    workers: int = 1
+) -> dict:
+    # Bid-offer and physical data are downloaded a day at a time up front, so each period is a local slice
+    bid_offer_and_physical_data = await elexon_interaction.get_bid_offer_and_physical_data(api_client, list(settlement_dates_with_periods_per_day.keys()))
+    new_settlement_stacks_by_date_and_period = recalculate_stacks_from_data(
+        bid_offer_and_physical_data, settlement_dates_with_periods_per_day, system_imbalance_with_and_without_npts_by_date_and_period, 
+        full_ascending_settlement_stack_by_date_and_period, missing_data, workers)
+    
+    return new_settlement_stacks_by_date_and_period
+
+def recalculate_stacks_from_data(
+    bid_offer_and_physical_data: dict[str, PeriodIndexedData], 
+    settlement_dates_with_periods_per_day : dict[str, int], 
+    system_imbalance_with_and_without_npts_by_date_and_period : pd.DataFrame | PeriodLookup, 
+    full_ascending_settlement_stack_by_date_and_period : dict[tuple[str, int], pd.DataFrame],
+    missing_data: MissingData,
+    workers: int = 1
 ) -> dict:
+    system_imbalance_with_and_without_npts_by_date_and_period = as_period_lookup(system_imbalance_with_and_without_npts_by_date_and_period)
+    if workers > 1:
+        return recalculate_stacks_in_process_pool(
+            bid_offer_and_physical_data, settlement_dates_with_periods_per_day, system_imbalance_with_and_without_npts_by_date_and_period, 
+            full_ascending_settlement_stack_by_date_and_period, missing_data, workers)
     new_settlement_stacks_by_date_and_period = {}
     for settlement_date, settlement_periods_in_day in settlement_dates_with_periods_per_day.items():
-        tasks = []
         for settlement_period in range(1, settlement_periods_in_day + 1):
-            tasks.append(asyncio.create_task(process_settlement_period(api_client, settlement_date, settlement_period, system_imbalance_with_and_without_npts_by_date_and_period, full_ascending_settlement_stack_by_date_and_period, missing_data)))
-        day_results = await asyncio.gather(*tasks)
-        for (settlement_date, settlement_period), new_settlement_stack_one_period in day_results:
-            new_settlement_stacks_by_date_and_period[(settlement_date, settlement_period)] = new_settlement_stack_one_period
+            date_and_period, new_settlement_stack_one_period = process_settlement_period(bid_offer_and_physical_data, settlement_date, settlement_period, system_imbalance_with_and_without_npts_by_date_and_period, full_ascending_settlement_stack_by_date_and_period, missing_data)
+            new_settlement_stacks_by_date_and_period[date_and_period] = new_settlement_stack_one_period
         print(f"Recalculated stacks for {settlement_date}")   
     
     return new_settlement_stacks_by_date_and_period
 
-async def process_settlement_period(
-    api_client: ApiClient, 
+def recalculate_stacks_in_process_pool(
+    bid_offer_and_physical_data: dict[str, PeriodIndexedData], 
+    settlement_dates_with_periods_per_day : dict[str, int], 
+    system_imbalance_with_and_without_npts_by_date_and_period : PeriodLookup, 
+    full_ascending_settlement_stack_by_date_and_period : dict[tuple[str, int], pd.DataFrame],
+    missing_data: MissingData,
+    workers: int
+) -> dict:
+    period_inputs = (
+        get_settlement_period_inputs(bid_offer_and_physical_data, settlement_date, settlement_period, system_imbalance_with_and_without_npts_by_date_and_period, full_ascending_settlement_stack_by_date_and_period)
+        for settlement_date, settlement_periods_in_day in settlement_dates_with_periods_per_day.items()
+        for settlement_period in range(1, settlement_periods_in_day + 1)
+    )
+    new_settlement_stacks_by_date_and_period = {}
+    # map returns results in submission order, so the output does not depend on which worker finishes first
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for date_and_period, new_settlement_stack_one_period, missing_data_one_period in executor.map(_recalculate_settlement_period_in_worker, period_inputs, chunksize=4):
+            new_settlement_stacks_by_date_and_period[date_and_period] = new_settlement_stack_one_period
+            missing_data.update(missing_data_one_period)
+            settlement_date, settlement_period = date_and_period
+            if settlement_period == settlement_dates_with_periods_per_day[settlement_date]:
+                print(f"Recalculated stacks for {settlement_date}")
+    
+    return new_settlement_stacks_by_date_and_period
+
+def sweep_stacks_from_data(
+    bid_offer_and_physical_data: dict[str, PeriodIndexedData], 
+    settlement_dates_with_periods_per_day : dict[str, int], 
+    system_imbalance_with_and_without_npts_by_date_and_period : pd.DataFrame | PeriodLookup, 
+    full_ascending_settlement_stack_by_date_and_period : dict[tuple[str, int], pd.DataFrame],
+    counterfactual_nivs_by_date_and_period: pd.DataFrame | PeriodLookup,
+    missing_data: MissingData
+) -> dict[tuple[str, int], list[SettlementStack]]:
+    """
+    Every period's stack recalculated once per scenario column of counterfactual_nivs_by_date_and_period, in column order.
+    A period's offers, bids and headroom are built once and shared by all of its scenarios, so a sweep costs one
+    quota removal and acceptance per scenario rather than a rerun of the whole month.
+    """
+    system_imbalance_lookup = as_period_lookup(system_imbalance_with_and_without_npts_by_date_and_period)
+    counterfactual_niv_lookup = as_period_lookup(counterfactual_nivs_by_date_and_period)
+    scenarios = get_scenarios(counterfactual_niv_lookup.data)
+    new_settlement_stacks_by_date_and_period = {}
+    for settlement_date, settlement_periods_in_day in settlement_dates_with_periods_per_day.items():
+        for settlement_period in range(1, settlement_periods_in_day + 1):
+            full_ascending_settlement_stack_one_period = full_ascending_settlement_stack_by_date_and_period[(settlement_date, settlement_period)]
+            bid_offer_and_physical_data_one_period = get_bid_offer_and_physical_data_one_period(bid_offer_and_physical_data, settlement_date, settlement_period)
+            system_imbalance_with_npts = system_imbalance_lookup.get_value(settlement_date, settlement_period, 'net_imbalance_volume', np.nan)
+            counterfactual_nivs = [counterfactual_niv_lookup.get_value(settlement_date, settlement_period, scenario, np.nan) for scenario in scenarios]
+            new_settlement_stacks_by_date_and_period[(settlement_date, settlement_period)] = sweep_settlement_period(
+                settlement_date, settlement_period, system_imbalance_with_npts, counterfactual_nivs, 
+                full_ascending_settlement_stack_one_period, bid_offer_and_physical_data_one_period, missing_data)
+        print(f"Swept stacks for {settlement_date}")
+    
+    return new_settlement_stacks_by_date_and_period
+
+def sweep_settlement_period(
     settlement_date: str, 
     settlement_period: int, 
-    system_imbalance_df: pd.DataFrame, 
-    full_settlement_stacks_by_date_and_period: dict[tuple[str, int], pd.DataFrame],
-    missing_data: set[tuple[str, int]]
-) -> tuple[tuple[str, int], pd.DataFrame]:
-    system_imbalance_with_and_without_npts_one_period = system_imbalance_df[
-        (system_imbalance_df['settlement_date'] == settlement_date) & 
-        (system_imbalance_df['settlement_period'] == settlement_period)
+    system_imbalance_with_npts: float,
+    counterfactual_nivs: list[float],
+    full_ascending_settlement_stack_one_period: pd.DataFrame | SettlementStack,
+    bid_offer_and_physical_data_one_period: dict[str, pd.DataFrame],
+    missing_data: MissingData
+) -> list[SettlementStack]:
+    full_ascending_settlement_stack_one_period = as_settlement_stack(full_ascending_settlement_stack_one_period)
+    period_merit_order = get_period_merit_order(settlement_date, settlement_period, full_ascending_settlement_stack_one_period, bid_offer_and_physical_data_one_period, missing_data)
+    if period_merit_order is None:
+        return [SettlementStack.empty_stack() for _ in counterfactual_nivs]
+    if pd.isna(system_imbalance_with_npts):
+        missing_data.mark(settlement_date, settlement_period, MissingData.NIV)
+        return [SettlementStack.empty_stack() for _ in counterfactual_nivs]
+    
+    return [
+        SettlementStack.empty_stack() if pd.isna(counterfactual_niv) else
+        recalculate_settlement_stack_for_niv(system_imbalance_with_npts, counterfactual_niv, full_ascending_settlement_stack_one_period, period_merit_order)
+        for counterfactual_niv in counterfactual_nivs
     ]
+
+def get_npt_removal_counterfactual_nivs(
+    system_imbalance_with_and_without_npts_df: pd.DataFrame,
+    npt_removal_fractions = NPT_REMOVAL_FRACTIONS
+) -> pd.DataFrame:
+    # A fraction of 0 keeps the NIV with NPTs, even where the counterfactual is missing, and 1 gives the counterfactual NIV
+    system_imbalance_with_npts = system_imbalance_with_and_without_npts_df['net_imbalance_volume'].to_numpy(dtype=float)
+    system_imbalance_without_npts = system_imbalance_with_and_without_npts_df['counterfactual_niv'].to_numpy(dtype=float)
+    counterfactual_nivs_df = system_imbalance_with_and_without_npts_df[['settlement_date', 'settlement_period']].reset_index(drop=True)
+    counterfactual_nivs_df = pd.concat([counterfactual_nivs_df, pd.DataFrame({
+        f'{npt_removal_fraction:.0%}': system_imbalance_with_npts if npt_removal_fraction == 0 else
+        system_imbalance_with_npts + npt_removal_fraction * (system_imbalance_without_npts - system_imbalance_with_npts)
+        for npt_removal_fraction in npt_removal_fractions
+    })], axis=1)
+    
+    return counterfactual_nivs_df
+
+def get_scenarios(
+    counterfactual_nivs_df: pd.DataFrame
+) -> list[str]:
+    return [column for column in counterfactual_nivs_df.columns if column not in ('settlement_date', 'settlement_period')]
+
+def _recalculate_settlement_period_in_worker(
+    period_inputs: tuple
+) -> tuple[tuple[str, int], SettlementStack, MissingData]:
+    settlement_date, settlement_period = period_inputs[:2]
+    missing_data_one_period = MissingData()
+    new_settlement_stack = get_new_settlement_stack_one_period(*period_inputs, missing_data_one_period)
+    
+    return (settlement_date, settlement_period), new_settlement_stack, missing_data_one_period
+
+def get_settlement_period_inputs(
+    bid_offer_and_physical_data: dict[str, PeriodIndexedData], 
+    settlement_date: str, 
+    settlement_period: int, 
+    system_imbalance_df: pd.DataFrame | PeriodLookup, 
+    full_settlement_stacks_by_date_and_period: dict[tuple[str, int], pd.DataFrame]
+) -> tuple[str, int, pd.DataFrame, pd.DataFrame, dict[str, pd.DataFrame]]:
+    system_imbalance_with_and_without_npts_one_period = as_period_lookup(system_imbalance_df).get_rows(settlement_date, settlement_period)
     full_ascending_settlement_stack_one_period = full_settlement_stacks_by_date_and_period[(settlement_date, settlement_period)]
-    new_settlement_stack = await get_new_settlement_stack_one_period(api_client, settlement_date, settlement_period, system_imbalance_with_and_without_npts_one_period, full_ascending_settlement_stack_one_period, missing_data)
+    bid_offer_and_physical_data_one_period = get_bid_offer_and_physical_data_one_period(bid_offer_and_physical_data, settlement_date, settlement_period)
+    
+    return settlement_date, settlement_period, system_imbalance_with_and_without_npts_one_period, full_ascending_settlement_stack_one_period, bid_offer_and_physical_data_one_period
+
+def get_bid_offer_and_physical_data_one_period(
+    bid_offer_and_physical_data: dict[str, PeriodIndexedData], 
+    settlement_date: str, 
+    settlement_period: int
+) -> dict[str, pd.DataFrame]:
+    return {
+        dataset: period_indexed_data.get_period(settlement_date, settlement_period)
+        for dataset, period_indexed_data in bid_offer_and_physical_data.items()
+    }
+
+def process_settlement_period(
+    bid_offer_and_physical_data: dict[str, PeriodIndexedData], 
+    settlement_date: str, 
+    settlement_period: int, 
+    system_imbalance_df: pd.DataFrame | PeriodLookup, 
+    full_settlement_stacks_by_date_and_period: dict[tuple[str, int], pd.DataFrame],
+    missing_data: MissingData
+) -> tuple[tuple[str, int], SettlementStack]:
+    period_inputs = get_settlement_period_inputs(bid_offer_and_physical_data, settlement_date, settlement_period, system_imbalance_df, full_settlement_stacks_by_date_and_period)
+    new_settlement_stack = get_new_settlement_stack_one_period(*period_inputs, missing_data)
     print(f"Recalculated stack for {settlement_date}, period {settlement_period}")
     
     return (settlement_date, settlement_period), new_settlement_stack
 
-async def get_new_settlement_stack_one_period(
-    api_client: ApiClient, 
+def get_new_settlement_stack_one_period(
     settlement_date: str, 
     settlement_period: int, 
     system_imbalance_with_and_without_npts_one_period: pd.DataFrame, 
-    full_ascending_settlement_stack_one_period: pd.DataFrame,
-    missing_data: set[tuple[str, int]]
-) -> pd.DataFrame:
+    full_ascending_settlement_stack_one_period: pd.DataFrame | SettlementStack,
+    bid_offer_and_physical_data_one_period: dict[str, pd.DataFrame],
+    missing_data: MissingData
+) -> SettlementStack:
+    full_ascending_settlement_stack_one_period = as_settlement_stack(full_ascending_settlement_stack_one_period)
+    period_merit_order = get_period_merit_order(settlement_date, settlement_period, full_ascending_settlement_stack_one_period, bid_offer_and_physical_data_one_period, missing_data)
+    if period_merit_order is None:
+        return SettlementStack.empty_stack()
+    system_imbalance_with_npts = system_imbalance_with_and_without_npts_one_period['net_imbalance_volume'].values[0]
+    system_imbalance_without_npts = system_imbalance_with_and_without_npts_one_period['counterfactual_niv'].values[0]
+    new_settlement_stack = recalculate_settlement_stack_for_niv(system_imbalance_with_npts, system_imbalance_without_npts, full_ascending_settlement_stack_one_period, period_merit_order)
+    return new_settlement_stack
+
+def get_period_merit_order(
+    settlement_date: str, 
+    settlement_period: int, 
+    full_ascending_settlement_stack_one_period: SettlementStack,
+    bid_offer_and_physical_data_one_period: dict[str, pd.DataFrame],
+    missing_data: MissingData
+) -> PeriodMeritOrder | None:
+    """The period's offers, bids and headroom, or None with the reason marked in missing_data when the period cannot be recalculated."""
     if full_ascending_settlement_stack_one_period.empty:
-        missing_data.add((settlement_date, settlement_period))
-        return pd.DataFrame()
+        missing_data.mark(settlement_date, settlement_period, MissingData.STACK)
+        return None
     
-    bid_offer_data_one_period = await elexon_interaction.get_bid_offer_pairs_data_one_period(api_client, settlement_date, settlement_period)
+    bid_offer_data_one_period = bid_offer_and_physical_data_one_period['BOD']
     if bid_offer_data_one_period.empty:
-        missing_data.add((settlement_date, settlement_period))
-        return pd.DataFrame()
-    grouped_bid_offer_data_one_period = bid_offer_data_one_period.groupby('bm_unit')
-    bmus = grouped_bid_offer_data_one_period.groups.keys()
-    physical_volumes_by_bmu = await elexon_interaction.get_physical_volumes_by_bmu(api_client, settlement_date, settlement_period, bmus)
-    if not physical_volumes_by_bmu:
-        missing_data.add((settlement_date, settlement_period))
-        return pd.DataFrame()
-    bmus = stack_data_handler.get_bmus_one_period(grouped_bid_offer_data_one_period, full_ascending_settlement_stack_one_period, physical_volumes_by_bmu)
-    new_settlement_stack = recalculate_settlement_stack_one_period(system_imbalance_with_and_without_npts_one_period, full_ascending_settlement_stack_one_period, bid_offer_data_one_period, bmus)
-    return new_settlement_stack
+        missing_data.mark(settlement_date, settlement_period, MissingData.BID_OFFER)
+        return None
+    bid_offer_data_one_period = bid_offer_data_one_period[['bm_unit', 'level_from', 'bid', 'offer', 'pair_id']]
+    bmus = bid_offer_data_one_period['bm_unit'].dropna().unique()
+    physical_data_one_period = {
+        dataset: bid_offer_and_physical_data_one_period[dataset]
+        for dataset in bm_physical_data_handler.PHYSICAL_DATASETS
+    }
+    if any(physical_data.empty for physical_data in physical_data_one_period.values()):
+        missing_data.mark(settlement_date, settlement_period, MissingData.PHYSICAL)
+        return None
+    physical_volumes_by_bmu = bm_physical_data_handler.get_physical_volumes_by_bmu(physical_data_one_period, bmus)
+    bid_offer_headroom = stack_data_handler.get_bid_offer_headroom_one_period(bid_offer_data_one_period, full_ascending_settlement_stack_one_period, physical_volumes_by_bmu)
+    
+    return stack_data_handler.get_period_merit_order(bid_offer_data_one_period, bid_offer_headroom)
         
-def recalculate_settlement_stack_one_period(
-    system_imbalance_with_and_without_npts_one_period: pd.DataFrame, 
-    full_ascending_settlement_stack_one_period: pd.DataFrame, 
-    bid_offer_data_one_period: pd.DataFrame, 
-    bmus: list[str]
-) -> pd.DataFrame:
-    system_imbalance_with_npts = system_imbalance_with_and_without_npts_one_period['net_imbalance_volume'].values[0]
-    system_imbalance_without_npts = system_imbalance_with_and_without_npts_one_period['counterfactual_niv'].values[0]
+def recalculate_settlement_stack_for_niv(
+    system_imbalance_with_npts: float, 
+    system_imbalance_without_npts: float, 
+    full_ascending_settlement_stack_one_period: SettlementStack, 
+    period_merit_order: PeriodMeritOrder
+) -> SettlementStack:
     if(system_imbalance_with_npts > 0 and system_imbalance_without_npts > 0):
         return recalculate_settlement_stack_niv_with_and_without_positive(system_imbalance_with_npts, system_imbalance_without_npts, full_ascending_settlement_stack_one_period, 
-                                                            bid_offer_data_one_period, bmus)
+                                                            period_merit_order)
     elif(system_imbalance_with_npts < 0 and system_imbalance_without_npts < 0):
         return recalculate_settlement_stack_niv_with_and_without_negative(system_imbalance_with_npts, system_imbalance_without_npts, full_ascending_settlement_stack_one_period,
-                                                            bid_offer_data_one_period, bmus)
+                                                            period_merit_order)
     elif(system_imbalance_with_npts > 0 and system_imbalance_without_npts < 0):
         return recalculate_settlement_stack_niv_with_positive_and_without_negative(system_imbalance_with_npts, system_imbalance_without_npts, full_ascending_settlement_stack_one_period,
-                                                                     bid_offer_data_one_period, bmus)
+                                                                     period_merit_order)
     else:
         return recalculate_settlement_stack_niv_with_negative_and_without_positive(system_imbalance_with_npts, system_imbalance_without_npts, full_ascending_settlement_stack_one_period,
-                                                                     bid_offer_data_one_period, bmus)
+                                                                     period_merit_order)
     
     
 def recalculate_settlement_stack_niv_with_and_without_positive(
     system_imbalance_with_npts: float, 
     system_imbalance_without_npts: float, 
-    full_ascending_settlement_stack_one_period: pd.DataFrame, 
-    bid_offer_data_one_period: pd.DataFrame, 
-    bmus: list[bm_unit.BMUnit]
-) -> pd.DataFrame:
+    full_ascending_settlement_stack_one_period: SettlementStack, 
+    period_merit_order: PeriodMeritOrder
+) -> SettlementStack:
     ascending_settlement_stack_for_calculation = full_ascending_settlement_stack_one_period.copy()
     if system_imbalance_without_npts > system_imbalance_with_npts:
-        offer_stack = stack_data_handler.get_offer_stack_one_period(bid_offer_data_one_period)
-        new_settlement_stack = stack_data_handler.accept_balancing_actions_until_quota_met(system_imbalance_with_npts, system_imbalance_without_npts, ascending_settlement_stack_for_calculation, offer_stack, bmus)
+        offer_stack = period_merit_order.offers
+        new_settlement_stack = stack_data_handler.accept_balancing_actions_until_quota_met(system_imbalance_with_npts, system_imbalance_without_npts, ascending_settlement_stack_for_calculation, offer_stack, period_merit_order.bid_offer_headroom)
     else:
         new_settlement_stack, total_offer_volume_removed = stack_data_handler.remove_offers_until_quota_met(system_imbalance_with_npts, system_imbalance_without_npts, ascending_settlement_stack_for_calculation)
         if system_imbalance_with_npts - total_offer_volume_removed > system_imbalance_without_npts:
             bid_volume_to_accept = (system_imbalance_with_npts - total_offer_volume_removed) - system_imbalance_without_npts
-            bid_stack = stack_data_handler.get_bid_stack_one_period(bid_offer_data_one_period)
-            new_settlement_stack = stack_data_handler.accept_balancing_actions_until_quota_met(bid_volume_to_accept, 0, new_settlement_stack, bid_stack, bmus)
+            bid_stack = period_merit_order.bids
+            new_settlement_stack = stack_data_handler.accept_balancing_actions_until_quota_met(bid_volume_to_accept, 0, new_settlement_stack, bid_stack, period_merit_order.bid_offer_headroom)
 
     return new_settlement_stack
 
 def recalculate_settlement_stack_niv_with_and_without_negative(
     system_imbalance_with_npts: float, 
     system_imbalance_without_npts: float, 
-    full_ascending_settlement_stack_one_period: pd.DataFrame, 
-    bid_offer_data_one_period: pd.DataFrame, 
-    bmus: list[bm_unit.BMUnit]
-) -> pd.DataFrame:
+    full_ascending_settlement_stack_one_period: SettlementStack, 
+    period_merit_order: PeriodMeritOrder
+) -> SettlementStack:
     ascending_settlement_stack_for_calculation = full_ascending_settlement_stack_one_period.copy()
     if system_imbalance_without_npts < system_imbalance_with_npts:
-        bid_stack = stack_data_handler.get_bid_stack_one_period(bid_offer_data_one_period)
-        new_settlement_stack = stack_data_handler.accept_balancing_actions_until_quota_met(system_imbalance_with_npts, system_imbalance_without_npts, ascending_settlement_stack_for_calculation, bid_stack, bmus)
+        bid_stack = period_merit_order.bids
+        new_settlement_stack = stack_data_handler.accept_balancing_actions_until_quota_met(system_imbalance_with_npts, system_imbalance_without_npts, ascending_settlement_stack_for_calculation, bid_stack, period_merit_order.bid_offer_headroom)
     else:
         new_settlement_stack, total_bid_volume_removed = stack_data_handler.remove_bids_until_quota_met(system_imbalance_with_npts, system_imbalance_without_npts, ascending_settlement_stack_for_calculation)
         if system_imbalance_with_npts - total_bid_volume_removed < system_imbalance_without_npts:
             offer_volume_to_accept = system_imbalance_without_npts - (system_imbalance_with_npts - total_bid_volume_removed)
-            offer_stack = stack_data_handler.get_offer_stack_one_period(bid_offer_data_one_period)
-            new_settlement_stack = stack_data_handler.accept_balancing_actions_until_quota_met(0, offer_volume_to_accept, new_settlement_stack, offer_stack, bmus)
+            offer_stack = period_merit_order.offers
+            new_settlement_stack = stack_data_handler.accept_balancing_actions_until_quota_met(0, offer_volume_to_accept, new_settlement_stack, offer_stack, period_merit_order.bid_offer_headroom)
     
     return new_settlement_stack
 
 def recalculate_settlement_stack_niv_with_positive_and_without_negative(
     system_imbalance_with_npts: float, 
     system_imbalance_without_npts: float, 
-    full_ascending_settlement_stack_one_period: pd.DataFrame, 
-    bid_offer_data_one_period: pd.DataFrame, 
-    bmus: list[bm_unit.BMUnit]
-) -> pd.DataFrame:
+    full_ascending_settlement_stack_one_period: SettlementStack, 
+    period_merit_order: PeriodMeritOrder
+) -> SettlementStack:
     ascending_settlement_stack_for_calculation = full_ascending_settlement_stack_one_period.copy()
     stack_without_offers, total_offer_volume_removed = stack_data_handler.remove_offers_until_quota_met(system_imbalance_with_npts, 0, ascending_settlement_stack_for_calculation)
     remaining_volume_to_remove = system_imbalance_with_npts - total_offer_volume_removed
-    bid_stack = stack_data_handler.get_bid_stack_one_period(bid_offer_data_one_period)
-    new_settlement_stack = stack_data_handler.accept_balancing_actions_until_quota_met(remaining_volume_to_remove, system_imbalance_without_npts, stack_without_offers, bid_stack, bmus)
+    bid_stack = period_merit_order.bids
+    new_settlement_stack = stack_data_handler.accept_balancing_actions_until_quota_met(remaining_volume_to_remove, system_imbalance_without_npts, stack_without_offers, bid_stack, period_merit_order.bid_offer_headroom)
 
     return new_settlement_stack
 
 def recalculate_settlement_stack_niv_with_negative_and_without_positive(
     system_imbalance_with_npts: float, 
     system_imbalance_without_npts: float, 
-    full_ascending_settlement_stack_one_period: pd.DataFrame, 
-    bid_offer_data_one_period: pd.DataFrame, 
-    bmus: list[bm_unit.BMUnit]
-) -> pd.DataFrame:
+    full_ascending_settlement_stack_one_period: SettlementStack, 
+    period_merit_order: PeriodMeritOrder
+) -> SettlementStack:
     ascending_settlement_stack_for_calculation = full_ascending_settlement_stack_one_period.copy()
     stack_without_bids, total_bid_volume_removed = stack_data_handler.remove_bids_until_quota_met(system_imbalance_with_npts, 0, ascending_settlement_stack_for_calculation)
     remaining_volume_to_remove = system_imbalance_with_npts - total_bid_volume_removed
-    offer_stack = stack_data_handler.get_offer_stack_one_period(bid_offer_data_one_period)
-    new_settlement_stack = stack_data_handler.accept_balancing_actions_until_quota_met(remaining_volume_to_remove, system_imbalance_without_npts, stack_without_bids, offer_stack, bmus)
+    offer_stack = period_merit_order.offers
+    new_settlement_stack = stack_data_handler.accept_balancing_actions_until_quota_met(remaining_volume_to_remove, system_imbalance_without_npts, stack_without_bids, offer_stack, period_merit_order.bid_offer_headroom)
 
     return new_settlement_stack
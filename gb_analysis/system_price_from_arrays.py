@@ -0,0 +1,305 @@
+import operator
+from dataclasses import dataclass
+
+import numpy as np
+
+from data_processing.settlement_stack import SettlementStack
+
+UNSET_FLAG = -1
+
+@dataclass
+class RankedSet:
+    id_codes: np.ndarray
+    bid_offer_pair_ids: np.ndarray
+    so_flags: np.ndarray
+    cadl_flags: np.ndarray
+    original_prices: np.ndarray
+    volumes: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.volumes)
+
+def get_new_system_price(
+    settlement_stack: SettlementStack,
+    price_adjustment: float,
+    market_index_price: float,
+    tlm_by_bmu: dict,
+    niv_without_npts: float
+) -> float:
+    """
+    The Annex T pipeline of system_price_from_stack.get_new_system_price run on NumPy arrays.
+
+    Stages are applied in the same order and with the same tie-breaking as the pandas engine, so the two
+    agree to floating point precision. Arbitrage and NIV tagging walk the two ranked sets with a pointer
+    each rather than rescanning the opposite set for every action.
+    """
+    if settlement_stack.empty:
+        return market_index_price
+    buy_ranked_set, sell_ranked_set = get_ranked_sets(settlement_stack)
+    buy_dmat_volumes, sell_dmat_volumes = perform_de_minimis_tagging(buy_ranked_set, sell_ranked_set)
+    buy_arbitrage_volumes, sell_arbitrage_volumes = perform_arbitrage_tagging(
+        buy_ranked_set.original_prices, buy_dmat_volumes, sell_ranked_set.original_prices, sell_dmat_volumes)
+    buy_second_stage_flags, sell_second_stage_flags = perform_classification(
+        buy_ranked_set, buy_arbitrage_volumes, sell_ranked_set, sell_arbitrage_volumes)
+    buy_niv_volumes, sell_niv_volumes = perform_niv_tagging(buy_arbitrage_volumes, sell_arbitrage_volumes)
+    if niv_without_npts > 0:
+        ranked_set, niv_adjusted_volumes, second_stage_flags = buy_ranked_set, buy_niv_volumes, buy_second_stage_flags
+    else:
+        ranked_set, niv_adjusted_volumes, second_stage_flags = sell_ranked_set, sell_niv_volumes, sell_second_stage_flags
+    if len(ranked_set) == 0:
+        return market_index_price
+    niv_adjusted_positions = np.flatnonzero(niv_adjusted_volumes != 0)
+    if niv_adjusted_volumes[niv_adjusted_positions].sum() == 0:
+        return market_index_price
+    niv_adjusted_positions, final_prices = replace_prices_for_second_stage_flagged_actions(
+        niv_adjusted_positions, ranked_set.original_prices, niv_adjusted_volumes, second_stage_flags, market_index_price, niv_without_npts)
+    par_adjusted_volumes = perform_par_tagging(niv_adjusted_volumes[niv_adjusted_positions], niv_without_npts)
+    tlms = get_tlms(settlement_stack.bm_unit_ids, ranked_set.id_codes[niv_adjusted_positions], tlm_by_bmu)
+    imbalance_price = perform_final_imbalance_price_calculation(par_adjusted_volumes, final_prices, tlms, price_adjustment)
+
+    return imbalance_price
+
+def get_ranked_order(
+    prices: np.ndarray,
+    ascending: bool
+) -> np.ndarray:
+    # Mirrors the order sort_values gives on a single column, including how ties and NaNs are placed
+    is_missing = np.isnan(prices)
+    positions = np.arange(len(prices))
+    priced_positions = positions[~is_missing]
+    known_prices = prices[~is_missing]
+    if not ascending:
+        priced_positions = priced_positions[::-1]
+        known_prices = known_prices[::-1]
+    order = priced_positions[known_prices.argsort(kind='quicksort')]
+    if not ascending:
+        order = order[::-1]
+
+    return np.concatenate([order, positions[is_missing]])
+
+def get_ranked_sets(
+    settlement_stack: SettlementStack
+) -> tuple[RankedSet, RankedSet]:
+    buy_positions = np.flatnonzero(settlement_stack.volumes >= 0) #System buying to increase generation
+    buy_positions = buy_positions[get_ranked_order(settlement_stack.original_prices[buy_positions], ascending=True)]
+    sell_positions = np.flatnonzero(settlement_stack.volumes < 0)
+    sell_positions = sell_positions[get_ranked_order(settlement_stack.original_prices[sell_positions], ascending=False)]
+    buy_ranked_set, sell_ranked_set = [
+        RankedSet(
+            settlement_stack.id_codes[positions],
+            settlement_stack.bid_offer_pair_ids[positions],
+            settlement_stack.so_flags[positions],
+            settlement_stack.cadl_flags[positions],
+            settlement_stack.original_prices[positions],
+            settlement_stack.volumes[positions]
+        )
+        for positions in (buy_positions, sell_positions)
+    ]
+
+    return buy_ranked_set, sell_ranked_set
+
+def perform_de_minimis_tagging(
+    buy_ranked_set: RankedSet,
+    sell_ranked_set: RankedSet
+) -> tuple[np.ndarray, np.ndarray]:
+    total_buy_volumes = get_total_volume_by_bmu_and_pair(buy_ranked_set)
+    total_sell_volumes = get_total_volume_by_bmu_and_pair(sell_ranked_set)
+    buy_dmat_volumes = np.where((buy_ranked_set.volumes < 0.1) & (total_buy_volumes < 0.1), 0.0, buy_ranked_set.volumes)
+    sell_dmat_volumes = np.where((sell_ranked_set.volumes > -0.1) & (total_sell_volumes > -0.1), 0.0, sell_ranked_set.volumes)
+
+    return buy_dmat_volumes, sell_dmat_volumes
+
+def get_total_volume_by_bmu_and_pair(
+    ranked_set: RankedSet
+) -> np.ndarray:
+    # Total accepted volume of each action's (BMU, pair) in the set, actions without a BMU count only themselves
+    if len(ranked_set) == 0:
+        return np.zeros(0)
+    pair_ids = np.nan_to_num(ranked_set.bid_offer_pair_ids, nan=0)
+    _, pair_codes = np.unique(pair_ids, return_inverse=True)
+    keys = ranked_set.id_codes.astype(np.int64) * (pair_codes.max() + 1) + pair_codes
+    _, group_codes = np.unique(keys, return_inverse=True)
+    total_volumes = np.bincount(group_codes, weights=ranked_set.volumes)[group_codes]
+
+    return np.where(ranked_set.id_codes >= 0, total_volumes, ranked_set.volumes)
+
+def perform_arbitrage_tagging(
+    buy_prices: np.ndarray,
+    buy_dmat_volumes: np.ndarray,
+    sell_prices: np.ndarray,
+    sell_dmat_volumes: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    # Buys are consumed cheapest first, so every buy before first_buy_index already has no volume left
+    buy_prices = buy_prices.tolist()
+    buy_volumes = buy_dmat_volumes.tolist()
+    sell_volumes = sell_dmat_volumes.tolist()
+    first_buy_index = 0
+    for sell_index, sell_price in enumerate(sell_prices.tolist()):
+        sell_volume = sell_volumes[sell_index]
+        if sell_volume == 0:
+            continue
+        while first_buy_index < len(buy_volumes) and buy_volumes[first_buy_index] == 0:
+            first_buy_index += 1
+        buy_index = first_buy_index
+        while buy_index < len(buy_volumes) and buy_prices[buy_index] <= sell_price:
+            if sell_volume == 0:
+                break
+            sell_value = -sell_price * sell_volume
+            buy_volume = buy_volumes[buy_index]
+            if buy_volume != 0:
+                buy_value = buy_prices[buy_index] * buy_volume
+                volume_to_remove = min(-sell_volume, buy_volume)
+                buy_volumes[buy_index] -= volume_to_remove
+                sell_volumes[sell_index] += volume_to_remove
+                if buy_value >= sell_value:
+                    break
+                sell_volume += volume_to_remove
+            buy_index += 1
+
+    return np.array(buy_volumes, dtype=np.float64), np.array(sell_volumes, dtype=np.float64)
+
+def perform_classification(
+    buy_ranked_set: RankedSet,
+    buy_arbitrage_volumes: np.ndarray,
+    sell_ranked_set: RankedSet,
+    sell_arbitrage_volumes: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    buy_second_stage_flags = get_second_stage_flags(buy_ranked_set, buy_arbitrage_volumes, np.greater)
+    sell_second_stage_flags = get_second_stage_flags(sell_ranked_set, sell_arbitrage_volumes, np.less)
+
+    return buy_second_stage_flags, sell_second_stage_flags
+
+def get_second_stage_flags(
+    ranked_set: RankedSet,
+    arbitrage_adjusted_volumes: np.ndarray,
+    beyond_marginal_price
+) -> np.ndarray:
+    # 1 for flagged, 0 for unflagged and UNSET_FLAG for null priced actions, which shall not become unflagged (8.4)
+    first_stage_unflagged = ~ranked_set.so_flags & ~ranked_set.cadl_flags & (arbitrage_adjusted_volumes != 0)
+    if not first_stage_unflagged.any():
+        return np.ones(len(ranked_set), dtype=np.int8)
+    most_expensive_unflagged_price = ranked_set.original_prices[np.flatnonzero(first_stage_unflagged)[-1]]
+    second_stage_flags = beyond_marginal_price(ranked_set.original_prices, most_expensive_unflagged_price).astype(np.int8)
+    second_stage_flags[np.isnan(ranked_set.original_prices)] = UNSET_FLAG
+
+    return second_stage_flags
+
+def perform_niv_tagging(
+    buy_arbitrage_volumes: np.ndarray,
+    sell_arbitrage_volumes: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    buy_volumes = buy_arbitrage_volumes.tolist()
+    sell_volumes = sell_arbitrage_volumes.tolist()
+    net_imbalance = buy_arbitrage_volumes.sum() + sell_arbitrage_volumes.sum()
+    if net_imbalance > 0:
+        net_off_from_most_expensive(buy_volumes, sell_volumes, operator.le)
+    else:
+        net_off_from_most_expensive(sell_volumes, buy_volumes, operator.ge)
+
+    return np.array(buy_volumes, dtype=np.float64), np.array(sell_volumes, dtype=np.float64)
+
+def net_off_from_most_expensive(
+    long_volumes: list[float],
+    short_volumes: list[float],
+    short_side_remains
+) -> None:
+    # Long actions, most expensive first, absorb short actions in rank order; short actions before short_index are used up
+    short_index = 0
+    for long_index in range(len(long_volumes) - 1, -1, -1):
+        while short_index < len(short_volumes):
+            short_volume = short_volumes[short_index]
+            if short_volume == 0:
+                short_index += 1
+                continue
+            long_volume = long_volumes[long_index]
+            if short_side_remains(short_volume + long_volume, 0):
+                short_volumes[short_index] += long_volume
+                long_volumes[long_index] = 0
+                break
+            long_volumes[long_index] += short_volume
+            short_volumes[short_index] = 0
+            short_index += 1
+
+def replace_prices_for_second_stage_flagged_actions(
+    niv_adjusted_positions: np.ndarray,
+    original_prices: np.ndarray,
+    niv_adjusted_volumes: np.ndarray,
+    second_stage_flags: np.ndarray,
+    market_index_price: float,
+    niv_without_npts: float
+) -> tuple[np.ndarray, np.ndarray]:
+    final_prices = original_prices[niv_adjusted_positions].copy()
+    flags = second_stage_flags[niv_adjusted_positions]
+    if (flags == 1).any():
+        second_stage_unflagged_positions = niv_adjusted_positions[flags == 0]
+        if len(second_stage_unflagged_positions) == 0:
+            replacement_price = market_index_price
+        else:
+            replacement_price = calculate_replacement_price(
+                original_prices[second_stage_unflagged_positions], niv_adjusted_volumes[second_stage_unflagged_positions])
+        final_prices[flags == 1] = replacement_price
+        order = get_ranked_order(final_prices, ascending=niv_without_npts > 0)
+        niv_adjusted_positions = niv_adjusted_positions[order]
+        final_prices = final_prices[order]
+
+    return niv_adjusted_positions, final_prices
+
+def get_volumes_up_to_limit(
+    volumes: np.ndarray,
+    volume_limit: float
+) -> tuple[np.ndarray, np.ndarray]:
+    # Volumes taken from the end of the ranked set until their running total would pass volume_limit,
+    # with a mask of the actions that were reached
+    reversed_volumes = volumes[::-1]
+    running_totals = np.cumsum(reversed_volumes)
+    beyond_limit = running_totals > volume_limit if volume_limit > 0 else running_totals < volume_limit
+    taken_volumes = reversed_volumes.copy()
+    reached = np.ones(len(volumes), dtype=bool)
+    if beyond_limit.any():
+        limit_index = int(np.argmax(beyond_limit))
+        previous_total = running_totals[limit_index - 1] if limit_index > 0 else 0
+        taken_volumes[limit_index] = volume_limit - previous_total
+        taken_volumes[limit_index + 1:] = 0
+        reached[limit_index + 1:] = False
+
+    return taken_volumes[::-1], reached[::-1]
+
+def calculate_replacement_price(
+    original_prices: np.ndarray,
+    niv_adjusted_volumes: np.ndarray
+) -> float:
+    volumes_for_replacement_price, reached = get_volumes_up_to_limit(np.abs(niv_adjusted_volumes), 1)
+    volumes_for_replacement_price = volumes_for_replacement_price[reached]
+    replacement_price = (volumes_for_replacement_price * original_prices[reached]).sum() / volumes_for_replacement_price.sum()
+
+    return replacement_price
+
+def perform_par_tagging(
+    niv_adjusted_volumes: np.ndarray,
+    niv_without_npts: float
+) -> np.ndarray:
+    par_adjusted_volumes, _ = get_volumes_up_to_limit(niv_adjusted_volumes, 1 if niv_without_npts > 0 else -1)
+
+    return par_adjusted_volumes
+
+def get_tlms(
+    bm_unit_ids: np.ndarray,
+    id_codes: np.ndarray,
+    tlm_by_bmu: dict
+) -> np.ndarray:
+    tlm_by_id_code = np.array([tlm_by_bmu[bmu_id] if bmu_id in tlm_by_bmu else 1 for bmu_id in bm_unit_ids] + [1], dtype=np.float64)
+
+    return tlm_by_id_code[id_codes]
+
+def perform_final_imbalance_price_calculation(
+    par_adjusted_volumes: np.ndarray,
+    final_prices: np.ndarray,
+    tlms: np.ndarray,
+    price_adjustment: float
+) -> float:
+    par_tagged = par_adjusted_volumes != 0
+    tlm_adjusted_volumes = par_adjusted_volumes[par_tagged] * tlms[par_tagged]
+    tlm_adjusted_costs = tlm_adjusted_volumes * final_prices[par_tagged]
+    imbalance_price = np.nansum(tlm_adjusted_costs) / np.nansum(tlm_adjusted_volumes) + price_adjustment
+
+    return imbalance_price
@@ -1,42 +1,155 @@
 import math
 
+import numpy as np
 import pandas as pd
 
+import gb_analysis.batched_system_price as batched_system_price
+import gb_analysis.system_price_from_arrays as system_price_from_arrays
+from data_processing.period_indexed_data import PeriodLookup, as_period_lookup
+from data_processing.settlement_stack import SettlementStack, SettlementStackTable, as_settlement_stack
+
+PRICE_ENGINES = ['pandas', 'arrays', 'batched', 'checked']
+
 def get_new_system_prices_by_date_and_period(
-    new_settlement_stacks_by_date_and_period: dict[tuple[str, int], pd.DataFrame],
-    ancillary_price_data: pd.DataFrame, 
+    new_settlement_stacks_by_date_and_period: dict[tuple[str, int], SettlementStack],
+    ancillary_price_data: pd.DataFrame | PeriodLookup, 
     tlm_by_bmu: dict[str, float], 
-    system_imbalance_with_and_without_npts_by_date_and_period: pd.DataFrame
+    system_imbalance_with_and_without_npts_by_date_and_period: pd.DataFrame | PeriodLookup,
+    price_engine: str = 'pandas'
 ) -> pd.DataFrame:
+    """
+    price_engine picks the Annex T implementation: 'pandas' for get_new_system_price, 'arrays' for
+    system_price_from_arrays, 'batched' to price every period in one pass with batched_system_price,
+    or 'checked' to run pandas, arrays and batched and raise if arrays or batched disagree with pandas in any period.
+    Periods the pandas engine cannot price are not verified: they keep the arrays price, are checked only for
+    arrays and batched agreeing, and are listed at the end of the run.
+    """
+    if price_engine not in PRICE_ENGINES:
+        raise ValueError(f"Unknown price engine '{price_engine}', should be one of {PRICE_ENGINES}")
+    ancillary_price_lookup = as_period_lookup(ancillary_price_data)
+    system_imbalance_lookup = as_period_lookup(system_imbalance_with_and_without_npts_by_date_and_period)
+    if price_engine == 'batched':
+        return get_batched_system_prices_by_date_and_period(
+            new_settlement_stacks_by_date_and_period, ancillary_price_lookup, tlm_by_bmu, system_imbalance_lookup)
+    if price_engine == 'checked':
+        batched_system_prices = get_batched_system_prices_by_date_and_period(
+            new_settlement_stacks_by_date_and_period, ancillary_price_lookup, tlm_by_bmu, system_imbalance_lookup)['recalculated_system_price'].to_numpy()
     system_prices = []
-    ancillary_price_data_copy = ancillary_price_data.copy()
-    ancillary_price_data_copy['settlement_date'] = pd.to_datetime(ancillary_price_data_copy['settlement_date']).dt.strftime('%Y-%m-%d')
-    system_imbalance_with_and_without_npts_copy = system_imbalance_with_and_without_npts_by_date_and_period.copy()
-    system_imbalance_with_and_without_npts_copy['settlement_date'] = pd.to_datetime(system_imbalance_with_and_without_npts_copy['settlement_date']).dt.strftime('%Y-%m-%d')
+    mismatched_periods = []
+    unverified_periods = []
     for (settlement_date, settlement_period), new_settlement_stack in new_settlement_stacks_by_date_and_period.items():
-        price_data = ancillary_price_data_copy[
-            (ancillary_price_data_copy['settlement_date'] == settlement_date) & 
-            (ancillary_price_data_copy['settlement_period'] == settlement_period)
-        ]
-        if price_data.empty:
+        if (settlement_date, settlement_period) not in ancillary_price_lookup:
             system_prices.append((settlement_date, settlement_period, None))
             continue
-        market_index_price = price_data['vwap_midp'].values[0]
-        niv_without_npts = system_imbalance_with_and_without_npts_copy[
-            (system_imbalance_with_and_without_npts_copy['settlement_date'] == settlement_date) & 
-            (system_imbalance_with_and_without_npts_copy['settlement_period'] == settlement_period)
-        ]['counterfactual_niv'].values[0]
+        market_index_price = ancillary_price_lookup.get_value(settlement_date, settlement_period, 'vwap_midp')
+        niv_without_npts = system_imbalance_lookup.get_value(settlement_date, settlement_period, 'counterfactual_niv')
         price_adjustment_column_header = 'buy_price_price_adjustment' if niv_without_npts > 0 else 'sell_price_price_adjustment'
-        price_adjustment = price_data[price_adjustment_column_header].values[0]
-        new_system_price = get_new_system_price(new_settlement_stack, price_adjustment, market_index_price, tlm_by_bmu, niv_without_npts)
+        price_adjustment = ancillary_price_lookup.get_value(settlement_date, settlement_period, price_adjustment_column_header)
+        if price_engine == 'pandas':
+            new_system_price = get_new_system_price(new_settlement_stack, price_adjustment, market_index_price, tlm_by_bmu, niv_without_npts)
+        else:
+            new_system_price = system_price_from_arrays.get_new_system_price(
+                as_settlement_stack(new_settlement_stack), price_adjustment, market_index_price, tlm_by_bmu, niv_without_npts)
+        if price_engine == 'checked':
+            batched_system_price = batched_system_prices[len(system_prices)]
+            try:
+                reference_system_price = get_new_system_price(new_settlement_stack, price_adjustment, market_index_price, tlm_by_bmu, niv_without_npts)
+            except (KeyError, ValueError) as e:
+                # The pandas engine cannot price stacks with only buy or only sell actions, so there is no reference to check against
+                unverified_periods.append((settlement_date, settlement_period, repr(e)))
+                reference_system_price = None
+            if reference_system_price is None:
+                if not prices_agree(new_system_price, batched_system_price):
+                    mismatched_periods.append((settlement_date, settlement_period, None, new_system_price, batched_system_price))
+            elif not prices_agree(reference_system_price, new_system_price) or not prices_agree(reference_system_price, batched_system_price):
+                mismatched_periods.append((settlement_date, settlement_period, reference_system_price, new_system_price, batched_system_price))
         system_prices.append((settlement_date, settlement_period, new_system_price))
     
+    if unverified_periods:
+        print(f"Pandas price engine could not price {len(unverified_periods)} periods, whose arrays prices are unverified (date, period, error): {unverified_periods[:10]}")
+    if mismatched_periods:
+        raise ValueError(f"Price engines disagree in {len(mismatched_periods)} periods (date, period, pandas, arrays, batched): {mismatched_periods[:10]}")
     new_system_prices_df = pd.DataFrame(system_prices, columns=['settlement_date', 'settlement_period', 'recalculated_system_price'])
    
     return new_system_prices_df
 
+def get_batched_system_prices_by_date_and_period(
+    new_settlement_stacks_by_date_and_period: dict[tuple[str, int], SettlementStack],
+    ancillary_price_lookup: PeriodLookup, 
+    tlm_by_bmu: dict[str, float], 
+    system_imbalance_lookup: PeriodLookup
+) -> pd.DataFrame:
+    dates_and_periods = list(new_settlement_stacks_by_date_and_period.keys())
+    price_row_positions = ancillary_price_lookup.get_row_positions(dates_and_periods)
+    niv_without_npts = system_imbalance_lookup.get_float_column('counterfactual_niv', system_imbalance_lookup.get_row_positions(dates_and_periods))
+    price_adjustments = np.where(
+        niv_without_npts > 0,
+        ancillary_price_lookup.get_float_column('buy_price_price_adjustment', price_row_positions),
+        ancillary_price_lookup.get_float_column('sell_price_price_adjustment', price_row_positions)
+    )
+    market_index_prices = ancillary_price_lookup.get_float_column('vwap_midp', price_row_positions)
+    settlement_stack_table = SettlementStackTable.from_settlement_stacks(
+        [as_settlement_stack(stack) for stack in new_settlement_stacks_by_date_and_period.values()])
+    new_system_prices = batched_system_price.get_new_system_prices(
+        settlement_stack_table, price_adjustments, market_index_prices, tlm_by_bmu, niv_without_npts)
+    new_system_prices_df = pd.DataFrame(dates_and_periods, columns=['settlement_date', 'settlement_period'])
+    new_system_prices_df['recalculated_system_price'] = np.where(price_row_positions >= 0, new_system_prices, np.nan)
+    
+    return new_system_prices_df
+
+def get_system_price_matrix(
+    settlement_stacks_by_date_and_period: dict[tuple[str, int], list[SettlementStack]],
+    counterfactual_nivs_by_date_and_period: pd.DataFrame | PeriodLookup,
+    ancillary_price_data: pd.DataFrame | PeriodLookup, 
+    tlm_by_bmu: dict[str, float]
+) -> pd.DataFrame:
+    """
+    System prices for a NIV sweep: one row per period and one column per scenario of counterfactual_nivs_by_date_and_period,
+    with each period's stacks in the same scenario order. Every stack of every scenario is priced in one batched pass.
+    """
+    counterfactual_niv_lookup = as_period_lookup(counterfactual_nivs_by_date_and_period)
+    ancillary_price_lookup = as_period_lookup(ancillary_price_data)
+    scenarios = [column for column in counterfactual_niv_lookup.data.columns if column not in ('settlement_date', 'settlement_period')]
+    dates_and_periods = list(settlement_stacks_by_date_and_period.keys())
+    for date_and_period, settlement_stacks in settlement_stacks_by_date_and_period.items():
+        if len(settlement_stacks) != len(scenarios):
+            raise ValueError(f"{date_and_period} has {len(settlement_stacks)} stacks for {len(scenarios)} scenarios")
+    
+    niv_row_positions = counterfactual_niv_lookup.get_row_positions(dates_and_periods)
+    counterfactual_nivs = np.array(
+        [counterfactual_niv_lookup.get_float_column(scenario, niv_row_positions) for scenario in scenarios], dtype=np.float64
+    ).reshape(len(scenarios), len(dates_and_periods)).T
+    price_row_positions = ancillary_price_lookup.get_row_positions(dates_and_periods)
+    # The price adjustment follows the sign of each scenario's NIV, as the stack it prices does
+    price_adjustments = np.where(
+        counterfactual_nivs > 0,
+        ancillary_price_lookup.get_float_column('buy_price_price_adjustment', price_row_positions)[:, np.newaxis],
+        ancillary_price_lookup.get_float_column('sell_price_price_adjustment', price_row_positions)[:, np.newaxis]
+    )
+    market_index_prices = np.repeat(ancillary_price_lookup.get_float_column('vwap_midp', price_row_positions), len(scenarios))
+    settlement_stack_table = SettlementStackTable.from_settlement_stacks([
+        as_settlement_stack(settlement_stack) for settlement_stacks in settlement_stacks_by_date_and_period.values() for settlement_stack in settlement_stacks
+    ])
+    new_system_prices = batched_system_price.get_new_system_prices(
+        settlement_stack_table, price_adjustments.ravel(), market_index_prices, tlm_by_bmu, counterfactual_nivs.ravel())
+    new_system_prices = new_system_prices.reshape(len(dates_and_periods), len(scenarios))
+    new_system_prices[price_row_positions < 0] = np.nan
+    new_system_prices[np.isnan(counterfactual_nivs)] = np.nan
+    system_price_matrix_df = pd.DataFrame(dates_and_periods, columns=['settlement_date', 'settlement_period'])
+    system_price_matrix_df = pd.concat([system_price_matrix_df, pd.DataFrame(new_system_prices, columns=scenarios)], axis=1)
+    
+    return system_price_matrix_df
+
+def prices_agree(
+    reference_price: float,
+    price: float
+) -> bool:
+    if pd.isna(reference_price) or pd.isna(price):
+        return pd.isna(reference_price) and pd.isna(price)
+    return math.isclose(reference_price, price, rel_tol=1e-9, abs_tol=1e-9)
+
 def get_new_system_price(
-    settlement_stack: pd.DataFrame, 
+    settlement_stack: pd.DataFrame | SettlementStack, 
     price_adjustment: float, 
     market_index_price: float, 
     tlm_by_bmu: dict, 
@@ -44,6 +157,8 @@ def get_new_system_price(
 ) -> float:
     if settlement_stack.empty:
         return market_index_price
+    if isinstance(settlement_stack, SettlementStack):
+        settlement_stack = settlement_stack.to_dataframe()
     buy_ranked_set, sell_ranked_set = get_ranked_sets(settlement_stack)
     dmat_adjusted_buy_set, dmat_adjusted_sell_set = perform_de_minimis_tagging(buy_ranked_set, sell_ranked_set)
     arbitrage_adjusted_buy_set, arbitrage_adjusted_sell_set = perform_arbitrage_tagging(dmat_adjusted_buy_set, dmat_adjusted_sell_set)
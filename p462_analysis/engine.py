@@ -10,6 +10,7 @@ import gb_analysis.recalculate_balancing_cashflows as recalculate_balancing_cash
 import p462_analysis.settlement_stack_handler as settlement_stack_handler
 
 from elexonpy.api_client import ApiClient
+from data_processing.missing_data import MissingData
 from data_processing.price_data_processing import get_ancillary_price_data_for_sp_calculation
 from p462_analysis.system_price_from_stack import get_new_system_prices_by_date_and_period 
 
@@ -18,9 +19,10 @@ async def run(
     months: list[int],
     output_directory: str,
     tlms_filepath: str,
+    transport: str = 'elexonpy'
 ) -> None:
-    api_client = ApiClient()
-    missing_data_points = set()
+    api_client = elexon_interaction.create_api_client(transport)
+    missing_data_points = MissingData()
     system_prices = []
     balancing_costs = []
     tlms_by_bmu = excel_interaction.create_dict_from_excel(tlms_filepath, 'BM Unit ID', 'TLM')
@@ -39,6 +41,7 @@ async def run(
                 balancing_costs,
                 output_directory
             )
+    await elexon_interaction.close_api_client(api_client)
                 
     system_prices_df = pd.concat(system_prices)
     balancing_costs_df = pd.concat(balancing_costs)
@@ -56,7 +59,7 @@ async def run_by_month(
     year: int,
     month: int,
     api_client: ApiClient,
-    missing_data_points: set[tuple[str, int]],
+    missing_data_points: MissingData,
     wind_bmu_ids: set[str],
     tlms_by_bmu: dict[str, float],
     system_prices: list[pd.DataFrame],
@@ -1,32 +1,54 @@
+import numpy as np
 import pandas as pd
+from data_processing.period_indexed_data import PeriodLookup, as_period_lookup
+from data_processing.settlement_stack import SettlementStackTable
+from gb_analysis.batched_system_price import get_new_system_prices
 from gb_analysis.system_price_from_stack import get_new_system_price
 
+P462_PRICE_ENGINES = ['pandas', 'batched']
+
 def get_new_system_prices_by_date_and_period(
     new_settlement_stacks_by_date_and_period: dict[tuple[str, int], pd.DataFrame],
-    ancillary_price_data: pd.DataFrame,
-    tlm_by_bmu: dict[str, float]
+    ancillary_price_data: pd.DataFrame | PeriodLookup,
+    tlm_by_bmu: dict[str, float],
+    price_engine: str = 'pandas'
 ) -> pd.DataFrame:
+    if price_engine not in P462_PRICE_ENGINES:
+        raise ValueError(f"Unknown price engine '{price_engine}', should be one of {P462_PRICE_ENGINES}")
     system_prices = []
-    ancillary_price_data_copy = ancillary_price_data.copy()
-    ancillary_price_data_copy['settlement_date'] = pd.to_datetime(ancillary_price_data_copy['settlement_date']).dt.strftime('%Y-%m-%d')
+    batched_inputs = []
+    ancillary_price_lookup = as_period_lookup(ancillary_price_data)
     for (settlement_date, settlement_period), new_settlement_stack in new_settlement_stacks_by_date_and_period.items():
-        price_data = ancillary_price_data_copy[
-            (ancillary_price_data_copy['settlement_date'] == settlement_date) & 
-            (ancillary_price_data_copy['settlement_period'] == settlement_period)
-        ]
-        if price_data.empty:
+        if (settlement_date, settlement_period) not in ancillary_price_lookup:
             system_prices.append((settlement_date, settlement_period, None))
             continue
-        market_index_price = price_data['vwap_midp'].values[0]
+        market_index_price = ancillary_price_lookup.get_value(settlement_date, settlement_period, 'vwap_midp')
         if new_settlement_stack.empty:
             system_prices.append((settlement_date, settlement_period, None))
             continue
         niv = new_settlement_stack['volume'].sum()
         price_adjustment_column_header = 'buy_price_price_adjustment' if niv > 0 else 'new_sell_price_price_adjustment'
-        price_adjustment = price_data[price_adjustment_column_header].values[0]
+        price_adjustment = ancillary_price_lookup.get_value(settlement_date, settlement_period, price_adjustment_column_header)
+        if price_engine == 'batched':
+            batched_inputs.append((len(system_prices), new_settlement_stack, price_adjustment, market_index_price, niv))
+            system_prices.append((settlement_date, settlement_period, None))
+            continue
         new_system_price = get_new_system_price(new_settlement_stack, price_adjustment, market_index_price, tlm_by_bmu, niv)
         system_prices.append((settlement_date, settlement_period, new_system_price))
     
+    if batched_inputs:
+        row_indices, settlement_stacks, price_adjustments, market_index_prices, nivs = zip(*batched_inputs)
+        new_system_prices = get_new_system_prices(
+            SettlementStackTable.from_dataframes(list(settlement_stacks)),
+            np.array(price_adjustments, dtype=float),
+            np.array(market_index_prices, dtype=float),
+            tlm_by_bmu,
+            np.array(nivs, dtype=float)
+        )
+        for row_index, new_system_price in zip(row_indices, new_system_prices):
+            settlement_date, settlement_period, _ = system_prices[row_index]
+            system_prices[row_index] = (settlement_date, settlement_period, new_system_price)
+    
     new_system_prices_df = pd.DataFrame(system_prices, columns=['settlement_date', 'settlement_period', 'recalculated_system_price'])
    
     return new_system_prices_df
\ No newline at end of file
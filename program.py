@@ -27,4 +27,6 @@ async def main():
         zero_metered_volume_only
     )
     
-asyncio.run(main())
\ No newline at end of file
+# Guarded so process pool workers can import this module without starting another run
+if __name__ == '__main__':
+    asyncio.run(main())
\ No newline at end of file
@@ -1,6 +1,7 @@
 import asyncio
 from datetime import timedelta
 
+import numpy as np
 import pandas as pd
 
 from ancillary_files.datetime_functions import get_settlement_dates_and_settlement_periods_per_day
@@ -10,12 +11,16 @@ from data_collection.elexon_interaction import (
 	get_full_settlement_stacks_by_date_and_period,
 	get_niv_data,
 )
+from data_processing.missing_data import MissingData
 from data_processing.price_data_processing import get_ancillary_price_data_for_sp_calculation
+from data_processing.settlement_stack import SettlementStackTable
 from elexonpy.api_client import ApiClient
+from gb_analysis.batched_system_price import get_new_system_prices
 from gb_analysis.system_price_from_stack import get_new_system_price
 
 
 BASE_FILEPATH = '/Users/josephcary/Library/CloudStorage/OneDrive-Nexus365/Second Year/RNP/Analysis'
+CADL_PRICE_ENGINES = ['pandas', 'batched']
 
 
 def _get_month_ranges(start_date: str, end_date: str) -> list[tuple[str, str]]:
@@ -74,7 +79,7 @@ async def get_market_wide_boas_and_imbalance_settlement_stacks_by_period(
 		if not settlement_dates_with_periods_per_day:
 			continue
 
-		missing_data_points = set()
+		missing_data_points = MissingData()
 		bid_offer_acceptances_task = get_market_wide_bid_offer_acceptances_by_period(
 			settlement_dates_with_periods_per_day,
 			client
@@ -231,8 +236,11 @@ async def export_cadl_recalculated_system_sell_prices(
 	end_date: str,
 	cadl_parameter: pd.Timedelta | timedelta | int | float | str,
 	output_filename: str | None = None,
-	api_client: ApiClient | None = None
+	api_client: ApiClient | None = None,
+	price_engine: str = 'pandas'
 ) -> str:
+	if price_engine not in CADL_PRICE_ENGINES:
+		raise ValueError(f"Unknown price engine '{price_engine}', should be one of {CADL_PRICE_ENGINES}")
 	month_ranges = _get_month_ranges(start_date, end_date)
 	if not month_ranges:
 		raise ValueError('No settlement dates found in the provided date range.')
@@ -247,7 +255,7 @@ async def export_cadl_recalculated_system_sell_prices(
 		if not settlement_dates_with_periods_per_day:
 			continue
 
-		missing_data_points = set()
+		missing_data_points = MissingData()
 		ancillary_price_data_task = get_ancillary_price_data_for_sp_calculation(
 			client,
 			settlement_dates_with_periods_per_day,
@@ -276,6 +284,7 @@ async def export_cadl_recalculated_system_sell_prices(
 		price_lookup = ancillary_price_data.set_index(['settlement_date', 'settlement_period'])
 		niv_lookup = niv_data.set_index(['settlement_date', 'settlement_period'])
 
+		batched_inputs = []
 		for (settlement_date, settlement_period), settlement_stack in cadl_adjusted_stacks_by_period.items():
 			system_sell_price = None
 			net_imbalance_volume = None
@@ -299,13 +308,16 @@ async def export_cadl_recalculated_system_sell_prices(
 						else 'sell_price_price_adjustment'
 					)
 					price_adjustment = price_row.get(price_adjustment_column, 0)
-					recalculated_system_sell_price = get_new_system_price(
-						settlement_stack,
-						price_adjustment,
-						market_index_price,
-						{},
-						net_imbalance_volume
-					)
+					if price_engine == 'batched':
+						batched_inputs.append((len(recalculated_rows), settlement_stack, price_adjustment, market_index_price, net_imbalance_volume))
+					else:
+						recalculated_system_sell_price = get_new_system_price(
+							settlement_stack,
+							price_adjustment,
+							market_index_price,
+							{},
+							net_imbalance_volume
+						)
 
 			recalculated_rows.append(
 				{
@@ -316,6 +328,18 @@ async def export_cadl_recalculated_system_sell_prices(
 				}
 			)
 
+		if batched_inputs:
+			row_indices, settlement_stacks, price_adjustments, market_index_prices, net_imbalance_volumes = zip(*batched_inputs)
+			recalculated_system_sell_prices = get_new_system_prices(
+				SettlementStackTable.from_dataframes(list(settlement_stacks)),
+				np.array(price_adjustments, dtype=float),
+				np.array(market_index_prices, dtype=float),
+				{},
+				np.array(net_imbalance_volumes, dtype=float)
+			)
+			for row_index, recalculated_system_sell_price in zip(row_indices, recalculated_system_sell_prices):
+				recalculated_rows[row_index]['recalculated_system_sell_price'] = recalculated_system_sell_price
+
 		print(f'Completed CADL system price recalculation for {month_start_date[:7]}')
 
 	results_df = pd.DataFrame(recalculated_rows)
@@ -5,6 +5,7 @@ from pathlib import Path
 from ancillary_files.datetime_functions import get_settlement_dates_and_settlement_periods_per_day
 from ancillary_files.excel_interaction import create_filepath
 from data_collection.elexon_interaction import get_full_settlement_stacks_by_date_and_period
+from data_processing.missing_data import MissingData
 from elexonpy.api_client import ApiClient
 
 BASE_FILEPATH = '/Users/josephcary/Library/CloudStorage/OneDrive-Nexus365/Second Year/RNP/Analysis'
@@ -111,7 +112,7 @@ async def calculate_constraint_proxy_by_period(
 			if not settlement_dates_and_periods_per_day:
 				continue
 
-			missing_data_points = set()
+			missing_data_points = MissingData()
 			settlement_stacks = await get_full_settlement_stacks_by_date_and_period(
 				client,
 				settlement_dates_and_periods_per_day,
@@ -4,6 +4,7 @@ import pandas as pd
 
 from ancillary_files.datetime_functions import get_settlement_dates_and_settlement_periods_per_day
 from ancillary_files.excel_interaction import create_filepath
+import data_collection.mr1b_store as mr1b_store
 from elexonpy.api_client import ApiClient
 from gb_analysis.recalculate_niv import (
 	get_bsc_id_to_npt_mapping,
@@ -79,101 +80,36 @@ def _get_credited_energy_column(columns: pd.Index) -> str:
 	)
 
 
-def _normalise_column_name(column_name: str) -> str:
-	return ''.join(character for character in column_name.lower() if character.isalnum())
-
-
-def _resolve_mr1b_columns(columns: pd.Index) -> dict[str, str]:
-	column_lookup = {
-		_normalise_column_name(column_name): column_name
-		for column_name in columns
-	}
-
-	def pick_column(candidates: list[str], label: str) -> str:
-		for candidate in candidates:
-			if candidate in column_lookup:
-				return column_lookup[candidate]
-		raise ValueError(
-			f"MR1B data is missing '{label}'. Available columns: {list(columns)}"
-		)
-
-	return {
-		'settlement_date': pick_column(['settlementdate'], 'Settlement Date'),
-		'settlement_period': pick_column(['settlementperiod'], 'Settlement Period'),
-		'party_id': pick_column(['partyid'], 'Party ID / PartyID'),
-		'energy_imbalance_vol': pick_column(['energyimbalancevol'], 'Energy Imbalance Vol / EnergyImbalanceVol'),
-		'credited_energy_vol': pick_column(['creditedenergyvol'], 'Credited Energy Vol / CreditedEnergyVol')
-	}
-
-
 def _load_mr1b_rows_for_date_range(
 	mr1b_filepath: str,
 	start_date: str,
 	end_date: str,
 	chunksize: int = 250_000
 ) -> pd.DataFrame:
-	start_ts = pd.Timestamp(start_date)
-	end_ts = pd.Timestamp(end_date)
-	filtered_chunks: list[pd.DataFrame] = []
-	mr1b_columns: dict[str, str] | None = None
-
-	for chunk in pd.read_csv(mr1b_filepath, chunksize=chunksize, low_memory=False):
-		if mr1b_columns is None:
-			mr1b_columns = _resolve_mr1b_columns(chunk.columns)
-
-		chunk = chunk[
-			[
-				mr1b_columns['settlement_date'],
-				mr1b_columns['settlement_period'],
-				mr1b_columns['party_id'],
-				mr1b_columns['energy_imbalance_vol'],
-				mr1b_columns['credited_energy_vol']
-			]
-		].copy().rename(
-			columns={
-				mr1b_columns['settlement_date']: 'Settlement Date',
-				mr1b_columns['settlement_period']: 'Settlement Period',
-				mr1b_columns['party_id']: 'Party ID',
-				mr1b_columns['energy_imbalance_vol']: 'Energy Imbalance Vol',
-				mr1b_columns['credited_energy_vol']: 'CreditedEnergyVol'
-			}
-		)
-		chunk['Party ID'] = chunk['Party ID'].astype(str).str.strip()
-		chunk = chunk[chunk['Party ID'] != '']
-		chunk['Settlement Date'] = pd.to_datetime(chunk['Settlement Date'], errors='coerce')
-		in_range_mask = chunk['Settlement Date'].between(start_ts, end_ts)
-		filtered_chunk = chunk.loc[in_range_mask].copy()
-		if not filtered_chunk.empty:
-			filtered_chunk['Settlement Date'] = filtered_chunk['Settlement Date'].dt.strftime('%Y-%m-%d')
-			filtered_chunks.append(filtered_chunk)
-
-	if not filtered_chunks:
-		if mr1b_columns is None:
-			raise ValueError('No MR1B data could be read from the provided filepath.')
-		return pd.DataFrame(
-			columns=[
-				'Settlement Date',
-				'Settlement Period',
-				'Party ID',
-				'Energy Imbalance Vol',
-				'CreditedEnergyVol'
-			]
-		)
-
-	combined = pd.concat(filtered_chunks, ignore_index=True)
-	combined['Settlement Period'] = pd.to_numeric(combined['Settlement Period'], errors='coerce')
-	combined['Energy Imbalance Vol'] = pd.to_numeric(combined['Energy Imbalance Vol'], errors='coerce')
-	combined['CreditedEnergyVol'] = pd.to_numeric(combined['CreditedEnergyVol'], errors='coerce')
-	combined = combined.dropna(subset=['Settlement Date', 'Settlement Period', 'Party ID'])
+	combined = mr1b_store.read_mr1b(
+		start_date,
+		end_date,
+		columns=[
+			'Settlement Date',
+			'Settlement Period',
+			'Party ID',
+			'Energy Imbalance Vol',
+			'Credited Energy Vol'
+		],
+		mr1b_csv_filepath=mr1b_filepath,
+		chunksize=chunksize
+	).rename(columns={'Credited Energy Vol': 'CreditedEnergyVol'})
+	combined = combined[combined['Party ID'] != '']
+	combined = combined.dropna(subset=['Party ID'])
+	combined['Settlement Date'] = combined['Settlement Date'].dt.strftime('%Y-%m-%d')
 
 	# Keep only the first row per settlement date/period/party combination.
 	combined = combined.drop_duplicates(
 		subset=['Settlement Date', 'Settlement Period', 'Party ID'],
 		keep='first'
 	)
-	combined['Settlement Period'] = combined['Settlement Period'].astype(int)
 
-	return combined
+	return combined.reset_index(drop=True)
 
 
 async def recalculate_and_append_niv_to_imbalance_volume_data(